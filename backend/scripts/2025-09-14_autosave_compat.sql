@@ -1,31 +1,47 @@
 -- Allow partial autosave payloads
 -- This migration relaxes NOT NULL constraints to enable partial data entry
+-- Legacy columns (financial_loan.name/amount, financial_goal.description/amount,
+-- order_index) only exist on databases created before init-db.sql, so each
+-- change is applied only where the column is present
 
--- Relax financial_loan constraints (singular table name)
-ALTER TABLE financial_loan
-  ALTER COLUMN name DROP NOT NULL,
-  ALTER COLUMN amount DROP NOT NULL,
-  ALTER COLUMN order_index DROP NOT NULL;
+DO $$
+DECLARE
+    col RECORD;
+BEGIN
+    -- Relax constraints on financial_loan, financial_expense and financial_goal (singular table names)
+    FOR col IN
+        SELECT c.table_name, c.column_name
+        FROM information_schema.columns c
+        JOIN (VALUES
+            ('financial_loan', 'name'),
+            ('financial_loan', 'amount'),
+            ('financial_loan', 'order_index'),
+            ('financial_expense', 'description'),
+            ('financial_expense', 'amount'),
+            ('financial_expense', 'order_index'),
+            ('financial_goal', 'description'),
+            ('financial_goal', 'amount'),
+            ('financial_goal', 'order_index')
+        ) AS relaxed(table_name, column_name)
+          ON relaxed.table_name = c.table_name AND relaxed.column_name = c.column_name
+        WHERE c.table_schema = current_schema()
+    LOOP
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN %I DROP NOT NULL', col.table_name, col.column_name);
+    END LOOP;
 
--- Relax financial_expense constraints (singular table name)
-ALTER TABLE financial_expense
-  ALTER COLUMN description DROP NOT NULL,
-  ALTER COLUMN amount DROP NOT NULL,
-  ALTER COLUMN order_index DROP NOT NULL;
-
--- Relax financial_goal constraints (singular table name)
-ALTER TABLE financial_goal
-  ALTER COLUMN description DROP NOT NULL,
-  ALTER COLUMN amount DROP NOT NULL,
-  ALTER COLUMN order_index DROP NOT NULL;
-
--- Add some reasonable defaults for better UX
-ALTER TABLE financial_loan
-  ALTER COLUMN order_index SET DEFAULT 0;
-
-ALTER TABLE financial_expense
-  ALTER COLUMN order_index SET DEFAULT 0,
-  ALTER COLUMN frequency SET DEFAULT 'Monthly';
-
-ALTER TABLE financial_goal
-  ALTER COLUMN order_index SET DEFAULT 0;
\ No newline at end of file
+    -- Add some reasonable defaults for better UX
+    FOR col IN
+        SELECT c.table_name, c.column_name, defaults.value
+        FROM information_schema.columns c
+        JOIN (VALUES
+            ('financial_loan', 'order_index', '0'),
+            ('financial_expense', 'order_index', '0'),
+            ('financial_expense', 'frequency', '''Monthly'''),
+            ('financial_goal', 'order_index', '0')
+        ) AS defaults(table_name, column_name, value)
+          ON defaults.table_name = c.table_name AND defaults.column_name = c.column_name
+        WHERE c.table_schema = current_schema()
+    LOOP
+        EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET DEFAULT %s', col.table_name, col.column_name, col.value);
+    END LOOP;
+END $$;
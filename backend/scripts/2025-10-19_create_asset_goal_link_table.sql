@@ -0,0 +1,50 @@
+-- Normalized asset <-> goal earmark links
+-- Replaces the duplicated JSON arrays assets.custom_data.goalEarmarks and
+-- financial_goal.custom_data.linkedAssets with one row per link, indexed both ways
+
+CREATE TABLE IF NOT EXISTS asset_goal_link (
+    asset_id INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    goal_id INTEGER NOT NULL REFERENCES financial_goal(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+    percent NUMERIC(7,3) NOT NULL DEFAULT 0 CHECK (percent >= 0),
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (asset_id, goal_id)
+);
+
+-- The primary key serves asset -> goals lookups; this one serves goal -> assets
+CREATE INDEX IF NOT EXISTS idx_asset_goal_link_goal_id ON asset_goal_link(goal_id, asset_id);
+CREATE INDEX IF NOT EXISTS idx_asset_goal_link_user_id ON asset_goal_link(user_id);
+
+-- Compatibility views that rebuild the JSON shapes the frontend expects
+CREATE OR REPLACE VIEW asset_goal_earmarks AS
+SELECT
+    l.asset_id,
+    l.user_id,
+    jsonb_agg(
+        jsonb_build_object(
+            'goalId', l.goal_id,
+            'goalName', COALESCE(g.name, 'Goal ' || g.id),
+            'percent', l.percent
+        ) ORDER BY l.goal_id
+    ) AS goal_earmarks
+FROM asset_goal_link l
+JOIN financial_goal g ON g.id = l.goal_id
+GROUP BY l.asset_id, l.user_id;
+
+CREATE OR REPLACE VIEW goal_linked_assets AS
+SELECT
+    l.goal_id,
+    l.user_id,
+    jsonb_agg(
+        jsonb_build_object(
+            'assetId', l.asset_id,
+            'assetName', a.name,
+            'percent', l.percent
+        ) ORDER BY l.asset_id
+    ) AS linked_assets
+FROM asset_goal_link l
+JOIN assets a ON a.id = l.asset_id
+GROUP BY l.goal_id, l.user_id;
+
+COMMENT ON TABLE asset_goal_link IS 'One row per asset earmarked to a goal; percent of the asset allocated';
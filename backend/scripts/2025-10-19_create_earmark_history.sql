@@ -0,0 +1,109 @@
+-- Append-only history of earmark edits, one delta row per change
+-- Autosave rewrites custom_data wholesale; these triggers keep only what changed
+-- in assets.custom_data.goalEarmarks / financial_goal.custom_data.linkedAssets:
+--   {"added": {"<id>": percent}, "removed": {"<id>": percent}, "changed": {"<id>": [old, new]}}
+-- keyed by the id on the other side. earmark_history.py replays the deltas on
+-- top of periodic per-row checkpoints to show the allocation at any time.
+
+CREATE TABLE IF NOT EXISTS earmark_history (
+    id BIGSERIAL PRIMARY KEY,
+    source_table VARCHAR(20) NOT NULL,
+    row_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    delta JSONB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_earmark_history_row ON earmark_history(source_table, row_id, id);
+CREATE INDEX IF NOT EXISTS idx_earmark_history_user ON earmark_history(user_id, changed_at);
+
+-- Full earmark state of one row, taken by `earmark_history.py checkpoint`
+CREATE TABLE IF NOT EXISTS earmark_history_checkpoint (
+    id BIGSERIAL PRIMARY KEY,
+    source_table VARCHAR(20) NOT NULL,
+    row_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    taken_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+    -- Deltas up to and including this id are already in state
+    last_history_id BIGINT NOT NULL,
+    state JSONB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_earmark_history_checkpoint_row
+    ON earmark_history_checkpoint(source_table, row_id, taken_at);
+CREATE INDEX IF NOT EXISTS idx_earmark_history_checkpoint_user
+    ON earmark_history_checkpoint(user_id, taken_at);
+
+-- {"<id>": percent} for doc->key; the first entry per id wins, like Array.find()
+CREATE OR REPLACE FUNCTION earmark_state(doc JSONB, key TEXT, field TEXT)
+RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_object_agg(ref_id, percent), '{}')
+    FROM (
+        SELECT DISTINCT ON (btrim(e->>field)::integer)
+               (btrim(e->>field)::integer)::text AS ref_id,
+               COALESCE(e->'percent', 'null') AS percent
+        FROM jsonb_array_elements(CASE WHEN jsonb_typeof(doc->key) = 'array' THEN doc->key ELSE '[]' END)
+             WITH ORDINALITY AS x(e, position)
+        WHERE jsonb_typeof(e) = 'object' AND e->>field ~ '^\s*\d{1,9}\s*$'
+        ORDER BY btrim(e->>field)::integer, position
+    ) refs
+$$ LANGUAGE sql IMMUTABLE;
+
+-- The logical table is a trigger argument: on a partitioned table
+-- (partition_user_tables.py) TG_TABLE_NAME is the partition, e.g. assets_p3
+CREATE OR REPLACE FUNCTION record_earmark_history()
+RETURNS TRIGGER AS $$
+DECLARE
+    source_table TEXT := TG_ARGV[0];
+    key TEXT := CASE WHEN TG_ARGV[0] = 'assets' THEN 'goalEarmarks' ELSE 'linkedAssets' END;
+    field TEXT := CASE WHEN TG_ARGV[0] = 'assets' THEN 'goalId' ELSE 'assetId' END;
+    old_state JSONB := '{}';
+    new_state JSONB := '{}';
+    added JSONB;
+    removed JSONB;
+    changed JSONB;
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.custom_data->key IS NOT DISTINCT FROM NEW.custom_data->key THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        old_state := earmark_state(OLD.custom_data, key, field);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        new_state := earmark_state(NEW.custom_data, key, field);
+    END IF;
+
+    SELECT COALESCE(jsonb_object_agg(n.key, n.value) FILTER (WHERE NOT old_state ? n.key), '{}'),
+           COALESCE(jsonb_object_agg(n.key, jsonb_build_array(old_state->n.key, n.value))
+                    FILTER (WHERE old_state ? n.key AND old_state->n.key <> n.value), '{}')
+    INTO added, changed
+    FROM jsonb_each(new_state) n;
+
+    SELECT COALESCE(jsonb_object_agg(o.key, o.value) FILTER (WHERE NOT new_state ? o.key), '{}')
+    INTO removed
+    FROM jsonb_each(old_state) o;
+
+    IF added = '{}' AND removed = '{}' AND changed = '{}' THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO earmark_history (source_table, row_id, user_id, delta)
+    VALUES (source_table,
+            CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END,
+            CASE WHEN TG_OP = 'DELETE' THEN OLD.user_id ELSE NEW.user_id END,
+            CASE WHEN added = '{}' THEN '{}' ELSE jsonb_build_object('added', added) END
+            || CASE WHEN removed = '{}' THEN '{}' ELSE jsonb_build_object('removed', removed) END
+            || CASE WHEN changed = '{}' THEN '{}' ELSE jsonb_build_object('changed', changed) END);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS record_earmark_history ON assets;
+CREATE TRIGGER record_earmark_history
+    AFTER INSERT OR DELETE OR UPDATE OF custom_data ON assets
+    FOR EACH ROW EXECUTE FUNCTION record_earmark_history('assets');
+
+DROP TRIGGER IF EXISTS record_earmark_history ON financial_goal;
+CREATE TRIGGER record_earmark_history
+    AFTER INSERT OR DELETE OR UPDATE OF custom_data ON financial_goal
+    FOR EACH ROW EXECUTE FUNCTION record_earmark_history('financial_goal');
@@ -0,0 +1,115 @@
+-- Reverse earmark index: which goals depend on an asset, without scanning JSON
+-- One row per (asset, goal) pair referenced from either side:
+--   via_asset - the asset's custom_data.goalEarmarks names the goal
+--   via_goal  - the goal's custom_data.linkedAssets names the asset
+-- Kept current by row-level triggers that diff the old and new arrays;
+-- earmark_reverse_index.py verifies and rebuilds it.
+
+CREATE TABLE IF NOT EXISTS earmark_reverse_index (
+    asset_id INTEGER NOT NULL,
+    goal_id INTEGER NOT NULL,
+    via_asset BOOLEAN NOT NULL DEFAULT FALSE,
+    via_goal BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (asset_id, goal_id)
+);
+
+-- The primary key answers asset -> goals; this one goal -> assets
+CREATE INDEX IF NOT EXISTS idx_earmark_reverse_index_goal_id ON earmark_reverse_index(goal_id, asset_id);
+
+-- Distinct numeric ids referenced by doc->key[*]->field; malformed entries are ignored
+CREATE OR REPLACE FUNCTION earmark_ref_ids(doc JSONB, key TEXT, field TEXT)
+RETURNS INTEGER[] AS $$
+    SELECT COALESCE(array_agg(DISTINCT btrim(e->>field)::integer ORDER BY btrim(e->>field)::integer), '{}')
+    FROM jsonb_array_elements(CASE WHEN jsonb_typeof(doc->key) = 'array' THEN doc->key ELSE '[]' END) AS e
+    WHERE jsonb_typeof(e) = 'object' AND e->>field ~ '^\s*\d{1,9}\s*$'
+$$ LANGUAGE sql IMMUTABLE;
+
+-- What the index should contain, straight from the JSON
+CREATE OR REPLACE VIEW earmark_reverse_expected AS
+SELECT asset_id, goal_id, bool_or(via_asset) AS via_asset, bool_or(via_goal) AS via_goal
+FROM (
+    SELECT a.id AS asset_id, r.goal_id, TRUE AS via_asset, FALSE AS via_goal
+    FROM assets a, unnest(earmark_ref_ids(a.custom_data, 'goalEarmarks', 'goalId')) AS r(goal_id)
+    UNION ALL
+    SELECT r.asset_id, g.id, FALSE, TRUE
+    FROM financial_goal g, unnest(earmark_ref_ids(g.custom_data, 'linkedAssets', 'assetId')) AS r(asset_id)
+) refs
+GROUP BY asset_id, goal_id;
+
+-- The side ('asset' or 'goal') is a trigger argument rather than TG_TABLE_NAME,
+-- which names the partition (assets_p3) once partition_user_tables.py has run
+CREATE OR REPLACE FUNCTION maintain_earmark_reverse_index()
+RETURNS TRIGGER AS $$
+DECLARE
+    from_asset BOOLEAN := TG_ARGV[0] = 'asset';
+    key TEXT := CASE WHEN TG_ARGV[0] = 'asset' THEN 'goalEarmarks' ELSE 'linkedAssets' END;
+    field TEXT := CASE WHEN TG_ARGV[0] = 'asset' THEN 'goalId' ELSE 'assetId' END;
+    old_ids INTEGER[] := '{}';
+    new_ids INTEGER[] := '{}';
+    removed INTEGER[];
+    added INTEGER[];
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        old_ids := earmark_ref_ids(OLD.custom_data, key, field);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        new_ids := earmark_ref_ids(NEW.custom_data, key, field);
+    END IF;
+
+    -- Autosave rewrites custom_data constantly; most writes leave the references alone
+    IF TG_OP = 'UPDATE' AND old_ids = new_ids AND OLD.id = NEW.id THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND OLD.id <> NEW.id THEN
+        removed := old_ids;
+        added := new_ids;
+    ELSE
+        removed := ARRAY(SELECT unnest(old_ids) EXCEPT SELECT unnest(new_ids));
+        added := ARRAY(SELECT unnest(new_ids) EXCEPT SELECT unnest(old_ids));
+    END IF;
+
+    IF cardinality(removed) > 0 THEN
+        IF from_asset THEN
+            UPDATE earmark_reverse_index SET via_asset = FALSE
+            WHERE asset_id = OLD.id AND goal_id = ANY(removed);
+            DELETE FROM earmark_reverse_index
+            WHERE asset_id = OLD.id AND goal_id = ANY(removed) AND NOT via_goal;
+        ELSE
+            UPDATE earmark_reverse_index SET via_goal = FALSE
+            WHERE goal_id = OLD.id AND asset_id = ANY(removed);
+            DELETE FROM earmark_reverse_index
+            WHERE goal_id = OLD.id AND asset_id = ANY(removed) AND NOT via_asset;
+        END IF;
+    END IF;
+
+    IF cardinality(added) > 0 THEN
+        IF from_asset THEN
+            INSERT INTO earmark_reverse_index (asset_id, goal_id, via_asset)
+            SELECT NEW.id, unnest(added), TRUE
+            ON CONFLICT (asset_id, goal_id) DO UPDATE SET via_asset = TRUE;
+        ELSE
+            INSERT INTO earmark_reverse_index (asset_id, goal_id, via_goal)
+            SELECT unnest(added), NEW.id, TRUE
+            ON CONFLICT (asset_id, goal_id) DO UPDATE SET via_goal = TRUE;
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS maintain_earmark_reverse_index ON assets;
+CREATE TRIGGER maintain_earmark_reverse_index
+    AFTER INSERT OR DELETE OR UPDATE OF id, custom_data ON assets
+    FOR EACH ROW EXECUTE FUNCTION maintain_earmark_reverse_index('asset');
+
+DROP TRIGGER IF EXISTS maintain_earmark_reverse_index ON financial_goal;
+CREATE TRIGGER maintain_earmark_reverse_index
+    AFTER INSERT OR DELETE OR UPDATE OF id, custom_data ON financial_goal
+    FOR EACH ROW EXECUTE FUNCTION maintain_earmark_reverse_index('goal');
+
+-- Backfill on first install; earmark_reverse_index.py rebuild repairs drift later
+INSERT INTO earmark_reverse_index (asset_id, goal_id, via_asset, via_goal)
+SELECT asset_id, goal_id, via_asset, via_goal FROM earmark_reverse_expected
+ON CONFLICT (asset_id, goal_id) DO NOTHING;
@@ -0,0 +1,19 @@
+-- Suggested earmarks for unallocated asset value, written by optimize_earmarks.py
+-- One row per (asset, goal): extra percent of the asset to earmark for the goal.
+-- Each run replaces the rows of the users it processed.
+
+CREATE TABLE IF NOT EXISTS earmark_suggestions (
+    asset_id INTEGER NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    goal_id INTEGER NOT NULL REFERENCES financial_goal(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+    -- Percent already earmarked for this goal (0 for a new link)
+    current_percent NUMERIC(7,3) NOT NULL DEFAULT 0,
+    suggested_percent NUMERIC(7,3) NOT NULL CHECK (suggested_percent > 0),
+    -- Projected value the extra percent adds to the goal by its target year
+    projected_contribution NUMERIC NOT NULL DEFAULT 0,
+    goal_term VARCHAR(10),
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (asset_id, goal_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_earmark_suggestions_user_id ON earmark_suggestions(user_id);
@@ -0,0 +1,111 @@
+-- Set-based goal funding: every goal of a user id range in one query
+-- Same arithmetic as calculateGoalFunding / calculateSIPProjection in
+-- src/lib/goalCalculations.js, with each linked asset's own percent.
+
+-- parseFloat(x) || 0 for the numeric strings the frontend stores
+CREATE OR REPLACE FUNCTION lifemaps_parse_float(value TEXT)
+RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE WHEN value ~ '^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'
+                THEN btrim(value)::double precision ELSE 0 END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION lifemaps_sip_projection(
+    initial DOUBLE PRECISION,
+    sip_amount DOUBLE PRECISION,
+    sip_frequency TEXT,
+    annual_rate DOUBLE PRECISION,
+    years INTEGER,
+    sip_expiry_date TEXT,
+    current_year INTEGER
+)
+RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE
+        WHEN sip_amount <= 0 OR COALESCE(sip_frequency, '') = '' THEN
+            initial * power(1 + annual_rate, years)
+        ELSE
+            initial * power(1 + annual_rate / 12, years * 12)
+            + CASE WHEN monthly_sip > 0 AND sip_months > 0 THEN
+                  CASE WHEN annual_rate = 0 THEN monthly_sip * sip_months
+                       ELSE monthly_sip * ((power(1 + annual_rate / 12, sip_months) - 1) / (annual_rate / 12))
+                  END * power(1 + annual_rate / 12, years * 12 - sip_months)
+              ELSE 0 END
+    END
+    FROM (
+        SELECT
+            sip_amount * CASE sip_frequency
+                WHEN 'Weekly' THEN 4.33
+                WHEN 'Bi-weekly' THEN 2.17
+                WHEN 'Monthly' THEN 1
+                WHEN 'Bi-monthly' THEN 2
+                WHEN 'Quarterly' THEN 1.0 / 3
+                WHEN 'Semi-annual' THEN 1.0 / 6
+                WHEN 'Annual' THEN 1.0 / 12
+                ELSE 0
+            END AS monthly_sip,
+            -- An unparseable expiry date is NaN in JS, which switches the SIP off
+            CASE
+                WHEN COALESCE(sip_expiry_date, '') = '' THEN years * 12
+                WHEN sip_expiry_date ~ '^\s*\d{4}' THEN
+                    LEAST(years * 12, GREATEST(0, substring(sip_expiry_date FROM '\d{4}')::integer - current_year) * 12)
+                ELSE 0
+            END AS sip_months
+    ) sip
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION goal_funding_projection(
+    start_user INTEGER,
+    end_user INTEGER,
+    current_year INTEGER DEFAULT EXTRACT(YEAR FROM CURRENT_DATE)::integer
+)
+RETURNS TABLE (
+    goal_id INTEGER,
+    user_id INTEGER,
+    target_amount DOUBLE PRECISION,
+    target_year INTEGER,
+    years_to_target INTEGER,
+    funded_amount DOUBLE PRECISION,
+    percent_funded DOUBLE PRECISION,
+    funding_gap DOUBLE PRECISION,
+    linked_asset_ids INTEGER[]
+) AS $$
+    SELECT g.id, g.user_id, t.target_amount, t.target_year, t.years,
+           CASE WHEN t.target_amount = 0 THEN 0 ELSE COALESCE(f.funded, 0) END,
+           CASE WHEN t.target_amount = 0 THEN 0
+                ELSE round((COALESCE(f.funded, 0) / t.target_amount * 100)::numeric, 2)::double precision END,
+           CASE WHEN t.target_amount = 0 THEN 0 ELSE t.target_amount - COALESCE(f.funded, 0) END,
+           COALESCE(f.asset_ids, '{}')
+    FROM financial_goal g
+    -- amount and target_year only exist on some deployments, so read them
+    -- through to_jsonb; a column-qualified reference would fail at CREATE time
+    CROSS JOIN LATERAL (
+        SELECT (to_jsonb(g)->>'amount')::double precision AS amount,
+               (to_jsonb(g)->>'target_year')::integer AS target_year
+    ) legacy
+    CROSS JOIN LATERAL (
+        -- parseFloat(target_amount || amount) || 0: a zero target_amount falls through too
+        SELECT COALESCE(NULLIF(g.target_amount::double precision, 0), legacy.amount, 0) AS target_amount,
+               COALESCE(NULLIF(legacy.target_year, 0), goal_funding_projection.current_year + 10) AS target_year,
+               GREATEST(1, COALESCE(NULLIF(legacy.target_year, 0), goal_funding_projection.current_year + 10)
+                           - goal_funding_projection.current_year) AS years
+    ) t
+    LEFT JOIN LATERAL (
+        SELECT SUM(lifemaps_sip_projection(
+                   COALESCE(a.current_value, 0)::double precision * p.percent / 100,
+                   lifemaps_parse_float(a.custom_data->>'sipAmount') * p.percent / 100,
+                   COALESCE(NULLIF(a.custom_data->>'sipFrequency', ''), 'Monthly'),
+                   COALESCE(NULLIF(lifemaps_parse_float(a.custom_data->>'expectedReturn'), 0), 5) / 100,
+                   t.years,
+                   a.custom_data->>'sipExpiryDate',
+                   goal_funding_projection.current_year)) AS funded,
+               array_agg(DISTINCT a.id ORDER BY a.id) AS asset_ids
+        FROM jsonb_array_elements(CASE WHEN jsonb_typeof(g.custom_data->'linkedAssets') = 'array'
+                                       THEN g.custom_data->'linkedAssets' ELSE '[]' END) AS e(item)
+        CROSS JOIN LATERAL (
+            SELECT CASE WHEN e.item->>'assetId' ~ '^\s*\d{1,9}\s*$' THEN btrim(e.item->>'assetId')::integer END AS asset_id,
+                   lifemaps_parse_float(e.item->>'percent') AS percent
+        ) p
+        JOIN assets a ON a.id = p.asset_id AND a.user_id = g.user_id
+        WHERE jsonb_typeof(e.item) = 'object'
+    ) f ON TRUE
+    WHERE g.user_id >= start_user AND g.user_id < end_user
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,30 @@
+-- Persisted goal funding, the values calculateGoalFunding / calculateGoalsProgress
+-- compute on every chart render. Maintained by refresh_goal_funding.py.
+
+CREATE TABLE IF NOT EXISTS goal_funding (
+    goal_id INTEGER PRIMARY KEY REFERENCES financial_goal(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES "user"(id) ON DELETE CASCADE,
+    target_amount NUMERIC NOT NULL DEFAULT 0,
+    target_year INTEGER NOT NULL,
+    years_to_target INTEGER NOT NULL,
+    -- Projected value at target_year of every linked asset's earmarked share
+    funded_amount NUMERIC NOT NULL DEFAULT 0,
+    -- Unclamped; the charts cap it at 100 and floor the gap at 0 themselves
+    percent_funded NUMERIC NOT NULL DEFAULT 0,
+    funding_gap NUMERIC NOT NULL DEFAULT 0,
+    -- Assets that contributed, so an asset change finds its goals by index
+    linked_asset_ids INTEGER[] NOT NULL DEFAULT '{}',
+    -- Projections depend on the current year; rows from an older year are stale
+    computed_year INTEGER NOT NULL,
+    refreshed_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_goal_funding_user_id ON goal_funding(user_id);
+CREATE INDEX IF NOT EXISTS idx_goal_funding_linked_asset_ids ON goal_funding USING GIN (linked_asset_ids);
+
+-- Highest updated_at the refresher has processed, per source table
+CREATE TABLE IF NOT EXISTS goal_funding_watermark (
+    source_table VARCHAR(63) PRIMARY KEY,
+    watermark TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Table bloat and HOT-update monitor for the autosave-heavy tables
+
+Autosave rewrites assets and financial_goal rows all the time, usually only
+custom_data and updated_at. An update can stay HOT (no new index entries) only
+if no indexed column changes and the page has free space, so an index on
+either of those columns - or a full 100% fillfactor - makes every autosave
+bloat every index.
+
+report (default)
+    Per table: dead-tuple ratio, HOT-update percentage, table and index bloat
+    (exact via pgstattuple when the extension is installed, otherwise
+    estimated from pg_class/pg_stats), autovacuum lag against the table's
+    effective thresholds, indexes that block HOT, and recommended
+    fillfactor/autovacuum settings as ALTER TABLE statements.
+
+snapshot / compare
+    Save the counters to a JSON file, apply a change, let traffic run, then
+    compare: HOT% and dead-tuple growth over the interval show whether the
+    change helped on the real workload.
+
+bench
+    Replays an autosave-style workload on two scratch copies of a table, one
+    as-is and one with the proposed --fillfactor / --without-index, and prints
+    HOT% and size growth side by side before anything is changed for real.
+
+Usage:
+    python bloat_monitor.py
+    python bloat_monitor.py snapshot --file before.json
+    python bloat_monitor.py compare --file before.json
+    python bloat_monitor.py bench --table financial_goal --fillfactor 85 --without-index idx_financial_goal_custom_data
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+import psycopg2
+from dotenv import load_dotenv
+from partition_user_tables import copyable_columns
+
+MONITORED_TABLES = ['assets', 'financial_goal', 'financial_expense', 'financial_loan',
+                    'financial_profile', 'work_assets', 'user_tags']
+
+# Columns autosave touches on nearly every write
+AUTOSAVE_COLUMNS = {'custom_data', 'updated_at'}
+
+HOT_TARGET = 80.0
+DEAD_RATIO_WARN = 0.2
+RECOMMENDED_FILLFACTOR = 85
+# Below this size page-level rounding swamps any estimate
+MIN_ESTIMATE_PAGES = 10
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def format_bytes(size):
+    """Human readable byte count"""
+    if size < 1024:
+        return f"{size:.0f} B"
+    for unit in ['KB', 'MB']:
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} GB"
+
+def has_pgstattuple(cur):
+    """Whether the pgstattuple extension is installed in this database"""
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pgstattuple')")
+    return cur.fetchone()[0]
+
+def reloptions(cur, table):
+    """Storage parameters set on the table, e.g. {'fillfactor': '90'}"""
+    cur.execute("SELECT reloptions FROM pg_class WHERE oid = %s::regclass", (table,))
+    options = cur.fetchone()[0] or []
+    return dict(option.split('=', 1) for option in options)
+
+def table_counters(cur, table):
+    """Cumulative counters from pg_stat_user_tables plus sizes"""
+    cur.execute("""
+        SELECT n_tup_upd, n_tup_hot_upd, n_live_tup, n_dead_tup, n_mod_since_analyze,
+               last_vacuum, last_autovacuum, autovacuum_count,
+               pg_table_size(relid), pg_indexes_size(relid)
+        FROM pg_stat_user_tables
+        WHERE relid = %s::regclass
+    """, (table,))
+    row = cur.fetchone()
+    keys = ['updates', 'hot_updates', 'live', 'dead', 'mod_since_analyze',
+            'last_vacuum', 'last_autovacuum', 'autovacuum_count', 'table_bytes', 'index_bytes']
+    return dict(zip(keys, row))
+
+def autovacuum_threshold(cur, table, options, live):
+    """Dead tuples at which autovacuum will pick the table up"""
+    cur.execute("SELECT current_setting('autovacuum_vacuum_threshold')::int, "
+                "current_setting('autovacuum_vacuum_scale_factor')::float")
+    base, scale = cur.fetchone()
+    base = int(options.get('autovacuum_vacuum_threshold', base))
+    scale = float(options.get('autovacuum_vacuum_scale_factor', scale))
+    return base + scale * live, base, scale
+
+def table_bloat(cur, table, exact):
+    """(free/dead share of the heap, method) - pgstattuple or a width-based estimate"""
+    if exact:
+        cur.execute("SELECT dead_tuple_percent + approx_free_percent FROM pgstattuple_approx(%s::regclass)",
+                    (table,))
+        return float(cur.fetchone()[0]) / 100, 'pgstattuple'
+
+    # Expected pages from row count x average width (tuple header + line pointer)
+    cur.execute("""
+        SELECT c.relpages, c.reltuples, current_setting('block_size')::int,
+               COALESCE((SELECT SUM(avg_width) FROM pg_stats s
+                         WHERE s.schemaname = 'public' AND s.tablename = c.relname), 0)
+        FROM pg_class c WHERE c.oid = %s::regclass
+    """, (table,))
+    pages, tuples, block_size, width = cur.fetchone()
+    if pages < MIN_ESTIMATE_PAGES or tuples <= 0 or not width:
+        return 0.0, 'estimate'
+    fillfactor = int(reloptions(cur, table).get('fillfactor', 100)) / 100
+    expected = tuples * (width + 28) / (block_size * fillfactor)
+    return max(0.0, 1 - expected / pages), 'estimate'
+
+def index_report(cur, table, exact):
+    """Per index: size, bloat share and whether it blocks HOT for autosave"""
+    cur.execute("""
+        SELECT i.indexrelid::regclass::text, am.amname, pg_relation_size(i.indexrelid),
+               c.relpages, c.reltuples,
+               ARRAY(SELECT a.attname FROM pg_attribute a
+                     WHERE a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)),
+               COALESCE(pg_get_expr(i.indexprs, i.indrelid), '') || ' ' ||
+               COALESCE(pg_get_expr(i.indpred, i.indrelid), '')
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.indrelid = %s::regclass
+        ORDER BY 1
+    """, (table,))
+    indexes = []
+    for name, method, size, pages, tuples, columns, expressions in cur.fetchall():
+        blockers = sorted(col for col in AUTOSAVE_COLUMNS if col in columns or col in expressions)
+        bloat = None
+        if exact and method == 'btree' and pages > 1:
+            cur.execute("SELECT avg_leaf_density FROM pgstatindex(%s)", (name,))
+            density = cur.fetchone()[0]
+            bloat = max(0.0, 1 - density / 90) if density == density else None
+        elif method == 'btree' and pages >= MIN_ESTIMATE_PAGES and tuples > 0:
+            # ~20 bytes per single-column entry (header, key, line pointer) at
+            # the default 90% leaf fill, plus the metapage
+            expected = 1 + tuples * 20 * max(1, len(columns)) / (8192 * 0.9)
+            bloat = max(0.0, 1 - expected / pages)
+        indexes.append({'name': name, 'method': method, 'bytes': size,
+                        'bloat': bloat, 'blocks_hot': blockers})
+    return indexes
+
+def recommendations(table, counters, options, indexes, threshold, dead_ratio):
+    """ALTER statements and notes for one table"""
+    advice = []
+    updates = counters['updates']
+    hot_percent = 100.0 * counters['hot_updates'] / updates if updates else 100.0
+
+    for index in indexes:
+        if index['blocks_hot']:
+            advice.append(f"-- {index['name']} indexes {', '.join(index['blocks_hot'])}: every autosave "
+                          f"update is non-HOT; drop it or replace it with a narrower expression index")
+
+    fillfactor = int(options.get('fillfactor', 100))
+    if updates and hot_percent < HOT_TARGET and fillfactor > RECOMMENDED_FILLFACTOR:
+        advice.append(f"ALTER TABLE {table} SET (fillfactor = {RECOMMENDED_FILLFACTOR});  "
+                      f"-- leaves room for HOT updates on new pages; VACUUM FULL/repack to apply to existing ones")
+
+    if dead_ratio > DEAD_RATIO_WARN or counters['dead'] > threshold:
+        live = max(counters['live'], 1)
+        scale = 0.05 if live > 10000 else 0.02
+        advice.append(f"ALTER TABLE {table} SET (autovacuum_vacuum_scale_factor = {scale}, "
+                      f"autovacuum_vacuum_threshold = 200);  -- vacuum after fewer dead rows")
+        if counters['mod_since_analyze'] > live * 0.1:
+            advice.append(f"ALTER TABLE {table} SET (autovacuum_analyze_scale_factor = {scale});")
+    return hot_percent, advice
+
+def report(conn, tables):
+    """Print the bloat/HOT report for every monitored table"""
+    with conn.cursor() as cur:
+        exact = has_pgstattuple(cur)
+        print(f"📐 Bloat figures: {'pgstattuple' if exact else 'estimated (pgstattuple not installed)'}")
+        for table in tables:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+            if not cur.fetchone()[0]:
+                print(f"\n⚠️  {table}: not found, skipped")
+                continue
+
+            counters = table_counters(cur, table)
+            options = reloptions(cur, table)
+            live, dead = counters['live'], counters['dead']
+            dead_ratio = dead / (live + dead) if live + dead else 0.0
+            threshold, _, _ = autovacuum_threshold(cur, table, options, live)
+            heap_bloat, _ = table_bloat(cur, table, exact)
+            indexes = index_report(cur, table, exact)
+            hot_percent, advice = recommendations(table, counters, options, indexes, threshold, dead_ratio)
+            last_vacuum = max(filter(None, [counters['last_vacuum'], counters['last_autovacuum']]), default=None)
+
+            print(f"\n📊 {table}")
+            print("=" * 60)
+            print(f"   Rows: {live} live, {dead} dead ({dead_ratio:.1%})")
+            print(f"   Updates: {counters['updates']}, HOT {hot_percent:.1f}%"
+                  f"{'  ⚠️' if counters['updates'] and hot_percent < HOT_TARGET else ''}")
+            print(f"   Heap: {format_bytes(counters['table_bytes'])}, ~{heap_bloat:.0%} free/dead space"
+                  f"{'' if not options else f' (options: {options})'}")
+            print(f"   Autovacuum: {dead}/{threshold:.0f} dead tuples to trigger ({dead / threshold:.0%} of threshold), "
+                  f"last vacuum {last_vacuum.strftime('%Y-%m-%d %H:%M') if last_vacuum else 'never'}")
+            print(f"   Indexes: {format_bytes(counters['index_bytes'])}")
+            for index in indexes:
+                bloat = f"~{index['bloat']:.0%} bloat" if index['bloat'] is not None else index['method']
+                flag = f"  🚫 blocks HOT ({', '.join(index['blocks_hot'])})" if index['blocks_hot'] else ''
+                print(f"      - {index['name']}: {format_bytes(index['bytes'])}, {bloat}{flag}")
+            if advice:
+                print("   💡 Recommendations:")
+                for line in advice:
+                    print(f"      {line}")
+            else:
+                print("   ✅ No changes recommended")
+    conn.commit()
+
+def take_snapshot(conn, tables):
+    """Counters for every table, JSON-serializable"""
+    snapshot = {'taken_at': datetime.now().isoformat(), 'tables': {}}
+    with conn.cursor() as cur:
+        for table in tables:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+            if cur.fetchone()[0]:
+                counters = table_counters(cur, table)
+                counters['options'] = reloptions(cur, table)
+                snapshot['tables'][table] = counters
+    conn.commit()
+    return snapshot
+
+def compare_snapshot(conn, path):
+    """Deltas since a saved snapshot"""
+    with open(path, 'r', encoding='utf-8') as f:
+        before = json.load(f)
+    after = take_snapshot(conn, list(before['tables']))
+    print(f"📈 Changes since {before['taken_at']}")
+    print("=" * 60)
+    for table, old in before['tables'].items():
+        new = after['tables'].get(table)
+        if not new:
+            continue
+        updates = new['updates'] - old['updates']
+        hot = new['hot_updates'] - old['hot_updates']
+        old_hot = 100.0 * old['hot_updates'] / old['updates'] if old['updates'] else 0.0
+        new_hot = 100.0 * hot / updates if updates else 0.0
+        verdict = '✅ better' if new_hot > old_hot + 1 else '⚠️  worse' if new_hot < old_hot - 1 else '➖ same'
+        print(f"   {table}: {updates} updates, HOT {new_hot:.1f}% (was {old_hot:.1f}% cumulative) {verdict}")
+        print(f"      dead {old['dead']} -> {new['dead']}, heap {format_bytes(old['table_bytes'])} -> "
+              f"{format_bytes(new['table_bytes'])}, indexes {format_bytes(old['index_bytes'])} -> "
+              f"{format_bytes(new['index_bytes'])}")
+        if old['options'] != new['options']:
+            print(f"      options {old['options'] or '{}'} -> {new['options'] or '{}'}")
+
+def flush_stats(cur):
+    """Make this backend's table counters visible (Postgres 15+), else wait for the collector"""
+    try:
+        cur.execute("SAVEPOINT flush")
+        cur.execute("SELECT pg_stat_force_next_flush()")
+        cur.execute("RELEASE SAVEPOINT flush")
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT flush")
+        time.sleep(1)
+
+def run_bench_copy(conn, table, copy_name, rows, rounds, fillfactor=None, without_indexes=()):
+    """Autosave-style updates on a scratch copy; returns HOT% and growth"""
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {copy_name}")
+        cur.execute(f"CREATE TABLE {copy_name} (LIKE {table} INCLUDING ALL)")
+        if fillfactor:
+            cur.execute(f"ALTER TABLE {copy_name} SET (fillfactor = {int(fillfactor)})")
+        for index in without_indexes:
+            # Copied indexes get new names; match them by definition
+            cur.execute("""
+                SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = %s::regclass
+                  AND regexp_replace(pg_get_indexdef(i.indexrelid), '^.* USING ', '') =
+                      regexp_replace(pg_get_indexdef(%s::regclass), '^.* USING ', '')
+            """, (copy_name, index))
+            for (copied,) in cur.fetchall():
+                cur.execute(f"DROP INDEX {copied}")
+        # Generated columns (e.g. the promoted custom_data keys) cannot be written
+        column_list = ", ".join(copyable_columns(cur, table))
+        cur.execute(f"INSERT INTO {copy_name} ({column_list}) SELECT {column_list} FROM {table} "
+                    f"ORDER BY id LIMIT %s", (rows,))
+    conn.commit()
+
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT pg_table_size('{copy_name}'), pg_indexes_size('{copy_name}')")
+        table_before, index_before = cur.fetchone()
+        started = time.perf_counter()
+        for round_number in range(rounds):
+            cur.execute(f"""
+                UPDATE {copy_name}
+                SET custom_data = jsonb_set(COALESCE(custom_data, '{{}}'::jsonb), '{{benchRound}}', to_jsonb(%s::int)),
+                    updated_at = NOW()
+            """, (round_number,))
+            conn.commit()
+        elapsed = time.perf_counter() - started
+        flush_stats(cur)
+        conn.commit()
+        cur.execute(f"""
+            SELECT n_tup_upd, n_tup_hot_upd, pg_table_size('{copy_name}'), pg_indexes_size('{copy_name}')
+            FROM pg_stat_user_tables WHERE relname = %s
+        """, (copy_name,))
+        updates, hot, table_after, index_after = cur.fetchone()
+        cur.execute(f"DROP TABLE {copy_name}")
+    conn.commit()
+    return {
+        'hot_percent': 100.0 * hot / updates if updates else 0.0,
+        'table_growth': table_after - table_before,
+        'index_growth': index_after - index_before,
+        'seconds': elapsed,
+    }
+
+def bench(conn, table, rows, rounds, fillfactor, without_indexes):
+    """Baseline vs proposed settings on scratch copies of a table"""
+    print(f"🏁 Autosave benchmark on {table}: {rows} rows x {rounds} rounds")
+    print("=" * 60)
+    baseline = run_bench_copy(conn, table, f"bench_{table}_baseline", rows, rounds)
+    proposed = run_bench_copy(conn, table, f"bench_{table}_proposed", rows, rounds,
+                              fillfactor, without_indexes)
+    changes = []
+    if fillfactor:
+        changes.append(f"fillfactor={fillfactor}")
+    changes.extend(f"without {index}" for index in without_indexes)
+
+    for label, result in [('baseline', baseline), (', '.join(changes) or 'proposed', proposed)]:
+        print(f"   {label}\n      HOT {result['hot_percent']:5.1f}%  heap +{format_bytes(result['table_growth'])}"
+              f"  indexes +{format_bytes(result['index_growth'])}  {result['seconds']:.2f}s")
+    helped = (proposed['hot_percent'] > baseline['hot_percent'] + 1
+              or proposed['index_growth'] < baseline['index_growth'])
+    print(f"\n{'✅ The change helps' if helped else '➖ No measurable improvement'}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bloat and HOT-update monitor")
+    parser.add_argument('command', nargs='?', default='report', choices=['report', 'snapshot', 'compare', 'bench'])
+    parser.add_argument('--tables', default=','.join(MONITORED_TABLES), help="comma-separated tables")
+    parser.add_argument('--file', default='bloat_snapshot.json', help="snapshot file for snapshot/compare")
+    parser.add_argument('--table', default='financial_goal', help="table to benchmark")
+    parser.add_argument('--rows', type=int, default=5000, help="rows copied for the benchmark")
+    parser.add_argument('--rounds', type=int, default=5, help="full-table autosave rounds")
+    parser.add_argument('--fillfactor', type=int, help="fillfactor to try in the benchmark")
+    parser.add_argument('--without-index', action='append', default=[], help="index to leave out in the benchmark")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    tables = [table.strip() for table in args.tables.split(',') if table.strip()]
+    try:
+        if args.command == 'report':
+            report(conn, tables)
+        elif args.command == 'snapshot':
+            with open(args.file, 'w', encoding='utf-8') as f:
+                json.dump(take_snapshot(conn, tables), f, indent=2, default=str)
+            print(f"💾 Saved counters for {len(tables)} tables to {args.file}")
+        elif args.command == 'compare':
+            compare_snapshot(conn, args.file)
+        else:
+            bench(conn, args.table, args.rows, args.rounds, args.fillfactor, args.without_index)
+    except Exception as e:
+        print(f"❌ Bloat monitor failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,20 @@
 #!/usr/bin/env python3
 """
 Cleanup duplicate goals in the database
+
+Goals with the same (user_id, name, target_amount) are duplicates; the most
+recently created one is kept. Losers are exported to a JSONL file and deleted
+by id in small batches (see dedup_engine.py).
+
+Usage:
+    python cleanup_duplicate_goals.py --dry-run
+    python cleanup_duplicate_goals.py --batch-size 200 --export deleted_goals.jsonl
 """
 
+import argparse
 import psycopg2
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from job_locks import job_lock, JobLockBusy
+from dedup_engine import default_export_path, delete_in_batches, rank_duplicates
 
 # Database connection parameters
 DB_CONFIG = {
@@ -15,18 +25,20 @@ DB_CONFIG = {
     'port': 5432
 }
 
+GOAL_KEY = ['user_id', 'name', 'target_amount']
+GOAL_TIE_BREAK = 'created_at DESC NULLS LAST, id DESC'
+
 def connect_to_db():
     """Connect to the PostgreSQL database"""
     try:
         conn = psycopg2.connect(**DB_CONFIG)
-        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
         print("✅ Connected to PostgreSQL database")
         return conn
     except psycopg2.Error as e:
         print(f"❌ Error connecting to database: {e}")
         return None
 
-def cleanup_duplicates():
+def cleanup_duplicates(dry_run=False, batch_size=500, export_path=None):
     """Remove duplicate goals"""
     conn = connect_to_db()
     if not conn:
@@ -51,18 +63,19 @@ def cleanup_duplicates():
             for dup in duplicates:
                 print(f"  User {dup[0]}: '{dup[1]}' - ${dup[2]} ({dup[3]} copies)")
             
-            # Delete duplicates, keeping only the most recent one
-            cursor.execute("""
-                DELETE FROM financial_goal 
-                WHERE id NOT IN (
-                    SELECT DISTINCT ON (user_id, name, target_amount) id
-                    FROM financial_goal 
-                    ORDER BY user_id, name, target_amount, created_at DESC
-                )
-            """)
-            
-            deleted_count = cursor.rowcount
-            print(f"✅ Deleted {deleted_count} duplicate goals")
+            # Rank each group, keeping only the most recent one
+            losers = rank_duplicates(cursor, 'financial_goal', GOAL_KEY, GOAL_TIE_BREAK)
+            conn.commit()
+
+            if dry_run:
+                print(f"🔍 Dry run: would delete {len(losers)} duplicate goals")
+                for goal_id, keeper in losers:
+                    print(f"  Goal {goal_id} (duplicate of {keeper})")
+            else:
+                export_path = export_path or default_export_path('financial_goal')
+                print(f"💾 Exporting deleted goals to {export_path}")
+                deleted_count = delete_in_batches(conn, 'financial_goal', losers, export_path, batch_size)
+                print(f"✅ Deleted {deleted_count} duplicate goals")
         else:
             print("✅ No duplicate goals found")
             
@@ -70,12 +83,27 @@ def cleanup_duplicates():
         cursor.execute("SELECT COUNT(*) FROM financial_goal")
         total_goals = cursor.fetchone()[0]
         print(f"📊 Total goals in database: {total_goals}")
+        conn.commit()
         
     except Exception as e:
         print(f"❌ Error cleaning up duplicates: {e}")
+        conn.rollback()
     finally:
         cursor.close()
         conn.close()
 
 if __name__ == "__main__":
-    cleanup_duplicates()
+    parser = argparse.ArgumentParser(description="Remove duplicate goals")
+    parser.add_argument('--dry-run', action='store_true', help="report duplicates without deleting")
+    parser.add_argument('--batch-size', type=int, default=500, help="rows deleted per transaction")
+    parser.add_argument('--export', help="JSONL file for deleted rows (default: timestamped file)")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    parser.add_argument('--timeout', type=float, help="seconds to wait before giving up")
+    args = parser.parse_args()
+
+    try:
+        with job_lock(DB_CONFIG, 'cleanup_duplicate_goals', tables=['financial_goal'],
+                      wait=args.wait, timeout=args.timeout):
+            cleanup_duplicates(args.dry_run, args.batch_size, args.export)
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping cleanup: {e}")
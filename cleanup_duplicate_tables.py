@@ -3,8 +3,10 @@
 Cleanup duplicate goal tables - keep only one
 """
 
+import argparse
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from job_locks import job_lock, JobLockBusy
 
 # Database connection parameters
 DB_CONFIG = {
@@ -95,4 +97,14 @@ def cleanup_duplicate_tables():
         print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
-    cleanup_duplicate_tables()
+    parser = argparse.ArgumentParser(description="Drop the duplicate goal table")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    parser.add_argument('--timeout', type=float, help="seconds to wait before giving up")
+    args = parser.parse_args()
+
+    try:
+        with job_lock(DB_CONFIG, 'cleanup_duplicate_tables', tables=['financial_goal', 'financial_goals'],
+                      wait=args.wait, timeout=args.timeout):
+            cleanup_duplicate_tables()
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping cleanup: {e}")
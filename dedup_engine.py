@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Chunked duplicate removal shared by the cleanup scripts
+
+Rows are ranked with row_number() OVER (PARTITION BY <natural key> ORDER BY
+<tie-break>); rank 1 is kept and every other row is deleted by primary key in
+small batches, each in its own short transaction. Before a batch is deleted
+its rows are written as JSON lines to an export file, so a bad run can be
+undone by re-inserting them.
+
+A loser is only deleted while the row it duplicates still exists, so two
+overlapping runs (or a user deleting the keeper meanwhile) never remove every
+copy of a group.
+
+Usage in a script:
+    from dedup_engine import rank_duplicates, delete_in_batches
+
+    losers = rank_duplicates(cur, 'financial_goal', ['user_id', 'name', 'target_amount'],
+                             'created_at DESC NULLS LAST, id DESC')
+    deleted = delete_in_batches(conn, 'financial_goal', losers, 'deleted_goals.jsonl')
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+def rank_duplicates(cur, table, key_columns, order_by, id_column='id'):
+    """(id, keeper_id) for every row that is not the first of its key group"""
+    keys = ", ".join(key_columns)
+    cur.execute(f"""
+        SELECT {id_column}, keeper
+        FROM (
+            SELECT {id_column},
+                   row_number() OVER w AS rank,
+                   first_value({id_column}) OVER w AS keeper
+            FROM {table}
+            WINDOW w AS (PARTITION BY {keys} ORDER BY {order_by})
+        ) ranked
+        WHERE rank > 1
+        ORDER BY {id_column}
+    """)
+    return cur.fetchall()
+
+def default_export_path(table):
+    """Timestamped JSONL file name for a table's deleted rows"""
+    return f"deleted_{table}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+
+def delete_in_batches(conn, table, losers, export_path, batch_size=500, pause=0.0, id_column='id'):
+    """Export then delete losers batch by batch; returns the number of rows deleted
+
+    `conn` must not be in autocommit mode: each batch locks, exports and
+    deletes its rows in one transaction.
+    """
+    deleted = 0
+    with open(export_path, 'a', encoding='utf-8') as export:
+        for offset in range(0, len(losers), batch_size):
+            batch = losers[offset:offset + batch_size]
+            ids = [row[0] for row in batch]
+            keepers = [row[1] for row in batch]
+
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT t.{id_column}, row_to_json(t)
+                    FROM {table} t
+                    JOIN unnest(%s::bigint[], %s::bigint[]) AS d(id, keeper) ON t.{id_column} = d.id
+                    WHERE EXISTS (SELECT 1 FROM {table} k WHERE k.{id_column} = d.keeper)
+                    FOR UPDATE OF t
+                """, (ids, keepers))
+                rows = cur.fetchall()
+
+                for _, row in rows:
+                    export.write(json.dumps({'table': table, 'row': row}, default=str) + "\n")
+                # The export has to be on disk before the rows are gone
+                export.flush()
+                os.fsync(export.fileno())
+
+                cur.execute(f"DELETE FROM {table} WHERE {id_column} = ANY(%s)", ([row[0] for row in rows],))
+                deleted += cur.rowcount
+            conn.commit()
+
+            print(f"   🗑️  {table}: deleted {deleted}/{len(losers)}")
+            if pause:
+                time.sleep(pause)
+    return deleted
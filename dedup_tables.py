@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Detect and remove duplicate rows across the financial tables
+
+Double-submitted autosaves leave identical rows behind in every table. Each
+table below declares its natural key (rows with equal keys are duplicates)
+and a tie-break ordering (the first row is kept).
+
+Detection is one GROUP BY per table, planned as a hash aggregate, and the
+tables are scanned in parallel on separate connections. The report lists
+duplicate groups, extra rows and the space their removal would recover
+(extra rows x the table's average on-disk bytes per row, indexes included).
+
+With --delete the duplicates go through the same ranked, exported, batched
+delete as cleanup_duplicate_goals.py (dedup_engine.py), one table at a time.
+
+Usage:
+    python dedup_tables.py
+    python dedup_tables.py --tables assets,financial_expense --jobs 2
+    python dedup_tables.py --delete --batch-size 200 --export-dir exports/
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+from dedup_engine import default_export_path, delete_in_batches, rank_duplicates
+from cleanup_duplicate_goals import GOAL_KEY, GOAL_TIE_BREAK
+
+# table -> natural key (columns or expressions) and tie-break ORDER BY
+DEDUP_TABLES = {
+    'financial_goal': {
+        'key': GOAL_KEY,
+        'keep': GOAL_TIE_BREAK,
+    },
+    'assets': {
+        'key': ['user_id', 'profile_id', 'name', 'tag', 'current_value', 'holding_type'],
+        'keep': 'updated_at DESC NULLS LAST, id DESC',
+    },
+    # Keys use the columns backend/routes/financial.js writes; the legacy
+    # expense_type and loan name/amount columns are NULL for rows saved through the API
+    'financial_expense': {
+        'key': ['user_id', 'profile_id', 'category', 'subcategory', 'description', 'amount', 'frequency',
+                'notes', 'source'],
+        'keep': 'updated_at DESC NULLS LAST, id DESC',
+    },
+    'financial_loan': {
+        'key': ['user_id', 'profile_id', 'lender', 'type', 'principal_outstanding', 'rate', 'emi',
+                'start_date', 'end_date'],
+        'keep': 'updated_at DESC NULLS LAST, id DESC',
+    },
+    'work_assets': {
+        'key': ['user_id', 'profile_id', 'stream', 'amount', 'growth_rate', 'end_age'],
+        'keep': 'updated_at DESC NULLS LAST, id DESC',
+    },
+    # UNIQUE (user_id, tag_name) already stops exact copies; autosave still
+    # creates case/whitespace variants of the same tag
+    'user_tags': {
+        'key': ['user_id', 'lower(btrim(tag_name))'],
+        'keep': 'tag_order NULLS LAST, id',
+    },
+}
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        return psycopg2.connect(**get_db_config())
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def format_bytes(size):
+    """Human readable byte count"""
+    if size < 1024:
+        return f"{size:.0f} B"
+    for unit in ['KB', 'MB']:
+        size /= 1024
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} GB"
+
+def detect_table(table, work_mem):
+    """Hash-aggregate duplicate scan of one table on its own connection"""
+    spec = DEDUP_TABLES[table]
+    conn = psycopg2.connect(**get_db_config())
+    started = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+            if not cur.fetchone()[0]:
+                return {'table': table, 'missing': True}
+
+            # Enough memory for the whole hash table keeps the aggregate off disk
+            cur.execute("SET LOCAL work_mem = %s", (work_mem,))
+            cur.execute(f"""
+                SELECT COUNT(*) FILTER (WHERE copies > 1),
+                       COALESCE(SUM(copies - 1), 0),
+                       COALESCE(SUM(copies), 0)
+                FROM (
+                    SELECT COUNT(*) AS copies
+                    FROM {table}
+                    GROUP BY {', '.join(spec['key'])}
+                ) groups
+            """)
+            groups, extra, total = cur.fetchone()
+            cur.execute("SELECT pg_total_relation_size(%s::regclass)", (table,))
+            size = cur.fetchone()[0]
+        conn.rollback()
+    finally:
+        conn.close()
+
+    return {
+        'table': table,
+        'missing': False,
+        'groups': groups,
+        'extra_rows': int(extra),
+        'total_rows': int(total),
+        'size': size,
+        'recoverable': size * int(extra) / total if total else 0,
+        'seconds': time.perf_counter() - started,
+    }
+
+def detect_all(tables, jobs, work_mem):
+    """Scan the tables concurrently; results in the requested order"""
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(tables)))) as pool:
+        return list(pool.map(lambda table: detect_table(table, work_mem), tables))
+
+def print_report(results):
+    """Per-table duplicate counts and estimated space recovery"""
+    print(f"\n📊 {'Table':<20} {'Groups':>8} {'Extra rows':>11} {'Total rows':>11} {'Recoverable':>12} {'Scan':>7}")
+    print("=" * 75)
+    extra_total = recoverable_total = 0
+    for result in results:
+        if result['missing']:
+            print(f"   {result['table']:<20} ⚠️  table not found, skipped")
+            continue
+        extra_total += result['extra_rows']
+        recoverable_total += result['recoverable']
+        print(f"   {result['table']:<20} {result['groups']:>8} {result['extra_rows']:>11} "
+              f"{result['total_rows']:>11} {format_bytes(result['recoverable']):>12} {result['seconds']:>6.2f}s")
+    print("=" * 75)
+    print(f"   {extra_total} duplicate rows, ~{format_bytes(recoverable_total)} recoverable "
+          f"(space returns to the OS only after VACUUM FULL or a rewrite)")
+
+def delete_duplicates(conn, results, batch_size, export_dir):
+    """Run the shared ranked delete for every table with duplicates"""
+    deleted_total = 0
+    for result in results:
+        if result['missing'] or not result['extra_rows']:
+            continue
+        table = result['table']
+        spec = DEDUP_TABLES[table]
+
+        with conn.cursor() as cur:
+            losers = rank_duplicates(cur, table, spec['key'], spec['keep'])
+        conn.commit()
+
+        export_path = os.path.join(export_dir, default_export_path(table))
+        print(f"\n🗑️  {table}: deleting {len(losers)} rows (export: {export_path})")
+        deleted_total += delete_in_batches(conn, table, losers, export_path, batch_size)
+    print(f"\n✅ Deleted {deleted_total} duplicate rows")
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect and remove duplicate rows across financial tables")
+    parser.add_argument('--tables', default=','.join(DEDUP_TABLES),
+                        help="comma-separated tables to check")
+    parser.add_argument('--jobs', type=int, default=4, help="tables scanned in parallel")
+    parser.add_argument('--work-mem', default='64MB', help="work_mem for the detection aggregates")
+    parser.add_argument('--delete', action='store_true', help="delete the duplicates after the report")
+    parser.add_argument('--batch-size', type=int, default=500, help="rows deleted per transaction")
+    parser.add_argument('--export-dir', default='.', help="directory for the deleted-row exports")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds to wait with --wait")
+    args = parser.parse_args()
+
+    tables = [table.strip() for table in args.tables.split(',') if table.strip()]
+    unknown = [table for table in tables if table not in DEDUP_TABLES]
+    if unknown:
+        print(f"❌ Unknown tables: {', '.join(unknown)} (supported: {', '.join(DEDUP_TABLES)})")
+        return
+
+    print("🔍 Scanning for duplicate rows")
+    print("=" * 60)
+
+    load_dotenv()
+    if not args.delete:
+        print_report(detect_all(tables, args.jobs, args.work_mem))
+        print("\n💡 Re-run with --delete to remove them")
+        return
+
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with job_lock(get_db_config(), 'dedup_tables', tables=tables,
+                      wait=args.wait, timeout=args.timeout):
+            results = detect_all(tables, args.jobs, args.work_mem)
+            print_report(results)
+            os.makedirs(args.export_dir, exist_ok=True)
+            delete_duplicates(conn, results, args.batch_size, args.export_dir)
+        print("\n🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ Dedup failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
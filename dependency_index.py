@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Which derived values does a row change invalidate?
+
+Every consumer currently recomputes everything for the user after any edit.
+DependencyIndex keeps, per loaded user, the few facts needed to answer
+"what is stale now" with dictionary lookups instead:
+
+- goal funding (calculateGoalFunding / goal_funding): a goal depends on its
+  own target fields and linkedAssets, and on the projection inputs of every
+  asset linked to it from either side (asset id -> goal ids)
+- asset earmarking (calculateAssetEarmarking): current_value and goalEarmarks
+- yearly asset totals per tag and per owner, and the profile total
+  (reconcile_profile_totals.py): value and projection inputs, under the old
+  and the new tag/owner
+- loan outflow (calculateAnnualLoanOutflow): per loan and year, plus the
+  user's total for that year, for the years between now and the later of the
+  old and new expiry
+
+Derived values are tuples such as ('goal_funding', 12) or
+('loan_outflow', 7, 2031). change() returns the invalidated set and updates
+the index, so a stream of edits can be fed through one instance.
+rebalance_earmarks.py feeds its edits through it and refreshes only the
+goal_funding rows that come back (refresh_goal_funding.refresh_changed).
+
+Usage:
+    python dependency_index.py --user 4 assets 9 current_value=150000
+    python dependency_index.py --user 4 financial_goal 3 target_year=2040
+    python dependency_index.py --user 4 financial_loan 2 --delete
+"""
+
+import argparse
+import datetime
+import json
+import os
+import psycopg2
+from dotenv import load_dotenv
+from earmark_engine import ASSET_KEY, GOAL_KEY, entries, parse_id
+
+# Fields each table contributes to each kind of derived value; plain names are
+# columns, anything else is looked up in custom_data
+ASSET_PROJECTION = ['current_value', 'sipAmount', 'sipFrequency', 'expectedReturn', 'sipExpiryDate']
+DEPENDENCIES = {
+    'assets': {
+        'goal_funding': ASSET_PROJECTION + [ASSET_KEY],
+        'asset_earmarking': ['current_value', ASSET_KEY],
+        'asset_totals': ASSET_PROJECTION + ['tag', 'owner'],
+        'profile_totals': ['current_value'],
+    },
+    'financial_goal': {
+        'goal_funding': ['target_amount', 'amount', 'target_year', GOAL_KEY],
+    },
+    'financial_loan': {
+        # frequency sets paymentsPerYear ('Monthly' when absent)
+        'loan_outflow': ['emi', 'end_date', 'frequency', 'lender', 'name'],
+    },
+}
+
+# Columns loaded per table; ones a deployment's schema lacks (e.g. frequency,
+# which the current financial_loan schemas do not have) are skipped
+COLUMNS = {
+    'assets': ['id', 'user_id', 'name', 'tag', 'owner', 'current_value', 'custom_data'],
+    'financial_goal': ['id', 'user_id', 'name', 'target_amount', 'amount', 'target_year', 'custom_data'],
+    'financial_loan': ['id', 'user_id', 'name', 'lender', 'emi', 'end_date', 'frequency', 'custom_data'],
+}
+
+def field_value(row, field):
+    """Column value, or the custom_data key of that name (the frontend keeps
+    some fields, like owner, in either place)"""
+    if row.get(field) is not None:
+        return row[field]
+    return (row.get('custom_data') or {}).get(field)
+
+def changed_fields(old, new):
+    """Fields that differ between two row versions; None means no row"""
+    if old is None or new is None:
+        return None  # insert or delete: everything changed
+    keys = set(old) | set(new) | set((old.get('custom_data') or {})) | set((new.get('custom_data') or {}))
+    return {key for key in keys if key != 'custom_data' and field_value(old, key) != field_value(new, key)}
+
+class DependencyIndex:
+    """Row snapshots plus the asset -> goals map, for the users loaded"""
+
+    def __init__(self, current_year=None):
+        self.current_year = current_year or datetime.date.today().year
+        self.rows = {table: {} for table in COLUMNS}
+        self.goals_by_asset = {}
+
+    def load(self, conn, user_ids):
+        """Snapshot the given users' assets, goals and loans"""
+        with conn.cursor() as cur:
+            self.read(cur, user_ids)
+        conn.commit()
+        return self
+
+    def read(self, cur, user_ids):
+        """load() inside the caller's transaction"""
+        for table, columns in COLUMNS.items():
+            cur.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = %s
+            """, (table,))
+            present = {row[0] for row in cur.fetchall()}
+            columns = [column for column in columns if column in present]
+            cur.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE user_id = ANY(%s)", (list(user_ids),))
+            for values in cur.fetchall():
+                self._add(table, dict(zip(columns, values)))
+        return self
+
+    def _links(self, table, row):
+        """(asset_id, goal_id) pairs a row's earmark array names"""
+        if table == 'assets':
+            return {(row['id'], parse_id(e.get('goalId'))) for e in entries(row, ASSET_KEY) if isinstance(e, dict)}
+        if table == 'financial_goal':
+            return {(parse_id(e.get('assetId')), row['id']) for e in entries(row, GOAL_KEY) if isinstance(e, dict)}
+        return set()
+
+    def _add(self, table, row):
+        self.rows[table][row['id']] = row
+        for asset_id, goal_id in self._links(table, row):
+            if asset_id is not None and goal_id is not None:
+                self.goals_by_asset.setdefault(asset_id, {}).setdefault(goal_id, set()).add(table)
+
+    def _remove(self, table, row):
+        self.rows[table].pop(row['id'], None)
+        for asset_id, goal_id in self._links(table, row):
+            sides = self.goals_by_asset.get(asset_id, {}).get(goal_id)
+            if sides is None:
+                continue
+            sides.discard(table)
+            if not sides:
+                del self.goals_by_asset[asset_id][goal_id]
+
+    @staticmethod
+    def _merged(old, row_id, new_row):
+        """Partial new values laid over the stored row, custom_data key by key"""
+        if new_row is None:
+            return None
+        merged = dict(old or {'id': row_id})
+        merged.update(new_row)
+        if 'custom_data' in new_row and old is not None:
+            merged['custom_data'] = {**(old.get('custom_data') or {}), **(new_row['custom_data'] or {})}
+        return merged
+
+    def goals_for(self, asset_id):
+        """Goal ids that depend on an asset"""
+        return set(self.goals_by_asset.get(asset_id, ()))
+
+    def _loan_years(self, loan):
+        end = loan.get('end_date')
+        expiry = end.year if isinstance(end, datetime.date) else parse_id(str(end or '')[:4])
+        return range(self.current_year, (expiry or self.current_year + 10) + 1)
+
+    def invalidated(self, table, row_id, new_row):
+        """Derived values a change would invalidate, without applying it
+
+        new_row holds the new values (a partial dict is merged over the stored
+        row); None means the row is deleted.
+        """
+        old = self.rows[table].get(row_id)
+        new_row = self._merged(old, row_id, new_row)
+        changed = changed_fields(old, new_row)
+        versions = [row for row in (old, new_row) if row is not None]
+
+        stale = set()
+        for kind, fields in DEPENDENCIES.get(table, {}).items():
+            if changed is not None and not changed.intersection(fields):
+                continue
+            for row in versions:
+                user_id = row.get('user_id')
+                if kind == 'goal_funding' and table == 'assets':
+                    stale.update(('goal_funding', goal_id) for goal_id in self.goals_for(row_id))
+                    stale.update(('goal_funding', goal_id) for _, goal_id in self._links(table, row)
+                                 if goal_id is not None)
+                elif kind == 'goal_funding':
+                    stale.add(('goal_funding', row_id))
+                elif kind == 'asset_earmarking':
+                    stale.add(('asset_earmarking', row_id))
+                elif kind == 'asset_totals':
+                    stale.add(('asset_totals', user_id, 'tag', field_value(row, 'tag')))
+                    stale.add(('asset_totals', user_id, 'owner', field_value(row, 'owner')))
+                elif kind == 'profile_totals':
+                    stale.add(('profile_totals', user_id))
+                elif kind == 'loan_outflow':
+                    for year in self._loan_years(row):
+                        stale.add(('loan_outflow', row_id, year))
+                        stale.add(('loan_outflow_total', user_id, year))
+        return stale
+
+    def change(self, table, row_id, new_row):
+        """invalidated(), then record the change in the index"""
+        stale = self.invalidated(table, row_id, new_row)
+        old = self.rows[table].get(row_id)
+        if old is not None:
+            self._remove(table, old)
+        if new_row is not None:
+            self._add(table, self._merged(old, row_id, new_row))
+        return stale
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def parse_assignment(text):
+    """(field, value) from field=value, decoding JSON values where possible"""
+    field, _, raw = text.partition('=')
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    return field, value
+
+def main():
+    parser = argparse.ArgumentParser(description="Show which derived values a row change invalidates")
+    parser.add_argument('table', choices=sorted(COLUMNS))
+    parser.add_argument('row_id', type=int)
+    parser.add_argument('assignments', nargs='*', help="field=value pairs (custom_data keys allowed)")
+    parser.add_argument('--user', type=int, required=True, help="owner of the row")
+    parser.add_argument('--delete', action='store_true', help="treat the change as a delete")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        index = DependencyIndex().load(conn, [args.user])
+    finally:
+        conn.close()
+
+    if args.row_id not in index.rows[args.table]:
+        print(f"⚠️  {args.table} {args.row_id} does not belong to user {args.user}; treating as an insert")
+
+    new_row = None
+    if not args.delete:
+        new_row = {}
+        for field, value in map(parse_assignment, args.assignments):
+            if field in COLUMNS[args.table]:
+                new_row[field] = value
+            else:
+                new_row.setdefault('custom_data', {})[field] = value
+
+    stale = index.invalidated(args.table, args.row_id, new_row)
+    print(f"🧩 {args.table} {args.row_id}: {len(stale)} derived values invalidated")
+    for key in sorted(stale, key=repr):
+        print(f"   - {' / '.join(map(str, key))}")
+
+if __name__ == "__main__":
+    main()
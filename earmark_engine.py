@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Earmark graph engine: reconcile goalEarmarks and linkedAssets in linear time
+
+syncEarmarkingData (src/lib/goalCalculations.js) rebuilds both JSON sides with
+nested loops - goals x assets x earmarks - and hands back every asset and
+goal whether it changed or not. This engine does the same job in O(A+G+L):
+
+1. one pass over each side's arrays fills a dict keyed by (asset_id, goal_id)
+2. the reconciled link set is computed from that dict: one-sided links are
+   kept, percent conflicts take the asset side (prefer='goal' flips it),
+   orphaned and cross-user references are dropped
+3. each asset's goalEarmarks and each goal's linkedAssets are rebuilt from the
+   link set, reusing existing entries (and their key order, extra keys and
+   number formatting) wherever they already say the right thing
+
+Only rows whose array actually changed are returned, and write_back() stores
+them with one UPDATE ... FROM (VALUES ...) per table.
+
+Usage:
+    python earmark_engine.py --dry-run
+    python earmark_engine.py --chunk-size 500 --prefer goal
+    python earmark_engine.py --benchmark 5000
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+
+ASSET_KEY, GOAL_KEY = 'goalEarmarks', 'linkedAssets'
+
+def parse_id(value):
+    """Integer id from a JSON number or numeric string, else None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+def parse_percent(value):
+    """parseFloat(value) || 0, like the frontend"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return number if number == number else 0.0
+
+def goal_label(goal):
+    """Same fallback chain as syncEarmarkingData"""
+    return goal.get('description') or goal.get('name') or f"Goal {goal['id']}"
+
+def entries(row, key):
+    """The row's JSON array for key, or [] for missing/malformed data"""
+    value = (row.get('custom_data') or {}).get(key)
+    return value if isinstance(value, list) else []
+
+def build_links(assets, goals, prefer='asset'):
+    """Reconciled {(asset_id, goal_id): raw percent} plus stats, in one pass per side"""
+    asset_by_id = {asset['id']: asset for asset in assets}
+    goal_by_id = {goal['id']: goal for goal in goals}
+    stats = {'orphaned': 0, 'cross_user': 0, 'conflicts': 0, 'asset_only': 0, 'goal_only': 0}
+
+    sides = {}
+    for side, rows, key, other_field, other_index in [
+        ('asset', assets, ASSET_KEY, 'goalId', goal_by_id),
+        ('goal', goals, GOAL_KEY, 'assetId', asset_by_id),
+    ]:
+        for row in rows:
+            for entry in entries(row, key):
+                if not isinstance(entry, dict):
+                    continue
+                other_id = parse_id(entry.get(other_field))
+                other = other_index.get(other_id)
+                if other is None:
+                    stats['orphaned'] += 1
+                    continue
+                if other['user_id'] != row['user_id']:
+                    stats['cross_user'] += 1
+                    continue
+                pair = (row['id'], other_id) if side == 'asset' else (other_id, row['id'])
+                # First entry wins, like Array.find()
+                sides.setdefault(pair, {}).setdefault(side, entry.get('percent'))
+
+    first, second = ('asset', 'goal') if prefer == 'asset' else ('goal', 'asset')
+    links = {}
+    for pair, found in sides.items():
+        if 'asset' not in found:
+            stats['goal_only'] += 1
+        elif 'goal' not in found:
+            stats['asset_only'] += 1
+        elif parse_percent(found['asset']) != parse_percent(found['goal']):
+            stats['conflicts'] += 1
+        links[pair] = found[first] if first in found else found[second]
+    return links, stats
+
+def rebuild(row, key, id_field, name_field, wanted, names):
+    """New array for one row, or None if the existing one already matches
+
+    wanted: {other_id: raw percent} for this row, in the order new entries
+    should be appended; names: {other_id: display name}.
+    """
+    current = entries(row, key)
+    rebuilt = []
+    seen = set()
+    for entry in current:
+        if not isinstance(entry, dict):
+            continue
+        other_id = parse_id(entry.get(id_field))
+        if other_id not in wanted or other_id in seen:
+            continue
+        seen.add(other_id)
+        updated = dict(entry)
+        if parse_percent(updated.get('percent')) != parse_percent(wanted[other_id]):
+            updated['percent'] = wanted[other_id]
+        if updated.get(name_field) != names[other_id]:
+            updated[name_field] = names[other_id]
+        rebuilt.append(updated)
+    for other_id, percent in wanted.items():
+        if other_id not in seen:
+            rebuilt.append({id_field: other_id, name_field: names[other_id], 'percent': percent})
+    return None if rebuilt == current else rebuilt
+
+def reconcile(assets, goals, prefer='asset'):
+    """Changed arrays per side: ({asset_id: goalEarmarks}, {goal_id: linkedAssets}, stats)"""
+    links, stats = build_links(assets, goals, prefer)
+
+    by_asset, by_goal = {}, {}
+    for (asset_id, goal_id), percent in sorted(links.items()):
+        by_asset.setdefault(asset_id, {})[goal_id] = percent
+        by_goal.setdefault(goal_id, {})[asset_id] = percent
+
+    goal_names = {goal['id']: goal_label(goal) for goal in goals}
+    asset_names = {asset['id']: asset.get('name') for asset in assets}
+
+    asset_changes = {}
+    for asset in assets:
+        new = rebuild(asset, ASSET_KEY, 'goalId', 'goalName', by_asset.get(asset['id'], {}), goal_names)
+        if new is not None:
+            asset_changes[asset['id']] = new
+    goal_changes = {}
+    for goal in goals:
+        new = rebuild(goal, GOAL_KEY, 'assetId', 'assetName', by_goal.get(goal['id'], {}), asset_names)
+        if new is not None:
+            goal_changes[goal['id']] = new
+
+    stats['links'] = len(links)
+    return asset_changes, goal_changes, stats
+
+def write_back(cur, table, key, changes, originals):
+    """One UPDATE ... FROM (VALUES ...) for every changed row of a table
+
+    Rows whose array changed since it was read are skipped rather than
+    overwritten; returns the number of rows written.
+    """
+    if not changes:
+        return 0
+    values = [(row_id, json.dumps(array), json.dumps(originals[row_id]))
+              for row_id, array in changes.items()]
+    execute_values(cur, f"""
+        UPDATE {table} t
+        SET custom_data = jsonb_set(COALESCE(t.custom_data, '{{}}'::jsonb), '{{{key}}}', v.value::jsonb)
+        FROM (VALUES %s) AS v(id, value, original)
+        WHERE t.id = v.id
+          AND COALESCE(t.custom_data->'{key}', 'null'::jsonb) = v.original::jsonb
+    """, values, page_size=len(values))
+    return cur.rowcount
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def load_chunk(cur, start, end):
+    """Assets and goals of a user_id range as plain dicts"""
+    cur.execute("""
+        SELECT id, user_id, name, custom_data FROM assets
+        WHERE user_id >= %s AND user_id < %s
+    """, (start, end))
+    assets = [{'id': i, 'user_id': u, 'name': n, 'custom_data': c} for i, u, n, c in cur.fetchall()]
+    # description only exists on some deployments, so read it through to_jsonb
+    cur.execute("""
+        SELECT id, user_id, name, to_jsonb(g)->>'description', custom_data FROM financial_goal g
+        WHERE user_id >= %s AND user_id < %s
+    """, (start, end))
+    goals = [{'id': i, 'user_id': u, 'name': n, 'description': d, 'custom_data': c}
+             for i, u, n, d, c in cur.fetchall()]
+    return assets, goals
+
+def sync_all(conn, chunk_size, prefer, dry_run):
+    """Reconcile every user, chunk by chunk"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM "user"')
+        min_user, max_user = cur.fetchone()
+    conn.commit()
+
+    totals = {'assets': 0, 'goals': 0, 'skipped': 0}
+    engine_seconds = 0.0
+    for start in range(min_user, max_user + 1, chunk_size):
+        end = start + chunk_size
+        with conn.cursor() as cur:
+            assets, goals = load_chunk(cur, start, end)
+            started = time.perf_counter()
+            asset_changes, goal_changes, stats = reconcile(assets, goals, prefer)
+            engine_seconds += time.perf_counter() - started
+
+            if not dry_run:
+                asset_originals = {a['id']: (a['custom_data'] or {}).get(ASSET_KEY) for a in assets}
+                goal_originals = {g['id']: (g['custom_data'] or {}).get(GOAL_KEY) for g in goals}
+                written_assets = write_back(cur, 'assets', ASSET_KEY, asset_changes, asset_originals)
+                written_goals = write_back(cur, 'financial_goal', GOAL_KEY, goal_changes, goal_originals)
+                totals['skipped'] += len(asset_changes) + len(goal_changes) - written_assets - written_goals
+        conn.commit() if not dry_run else conn.rollback()
+
+        totals['assets'] += len(asset_changes)
+        totals['goals'] += len(goal_changes)
+        print(f"   📦 users {start}..{min(end, max_user + 1) - 1}: {len(assets)} assets, {len(goals)} goals, "
+              f"{stats['links']} links -> {len(asset_changes)} assets / {len(goal_changes)} goals changed "
+              f"({stats['conflicts']} conflicts, {stats['orphaned'] + stats['cross_user']} dropped)")
+
+    verb = "Would rewrite" if dry_run else "Rewrote"
+    print(f"\n✅ {verb} {totals['assets']} assets and {totals['goals']} goals "
+          f"(engine time {engine_seconds * 1000:.1f} ms)")
+    if totals['skipped']:
+        print(f"⚠️  {totals['skipped']} rows changed while syncing and were left for the next run")
+
+def nested_loop_sync(assets, goals):
+    """Direct port of syncEarmarkingData, kept for the benchmark only"""
+    updated_goals = []
+    for goal in goals:
+        linked = []
+        for asset in assets:
+            earmark = next((e for e in entries(asset, ASSET_KEY) if e.get('goalId') == goal['id']), None)
+            if earmark:
+                linked.append({'assetId': asset['id'], 'assetName': asset['name'], 'percent': earmark['percent']})
+        updated_goals.append(linked)
+    updated_assets = []
+    for asset in assets:
+        earmarks = []
+        for goal in goals:
+            linked = next((l for l in entries(goal, GOAL_KEY) if l.get('assetId') == asset['id']), None)
+            if linked:
+                earmarks.append({'goalId': goal['id'], 'goalName': goal_label(goal), 'percent': linked['percent']})
+        updated_assets.append(earmarks)
+    return updated_assets, updated_goals
+
+def benchmark(asset_count, goal_count=None, links_per_asset=2):
+    """Time the engine against the nested-loop port on one synthetic user"""
+    goal_count = goal_count or max(1, asset_count // 10)
+    rng = random.Random(42)
+    goals = [{'id': g, 'user_id': 1, 'name': f"Goal {g}", 'custom_data': {GOAL_KEY: []}}
+             for g in range(1, goal_count + 1)]
+    assets = []
+    for a in range(1, asset_count + 1):
+        earmarks = []
+        for goal in rng.sample(goals, min(links_per_asset, goal_count)):
+            earmarks.append({'goalId': goal['id'], 'goalName': goal['name'], 'percent': 25})
+            goal['custom_data'][GOAL_KEY].append({'assetId': a, 'assetName': f"Asset {a}", 'percent': 25})
+        assets.append({'id': a, 'user_id': 1, 'name': f"Asset {a}", 'custom_data': {ASSET_KEY: earmarks}})
+    # A little drift so there is something to write back
+    for asset in assets[::50]:
+        asset['custom_data'][ASSET_KEY].append({'goalId': 999999, 'percent': 5})
+
+    print(f"🏁 {asset_count} assets, {goal_count} goals, ~{asset_count * links_per_asset} links")
+    started = time.perf_counter()
+    asset_changes, goal_changes, _ = reconcile(assets, goals)
+    engine_ms = (time.perf_counter() - started) * 1000
+    print(f"   engine:      {engine_ms:9.1f} ms ({len(asset_changes)} assets, {len(goal_changes)} goals to write)")
+
+    started = time.perf_counter()
+    nested_loop_sync(assets, goals)
+    nested_ms = (time.perf_counter() - started) * 1000
+    print(f"   nested loop: {nested_ms:9.1f} ms (rewrites all {asset_count + goal_count} rows)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile goalEarmarks and linkedAssets for every user")
+    parser.add_argument('--chunk-size', type=int, default=500, help="user ids per transaction")
+    parser.add_argument('--prefer', choices=['asset', 'goal'], default='asset',
+                        help="side whose percent wins when both sides disagree")
+    parser.add_argument('--dry-run', action='store_true', help="report changes without writing")
+    parser.add_argument('--benchmark', type=int, metavar='ASSETS', help="time the engine on synthetic data")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+
+    print("🔗 Syncing earmarks")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with job_lock(get_db_config(), 'earmark_engine', tables=['assets', 'financial_goal'], wait=args.wait):
+            sync_all(conn, args.chunk_size, args.prefer, args.dry_run)
+        print("\n🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ Sync failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Replay the earmark history to see allocations at any point in time
+
+Triggers on assets and financial_goal (see
+backend/scripts/2025-10-19_create_earmark_history.sql) append one small delta
+to earmark_history whenever goalEarmarks / linkedAssets actually change -
+added, removed and changed links with their percents - so storage grows with
+the number of edits, not with the size of custom_data.
+
+To bound replay time, `checkpoint` stores the full state of every row that
+changed since its previous checkpoint (run it nightly). Reading the state at
+time T starts from each row's latest checkpoint taken at or before T and
+applies that row's later deltas up to T.
+
+install
+    Applies the migration and checkpoints every row that has earmarks, since
+    history only starts now.
+checkpoint
+    Snapshots rows with deltas newer than their last checkpoint.
+state
+    Prints a user's allocation at --at (default: now).
+log
+    Prints a user's deltas.
+
+Usage:
+    python earmark_history.py install
+    python earmark_history.py checkpoint
+    python earmark_history.py state --user 42 --at "2025-10-01 09:00"
+    python earmark_history.py log --user 42
+"""
+
+import argparse
+import datetime
+import os
+from pathlib import Path
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+
+SCHEMA_FILE = Path("backend/scripts/2025-10-19_create_earmark_history.sql")
+
+# source table -> (JSON key, id field, label of the ids it references)
+SIDES = {
+    'assets': ('goalEarmarks', 'goalId', 'goal'),
+    'financial_goal': ('linkedAssets', 'assetId', 'asset'),
+}
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def apply_delta(state, delta):
+    """Apply one earmark_history delta to a {ref_id: percent} dict in place"""
+    for ref_id in delta.get('removed', {}):
+        state.pop(ref_id, None)
+    state.update(delta.get('added', {}))
+    for ref_id, (_, new) in delta.get('changed', {}).items():
+        state[ref_id] = new
+    return state
+
+def checkpoint(conn, only_changed=True, chunk_size=1000):
+    """Store the current state of rows whose history moved since their last checkpoint"""
+    total = 0
+    for table, (key, field, _) in SIDES.items():
+        with conn.cursor() as cur:
+            if only_changed:
+                cur.execute("""
+                    SELECT h.row_id FROM earmark_history h
+                    WHERE h.source_table = %(table)s
+                    GROUP BY h.row_id
+                    HAVING MAX(h.id) > COALESCE((
+                        SELECT MAX(c.last_history_id) FROM earmark_history_checkpoint c
+                        WHERE c.source_table = %(table)s AND c.row_id = h.row_id), 0)
+                """, {'table': table})
+            else:
+                cur.execute(f"SELECT id FROM {table} WHERE earmark_state(custom_data, %s, %s) <> '{{}}'",
+                            (key, field))
+            row_ids = sorted(row[0] for row in cur.fetchall())
+        conn.commit()
+
+        for i in range(0, len(row_ids), chunk_size):
+            with conn.cursor() as cur:
+                # The row lock means every delta of these rows is committed and visible
+                cur.execute(f"SELECT id FROM {table} WHERE id = ANY(%s) FOR SHARE", (row_ids[i:i + chunk_size],))
+                cur.execute(f"""
+                    INSERT INTO earmark_history_checkpoint (source_table, row_id, user_id, last_history_id, state)
+                    SELECT %(table)s, t.id, t.user_id,
+                           COALESCE((SELECT MAX(h.id) FROM earmark_history h
+                                     WHERE h.source_table = %(table)s AND h.row_id = t.id), 0),
+                           earmark_state(t.custom_data, %(key)s, %(field)s)
+                    FROM {table} t
+                    WHERE t.id = ANY(%(ids)s)
+                """, {'table': table, 'key': key, 'field': field, 'ids': row_ids[i:i + chunk_size]})
+                total += cur.rowcount
+            conn.commit()
+        print(f"   📸 {table}: {len(row_ids)} rows checkpointed")
+    return total
+
+# Each row's latest checkpoint taken at or before %(at)s
+CHOSEN_CHECKPOINTS_SQL = """
+    SELECT DISTINCT ON (source_table, row_id) source_table, row_id, last_history_id, state
+    FROM earmark_history_checkpoint
+    WHERE user_id = %(user)s AND taken_at <= %(at)s
+    ORDER BY source_table, row_id, taken_at DESC, id DESC
+"""
+
+def state_at(conn, user_id, at):
+    """{(table, row_id): {ref_id: percent}} for a user as of `at`"""
+    with conn.cursor() as cur:
+        cur.execute(CHOSEN_CHECKPOINTS_SQL, {'user': user_id, 'at': at})
+        base = cur.fetchall()
+        # Only the deltas after each row's chosen checkpoint (all of them for
+        # rows that have none)
+        cur.execute(f"""
+            WITH base AS ({CHOSEN_CHECKPOINTS_SQL})
+            SELECT h.source_table, h.row_id, h.delta
+            FROM earmark_history h
+            LEFT JOIN base b ON b.source_table = h.source_table AND b.row_id = h.row_id
+            WHERE h.user_id = %(user)s AND h.changed_at <= %(at)s
+              AND h.id > COALESCE(b.last_history_id, 0)
+            ORDER BY h.id
+        """, {'user': user_id, 'at': at})
+        deltas = cur.fetchall()
+    conn.commit()
+
+    states = {(table, row_id): dict(state) for table, row_id, _, state in base}
+    for table, row_id, delta in deltas:
+        apply_delta(states.setdefault((table, row_id), {}), delta)
+    return {key: state for key, state in states.items() if state}, len(base), len(deltas)
+
+def print_state(conn, user_id, at):
+    """Replayed allocation of one user, per asset and goal"""
+    states, checkpoints, replayed = state_at(conn, user_id, at)
+    print(f"👤 User {user_id} at {at:%Y-%m-%d %H:%M:%S} "
+          f"({checkpoints} checkpoints, {replayed} deltas replayed)")
+    if not states:
+        print("   (no earmarks)")
+    for (table, row_id), state in sorted(states.items()):
+        label = SIDES[table][2]
+        links = ", ".join(f"{label} {ref_id}: {percent}%" for ref_id, percent in
+                          sorted(state.items(), key=lambda item: int(item[0])))
+        print(f"   {'💰 asset' if table == 'assets' else '🎯 goal'} {row_id}: {links}")
+
+def print_log(conn, user_id, limit):
+    """The latest deltas of one user, oldest first"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT changed_at, source_table, row_id, delta FROM earmark_history
+            WHERE user_id = %s ORDER BY id DESC LIMIT %s
+        """, (user_id, limit))
+        rows = cur.fetchall()
+    conn.commit()
+    for changed_at, table, row_id, delta in reversed(rows):
+        label = SIDES[table][2]
+        parts = [f"+{label} {ref_id} ({p}%)" for ref_id, p in delta.get('added', {}).items()]
+        parts += [f"-{label} {ref_id} ({p}%)" for ref_id, p in delta.get('removed', {}).items()]
+        parts += [f"~{label} {ref_id} ({old}% -> {new}%)" for ref_id, (old, new) in delta.get('changed', {}).items()]
+        print(f"   {changed_at:%Y-%m-%d %H:%M:%S} {table} {row_id}: {', '.join(parts)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Earmark change history")
+    parser.add_argument('command', choices=['install', 'checkpoint', 'state', 'log'])
+    parser.add_argument('--user', type=int, help="user id for state/log")
+    parser.add_argument('--at', type=datetime.datetime.fromisoformat, help="timestamp for state (default: now)")
+    parser.add_argument('--limit', type=int, default=50, help="deltas shown by log")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    if args.command in ('state', 'log') and args.user is None:
+        parser.error("--user is required for state and log")
+
+    print(f"🕰️  Earmark history: {args.command}")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        if args.command == 'state':
+            print_state(conn, args.user, args.at or datetime.datetime.now())
+        elif args.command == 'log':
+            print_log(conn, args.user, args.limit)
+        else:
+            with job_lock(get_db_config(), 'earmark_history', tables=['earmark_history_checkpoint'],
+                          wait=args.wait):
+                if args.command == 'install':
+                    with conn.cursor() as cur:
+                        cur.execute(SCHEMA_FILE.read_text(encoding='utf-8'))
+                    conn.commit()
+                    print(f"✅ Applied {SCHEMA_FILE}")
+                total = checkpoint(conn, only_changed=args.command == 'checkpoint')
+            print(f"\n✅ {total} checkpoints written")
+            print("🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ {args.command} failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Verify, rebuild or query the reverse earmark index
+
+earmark_reverse_index maps each asset to the goals that reference it (and
+back), kept current by triggers on assets and financial_goal - see
+backend/scripts/2025-10-19_create_earmark_reverse_index.sql. "Which goals
+depend on asset 42" becomes a primary-key probe instead of a GIN containment
+scan over every goal's custom_data.
+
+verify (default)
+    Compares the index with earmark_reverse_expected (the same pairs derived
+    from the JSON) and exits 1 on missing, extra or mis-flagged rows.
+rebuild
+    Replaces the index contents from the JSON in one transaction, holding a
+    SHARE lock on assets and financial_goal so no write slips in between.
+install
+    Applies the migration (table, triggers, backfill).
+lookup
+    Prints the goals depending on the given assets.
+
+Usage:
+    python earmark_reverse_index.py verify
+    python earmark_reverse_index.py rebuild
+    python earmark_reverse_index.py lookup 42 57
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+
+SCHEMA_FILE = Path("backend/scripts/2025-10-19_create_earmark_reverse_index.sql")
+
+DIFF_SQL = """
+SELECT COALESCE(i.asset_id, e.asset_id), COALESCE(i.goal_id, e.goal_id),
+       CASE WHEN i.asset_id IS NULL THEN 'missing'
+            WHEN e.asset_id IS NULL THEN 'extra'
+            ELSE 'flags' END AS problem,
+       i.via_asset, i.via_goal, e.via_asset, e.via_goal
+FROM earmark_reverse_index i
+FULL JOIN earmark_reverse_expected e ON e.asset_id = i.asset_id AND e.goal_id = i.goal_id
+WHERE i.asset_id IS NULL OR e.asset_id IS NULL
+   OR i.via_asset <> e.via_asset OR i.via_goal <> e.via_goal
+ORDER BY 1, 2
+"""
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def install(conn):
+    """Create the index table and triggers, backfilling from the JSON"""
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_FILE.read_text(encoding='utf-8'))
+        cur.execute("SELECT COUNT(*) FROM earmark_reverse_index")
+        count = cur.fetchone()[0]
+    conn.commit()
+    print(f"✅ Applied {SCHEMA_FILE} ({count} index rows)")
+
+def verify(conn, show):
+    """Print differences between the index and the JSON; returns their count"""
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(DIFF_SQL)
+        problems = cur.fetchall()
+        cur.execute("SELECT COUNT(*) FROM earmark_reverse_index")
+        indexed = cur.fetchone()[0]
+    conn.commit()
+
+    print(f"📊 {indexed} index rows checked in {time.perf_counter() - started:.2f}s")
+    if not problems:
+        print("✅ Index matches goalEarmarks / linkedAssets")
+        return 0
+
+    counts = {}
+    for row in problems:
+        counts[row[2]] = counts.get(row[2], 0) + 1
+    print(f"❌ {len(problems)} differences: " + ", ".join(f"{n} {kind}" for kind, n in sorted(counts.items())))
+    for asset_id, goal_id, problem, via_asset, via_goal, want_asset, want_goal in problems[:show]:
+        print(f"   - asset {asset_id} / goal {goal_id}: {problem} "
+              f"(index asset={via_asset} goal={via_goal}, json asset={want_asset} goal={want_goal})")
+    if len(problems) > show:
+        print(f"   ... {len(problems) - show} more")
+    return len(problems)
+
+def rebuild(conn):
+    """Replace the index from the JSON in one transaction"""
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        # SHARE blocks writers (and so the triggers) but not readers
+        cur.execute("LOCK TABLE assets, financial_goal IN SHARE MODE")
+        cur.execute("DELETE FROM earmark_reverse_index")
+        removed = cur.rowcount
+        cur.execute("""
+            INSERT INTO earmark_reverse_index (asset_id, goal_id, via_asset, via_goal)
+            SELECT asset_id, goal_id, via_asset, via_goal FROM earmark_reverse_expected
+        """)
+        inserted = cur.rowcount
+    conn.commit()
+    print(f"✅ Rebuilt index: {removed} rows replaced by {inserted} "
+          f"in {time.perf_counter() - started:.2f}s")
+
+def lookup(conn, asset_ids):
+    """Goals depending on each asset, straight from the index"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT i.asset_id, i.goal_id, i.via_asset, i.via_goal, g.name
+            FROM earmark_reverse_index i
+            LEFT JOIN financial_goal g ON g.id = i.goal_id
+            WHERE i.asset_id = ANY(%s)
+            ORDER BY i.asset_id, i.goal_id
+        """, (asset_ids,))
+        rows = cur.fetchall()
+    conn.commit()
+
+    found = {}
+    for asset_id, goal_id, via_asset, via_goal, name in rows:
+        found.setdefault(asset_id, []).append((goal_id, via_asset, via_goal, name))
+    for asset_id in asset_ids:
+        goals = found.get(asset_id, [])
+        print(f"💰 Asset {asset_id}: {len(goals)} goals")
+        for goal_id, via_asset, via_goal, name in goals:
+            sides = "both sides" if via_asset and via_goal else "goalEarmarks only" if via_asset else "linkedAssets only"
+            print(f"   - goal {goal_id} {name or '(deleted)'} [{sides}]")
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the asset -> goals reverse earmark index")
+    parser.add_argument('command', nargs='?', default='verify', choices=['verify', 'rebuild', 'install', 'lookup'])
+    parser.add_argument('asset_ids', nargs='*', type=int, help="asset ids for lookup")
+    parser.add_argument('--show', type=int, default=20, help="differences to print")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    print(f"🔎 Reverse earmark index: {args.command}")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    problems = 0
+    try:
+        if args.command == 'verify':
+            problems = verify(conn, args.show)
+        elif args.command == 'lookup':
+            lookup(conn, args.asset_ids)
+        else:
+            with job_lock(get_db_config(), 'earmark_reverse_index', tables=['earmark_reverse_index'],
+                          wait=args.wait):
+                if args.command == 'install':
+                    install(conn)
+                else:
+                    rebuild(conn)
+            print("\n🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ {args.command} failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+    if problems:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
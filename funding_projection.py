@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Stream goal funding for a range of users from goal_funding_projection()
+
+goal_funding_projection(start_user, end_user[, current_year]) - see
+backend/scripts/2025-10-19_create_goal_funding_function.sql - computes the
+funded amount, percent funded and gap of every goal in a user id range in a
+single query, projecting each linked asset's own earmarked share with the
+calculateSIPProjection formula. (The funding query in test_real_data_flow.py
+used to apply the first link's percent to every asset, one goal at a time.)
+
+Results are read through a server-side cursor, so memory stays flat however
+many goals the range holds.
+
+--check compares every row with the Python port in refresh_goal_funding.py.
+--benchmark times the set-based function against one query per goal.
+
+Usage:
+    python funding_projection.py --create-function
+    python funding_projection.py --users 1:500 --csv funding.csv
+    python funding_projection.py --check
+    python funding_projection.py --benchmark
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import sys
+import time
+from pathlib import Path
+import psycopg2
+from dotenv import load_dotenv
+from refresh_goal_funding import goal_funding
+
+SCHEMA_FILE = Path("backend/scripts/2025-10-19_create_goal_funding_function.sql")
+
+COLUMNS = ['goal_id', 'user_id', 'target_amount', 'target_year', 'years_to_target',
+           'funded_amount', 'percent_funded', 'funding_gap', 'linked_asset_ids']
+
+def stream_funding(conn, start, end, current_year=None, itersize=2000):
+    """Yield one dict per goal of users start <= id < end, fetched itersize at a time"""
+    with conn.cursor(name='goal_funding_stream') as cur:
+        cur.itersize = itersize
+        cur.execute("SELECT * FROM goal_funding_projection(%s, %s, COALESCE(%s, EXTRACT(YEAR FROM CURRENT_DATE)::int))"
+                    " ORDER BY user_id, goal_id", (start, end, current_year))
+        for row in cur:
+            yield dict(zip(COLUMNS, row))
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def create_function(conn):
+    """Create or replace the SQL functions"""
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_FILE.read_text(encoding='utf-8'))
+    conn.commit()
+    print(f"✅ Applied {SCHEMA_FILE}")
+
+def user_bounds(conn):
+    """Half-open range covering every user id"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) + 1 FROM "user"')
+        bounds = cur.fetchone()
+    conn.commit()
+    return bounds
+
+def per_goal_loop(conn, start, end, current_year):
+    """The old approach: one query per goal, projection in Python"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM financial_goal WHERE user_id >= %s AND user_id < %s", (start, end))
+        goal_ids = [row[0] for row in cur.fetchall()]
+        results = []
+        for goal_id in goal_ids:
+            cur.execute("""
+                SELECT fg.id, fg.user_id, fg.target_amount, (to_jsonb(fg)->>'amount')::double precision,
+                       (to_jsonb(fg)->>'target_year')::integer, fg.custom_data,
+                       a.id, a.current_value, a.custom_data
+                FROM financial_goal fg
+                LEFT JOIN LATERAL jsonb_array_elements(fg.custom_data->'linkedAssets') AS linked_asset ON TRUE
+                LEFT JOIN assets a ON a.id::text = btrim(linked_asset->>'assetId') AND a.user_id = fg.user_id
+                WHERE fg.id = %s
+            """, (goal_id,))
+            rows = cur.fetchall()
+            goal = dict(zip(['id', 'user_id', 'target_amount', 'amount', 'target_year', 'custom_data'], rows[0][:6]))
+            assets = {r[6]: {'id': r[6], 'current_value': r[7], 'custom_data': r[8]} for r in rows if r[6]}
+            results.append(goal_funding(goal, assets, current_year))
+    conn.commit()
+    return results
+
+def check(conn, start, end, current_year):
+    """Compare the SQL function with the Python port row by row"""
+    expected = {row[0]: row for row in per_goal_loop(conn, start, end, current_year)}
+    mismatches = 0
+    checked = 0
+    for row in stream_funding(conn, start, end, current_year):
+        checked += 1
+        _, _, target, _, years, funded, percent, gap, linked, _ = expected.pop(row['goal_id'])
+        if (abs(row['funded_amount'] - funded) > 0.01 or abs(row['percent_funded'] - percent) > 0.01
+                or row['years_to_target'] != years or sorted(row['linked_asset_ids']) != linked):
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"   ❌ goal {row['goal_id']}: sql {row['funded_amount']:.2f} / {row['percent_funded']}% "
+                      f"vs python {funded:.2f} / {percent}%")
+    mismatches += len(expected)
+    icon = "✅" if not mismatches else "❌"
+    print(f"{icon} {checked} goals checked, {mismatches} mismatches")
+    return mismatches
+
+def benchmark(conn, start, end, current_year):
+    """Time the set-based function against one query per goal"""
+    started = time.perf_counter()
+    count = sum(1 for _ in stream_funding(conn, start, end, current_year))
+    conn.commit()
+    set_based = time.perf_counter() - started
+
+    started = time.perf_counter()
+    per_goal_loop(conn, start, end, current_year)
+    looped = time.perf_counter() - started
+
+    print(f"🏁 {count} goals, users {start}..{end - 1}")
+    print(f"   goal_funding_projection(): {set_based * 1000:9.1f} ms")
+    print(f"   one query per goal:        {looped * 1000:9.1f} ms ({looped / max(set_based, 1e-9):.1f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Set-based goal funding for a range of users")
+    parser.add_argument('--users', help="user id range START:END (end exclusive), default all users")
+    parser.add_argument('--year', type=int, help="project from this year instead of the current one")
+    parser.add_argument('--csv', help="write rows to this CSV file instead of stdout")
+    parser.add_argument('--create-function', action='store_true', help="create the SQL functions first")
+    parser.add_argument('--check', action='store_true', help="compare with the Python implementation")
+    parser.add_argument('--benchmark', action='store_true', help="compare with one query per goal")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    current_year = args.year or datetime.date.today().year
+    try:
+        if args.create_function:
+            create_function(conn)
+        if args.users:
+            start, end = (int(part) for part in args.users.split(':'))
+        else:
+            start, end = user_bounds(conn)
+
+        if args.check:
+            if check(conn, start, end, current_year):
+                raise SystemExit(1)
+        elif args.benchmark:
+            benchmark(conn, start, end, current_year)
+        else:
+            out = open(args.csv, 'w', newline='', encoding='utf-8') if args.csv else sys.stdout
+            try:
+                writer = csv.DictWriter(out, fieldnames=COLUMNS)
+                writer.writeheader()
+                count = 0
+                for row in stream_funding(conn, start, end, current_year):
+                    writer.writerow(row)
+                    count += 1
+            finally:
+                if args.csv:
+                    out.close()
+            conn.commit()
+            if args.csv:
+                print(f"💾 Wrote {count} goals to {args.csv}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
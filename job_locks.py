@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Advisory-lock coordination for the ops scripts
+
+Destructive maintenance scripts take session-level advisory locks before they
+touch the database, so two operators cannot run conflicting jobs at once:
+
+- one lock per job name (the same job never runs twice concurrently)
+- one lock per table the job rewrites (different jobs on the same table exclude
+  each other, jobs on disjoint tables run side by side)
+
+Locks live on a dedicated connection whose application_name is
+'lifemaps-job:<name>', so they are released automatically if the script dies
+and show up in pg_stat_activity.
+
+Usage in a script:
+    from job_locks import job_lock, JobLockBusy
+
+    try:
+        with job_lock(DB_CONFIG, 'cleanup_duplicate_goals', tables=['financial_goal'], wait=False):
+            cleanup_duplicates()
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+
+Status:
+    python job_locks.py status
+"""
+
+import hashlib
+import os
+import sys
+import time
+from contextlib import contextmanager
+import psycopg2
+from dotenv import load_dotenv
+
+APPLICATION_PREFIX = 'lifemaps-job:'
+WAITING_PREFIX = 'lifemaps-wait:'
+
+class JobLockBusy(Exception):
+    """Raised when a conflicting job holds one of the requested locks"""
+
+    def __init__(self, resource, holders):
+        self.resource = resource
+        self.holders = holders
+        held_by = ', '.join(holders) if holders else 'another session'
+        super().__init__(f"{resource} is locked by {held_by}")
+
+def get_db_config():
+    """Connection parameters from environment variables"""
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': os.getenv('DB_PORT', '5432'),
+        'database': os.getenv('DB_NAME', 'life_sheet'),
+        'user': os.getenv('DB_USER', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', 'admin')
+    }
+
+def lock_key(resource):
+    """Stable signed 64-bit advisory lock key for a resource name"""
+    digest = hashlib.sha256(f"lifemaps:{resource}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+def lock_resources(job_name, tables=()):
+    """Resource names a job locks, in a fixed order so jobs never deadlock"""
+    return sorted({f"job:{job_name}"} | {f"table:{table}" for table in tables})
+
+def lock_holders(cur, resource):
+    """application_name/pid of the sessions holding a resource lock"""
+    key = lock_key(resource) & 0xFFFFFFFFFFFFFFFF
+    cur.execute("""
+        SELECT a.pid, a.application_name
+        FROM pg_locks l
+        JOIN pg_stat_activity a ON a.pid = l.pid
+        WHERE l.locktype = 'advisory' AND l.granted
+          AND l.classid = %s AND l.objid = %s AND l.objsubid = 1
+    """, (key >> 32, key & 0xFFFFFFFF))
+    return [f"{name or 'unnamed'} (pid {pid})" for pid, name in cur.fetchall()]
+
+def try_acquire(cur, resources):
+    """Try to take every lock; on failure release what was taken and return the busy one"""
+    acquired = []
+    for resource in resources:
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (lock_key(resource),))
+        if not cur.fetchone()[0]:
+            for taken in reversed(acquired):
+                cur.execute("SELECT pg_advisory_unlock(%s)", (lock_key(taken),))
+            return resource
+        acquired.append(resource)
+    return None
+
+@contextmanager
+def job_lock(db_config, job_name, tables=(), wait=False, timeout=None, poll_interval=2.0):
+    """Hold the job's advisory locks for the duration of the with-block
+
+    With wait=False a busy lock raises JobLockBusy immediately; with wait=True
+    the locks are retried until they are free or `timeout` seconds pass.
+    """
+    resources = lock_resources(job_name, tables)
+    conn = psycopg2.connect(**db_config)
+    conn.autocommit = True
+    cur = conn.cursor()
+    started = time.monotonic()
+
+    try:
+        cur.execute("SET application_name = %s", (f"{WAITING_PREFIX}{job_name}"[:63],))
+        while True:
+            busy = try_acquire(cur, resources)
+            if busy is None:
+                break
+            holders = lock_holders(cur, busy)
+            if not wait or (timeout is not None and time.monotonic() - started >= timeout):
+                raise JobLockBusy(busy, holders)
+            print(f"⏳ Waiting for {busy} (held by {', '.join(holders) or 'another session'})...")
+            time.sleep(poll_interval)
+
+        cur.execute("SET application_name = %s", (f"{APPLICATION_PREFIX}{job_name}"[:63],))
+        print(f"🔒 Acquired job lock '{job_name}' ({', '.join(resources)})")
+        yield conn
+    finally:
+        # Closing the session releases every advisory lock it holds
+        cur.close()
+        conn.close()
+
+def show_status(db_config):
+    """List running and waiting jobs with how long they have been at it"""
+    conn = psycopg2.connect(**db_config)
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT a.pid,
+               a.application_name,
+               a.datname,
+               a.usename,
+               a.client_addr,
+               now() - a.backend_start AS running_for,
+               COUNT(l.*) FILTER (WHERE l.locktype = 'advisory' AND l.granted) AS locks_held
+        FROM pg_stat_activity a
+        LEFT JOIN pg_locks l ON l.pid = a.pid
+        WHERE a.application_name LIKE %s OR a.application_name LIKE %s
+        GROUP BY a.pid, a.application_name, a.datname, a.usename, a.client_addr, a.backend_start
+        ORDER BY a.backend_start
+    """, (f"{APPLICATION_PREFIX}%", f"{WAITING_PREFIX}%"))
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    print("📋 LifeMaps ops jobs")
+    print("=" * 60)
+    if not rows:
+        print("✅ No jobs running")
+        return
+
+    for pid, app_name, database, user, client, running_for, locks_held in rows:
+        if app_name.startswith(APPLICATION_PREFIX):
+            state, job = '🔒 running', app_name[len(APPLICATION_PREFIX):]
+        else:
+            state, job = '⏳ waiting', app_name[len(WAITING_PREFIX):]
+        seconds = int(running_for.total_seconds())
+        duration = f"{seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+        print(f"  {state} {job}: pid {pid}, {database} as {user}"
+              f"{f' from {client}' if client else ''}, {duration}, {locks_held} lock(s)")
+
+if __name__ == "__main__":
+    load_dotenv()
+    if len(sys.argv) > 1 and sys.argv[1] == 'status':
+        show_status(get_db_config())
+    else:
+        print("Usage: python job_locks.py status")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Migrate custom_data earmarks into the normalized asset_goal_link table
+
+Earmarks are stored twice: as assets.custom_data.goalEarmarks
+([{goalId, goalName, percent}]) and as financial_goal.custom_data.linkedAssets
+([{assetId, assetName, percent}]). This script extracts both sides in user_id
+chunks, reconciles them and writes one asset_goal_link row per pair:
+
+- pairs found on only one side are kept
+- when both sides disagree on percent, the asset side wins (--prefer goal flips it)
+- references to missing assets/goals or to another user's rows are dropped
+- repeated entries for the same pair keep the first one, like the frontend's find()
+
+Re-running is safe: each chunk's links are replaced by what the JSON says now.
+The compatibility views asset_goal_earmarks / goal_linked_assets rebuild the
+JSON shapes from the table.
+
+Usage:
+    python migrate_asset_goal_links.py
+    python migrate_asset_goal_links.py --chunk-size 200 --prefer goal
+    python migrate_asset_goal_links.py --dry-run
+"""
+
+import argparse
+import os
+import time
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+
+SCHEMA_FILE = "backend/scripts/2025-10-19_create_asset_goal_link_table.sql"
+
+# Integer ids and numeric percents as the autosave code writes them, which may
+# be JSON numbers or strings; anything else is treated as garbage
+ID_PATTERN = r'^\s*\d{1,9}\s*$'
+PERCENT_PATTERN = r'^\s*\d+(\.\d+)?\s*$'
+
+CANDIDATES_SQL = """
+CREATE TEMP TABLE link_candidates ON COMMIT DROP AS
+WITH asset_side AS (
+    SELECT DISTINCT ON (a.id, (e.item->>'goalId')::int)
+        a.id AS asset_id,
+        (e.item->>'goalId')::int AS goal_id,
+        CASE WHEN e.item->>'percent' ~ %(percent_pattern)s
+             THEN (e.item->>'percent')::numeric ELSE 0 END AS percent
+    FROM assets a
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(a.custom_data->'goalEarmarks') = 'array'
+             THEN a.custom_data->'goalEarmarks' ELSE '[]'::jsonb END
+    ) WITH ORDINALITY AS e(item, position)
+    WHERE a.user_id >= %(start)s AND a.user_id < %(end)s
+      AND e.item->>'goalId' ~ %(id_pattern)s
+    ORDER BY a.id, (e.item->>'goalId')::int, e.position
+),
+goal_side AS (
+    SELECT DISTINCT ON ((e.item->>'assetId')::int, g.id)
+        (e.item->>'assetId')::int AS asset_id,
+        g.id AS goal_id,
+        CASE WHEN e.item->>'percent' ~ %(percent_pattern)s
+             THEN (e.item->>'percent')::numeric ELSE 0 END AS percent
+    FROM financial_goal g
+    CROSS JOIN LATERAL jsonb_array_elements(
+        CASE WHEN jsonb_typeof(g.custom_data->'linkedAssets') = 'array'
+             THEN g.custom_data->'linkedAssets' ELSE '[]'::jsonb END
+    ) WITH ORDINALITY AS e(item, position)
+    WHERE g.user_id >= %(start)s AND g.user_id < %(end)s
+      AND e.item->>'assetId' ~ %(id_pattern)s
+    ORDER BY (e.item->>'assetId')::int, g.id, e.position
+)
+SELECT
+    COALESCE(s.asset_id, t.asset_id) AS asset_id,
+    COALESCE(s.goal_id, t.goal_id) AS goal_id,
+    s.percent AS asset_percent,
+    t.percent AS goal_percent,
+    a.user_id AS asset_user_id,
+    g.user_id AS goal_user_id
+FROM asset_side s
+FULL JOIN goal_side t ON t.asset_id = s.asset_id AND t.goal_id = s.goal_id
+LEFT JOIN assets a ON a.id = COALESCE(s.asset_id, t.asset_id)
+LEFT JOIN financial_goal g ON g.id = COALESCE(s.goal_id, t.goal_id)
+"""
+
+STATS_SQL = """
+SELECT
+    COUNT(*) FILTER (WHERE asset_user_id IS NULL OR goal_user_id IS NULL) AS orphaned,
+    COUNT(*) FILTER (WHERE asset_user_id <> goal_user_id) AS cross_user,
+    COUNT(*) FILTER (WHERE asset_user_id = goal_user_id AND goal_percent IS NULL) AS asset_only,
+    COUNT(*) FILTER (WHERE asset_user_id = goal_user_id AND asset_percent IS NULL) AS goal_only,
+    COUNT(*) FILTER (WHERE asset_user_id = goal_user_id AND asset_percent = goal_percent) AS agreed,
+    COUNT(*) FILTER (WHERE asset_user_id = goal_user_id AND asset_percent <> goal_percent) AS conflicts
+FROM link_candidates
+"""
+
+STAT_LABELS = ['orphaned', 'cross_user', 'asset_only', 'goal_only', 'agreed', 'conflicts']
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def create_schema(conn):
+    """Create asset_goal_link, its indexes and the compatibility views"""
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        sql = f.read()
+    with conn.cursor() as cur:
+        cur.execute(sql)
+    conn.commit()
+    print("✅ asset_goal_link table and views ready")
+
+def migrate_chunk(cur, start, end, prefer, dry_run):
+    """Reconcile one user_id range; returns (stats, written, removed)"""
+    cur.execute(CANDIDATES_SQL, {
+        'start': start, 'end': end,
+        'id_pattern': ID_PATTERN, 'percent_pattern': PERCENT_PATTERN,
+    })
+    cur.execute(STATS_SQL)
+    stats = dict(zip(STAT_LABELS, cur.fetchone()))
+    if dry_run:
+        return stats, 0, 0
+
+    first, second = ('asset_percent', 'goal_percent') if prefer == 'asset' else ('goal_percent', 'asset_percent')
+    cur.execute(f"""
+        INSERT INTO asset_goal_link (asset_id, goal_id, user_id, percent)
+        SELECT asset_id, goal_id, asset_user_id, COALESCE({first}, {second})
+        FROM link_candidates
+        WHERE asset_user_id = goal_user_id
+        ON CONFLICT (asset_id, goal_id) DO UPDATE
+        SET percent = EXCLUDED.percent, user_id = EXCLUDED.user_id, updated_at = NOW()
+        WHERE asset_goal_link.percent IS DISTINCT FROM EXCLUDED.percent
+           OR asset_goal_link.user_id IS DISTINCT FROM EXCLUDED.user_id
+    """)
+    written = cur.rowcount
+
+    # Links whose JSON entries have since been removed on both sides
+    cur.execute("""
+        DELETE FROM asset_goal_link l
+        WHERE l.user_id >= %s AND l.user_id < %s
+          AND NOT EXISTS (
+              SELECT 1 FROM link_candidates c
+              WHERE c.asset_id = l.asset_id AND c.goal_id = l.goal_id
+                AND c.asset_user_id = c.goal_user_id
+          )
+    """, (start, end))
+    return stats, written, cur.rowcount
+
+def migrate_links(conn, chunk_size, prefer, dry_run):
+    """Walk user_id ranges, one short transaction per chunk"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COALESCE(MIN(user_id), 0), COALESCE(MAX(user_id), -1)
+            FROM (SELECT user_id FROM assets UNION ALL SELECT user_id FROM financial_goal) ids
+        """)
+        min_user, max_user = cur.fetchone()
+    conn.commit()
+
+    mode = "Dry run over" if dry_run else "Migrating"
+    print(f"\n🔄 {mode} user_ids {min_user}..{max_user} in chunks of {chunk_size} (prefer {prefer} side)...")
+    totals = dict.fromkeys(STAT_LABELS, 0)
+    written = removed = 0
+    started = time.perf_counter()
+
+    for start in range(min_user, max_user + 1, chunk_size):
+        end = start + chunk_size
+        with conn.cursor() as cur:
+            stats, chunk_written, chunk_removed = migrate_chunk(cur, start, end, prefer, dry_run)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        for label in STAT_LABELS:
+            totals[label] += stats[label]
+        written += chunk_written
+        removed += chunk_removed
+        print(f"   📦 users {start}..{min(end, max_user + 1) - 1}: "
+              f"{stats['agreed'] + stats['asset_only'] + stats['goal_only'] + stats['conflicts']} links, "
+              f"{stats['conflicts']} conflicts, {stats['orphaned'] + stats['cross_user']} dropped")
+
+    elapsed = time.perf_counter() - started
+    print(f"\n📊 Reconciliation summary ({elapsed:.1f}s)")
+    print("=" * 60)
+    print(f"   Both sides agree:        {totals['agreed']}")
+    print(f"   Asset side only:         {totals['asset_only']}")
+    print(f"   Goal side only:          {totals['goal_only']}")
+    print(f"   Percent conflicts:       {totals['conflicts']} (resolved from the {prefer} side)")
+    print(f"   Orphaned references:     {totals['orphaned']} (dropped)")
+    print(f"   Cross-user references:   {totals['cross_user']} (dropped)")
+    if not dry_run:
+        print(f"   Rows inserted/updated:   {written}")
+        print(f"   Stale links removed:     {removed}")
+
+def show_table_summary(conn):
+    """Row counts for the link table and a sample funding join"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*), COUNT(DISTINCT asset_id), COUNT(DISTINCT goal_id) FROM asset_goal_link")
+        links, assets, goals = cur.fetchone()
+        print(f"\n📋 asset_goal_link: {links} links across {assets} assets and {goals} goals")
+
+        cur.execute("""
+            SELECT g.id, g.name, COUNT(*), SUM(a.current_value * l.percent / 100)
+            FROM asset_goal_link l
+            JOIN financial_goal g ON g.id = l.goal_id
+            JOIN assets a ON a.id = l.asset_id
+            GROUP BY g.id, g.name
+            ORDER BY COUNT(*) DESC, g.id
+            LIMIT 5
+        """)
+        for goal_id, name, count, earmarked in cur.fetchall():
+            print(f"   🎯 Goal {goal_id} ({name or 'unnamed'}): {count} assets, earmarked {float(earmarked or 0):,.0f}")
+    conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate custom_data earmarks into asset_goal_link")
+    parser.add_argument('--chunk-size', type=int, default=500, help="user ids per transaction")
+    parser.add_argument('--prefer', choices=['asset', 'goal'], default='asset',
+                        help="side whose percent wins when both sides disagree")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be written without writing")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds to wait with --wait")
+    args = parser.parse_args()
+
+    print("🔗 Migrating earmarks to asset_goal_link")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with job_lock(get_db_config(), 'migrate_asset_goal_links', tables=['asset_goal_link'],
+                      wait=args.wait, timeout=args.timeout):
+            if not args.dry_run:
+                create_schema(conn)
+            migrate_links(conn, args.chunk_size, args.prefer, args.dry_run)
+            if not args.dry_run:
+                show_table_summary(conn)
+        print("\n🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
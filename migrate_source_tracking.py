@@ -4,17 +4,28 @@ Database migration script to add source tracking columns
 Run this to add source tracking to your PostgreSQL database
 """
 
+import argparse
 import psycopg2
 import os
 from dotenv import load_dotenv
+from job_locks import job_lock, JobLockBusy
 
 # Load environment variables
 load_dotenv()
 
-def migrate_database():
-    """Add source tracking columns to the database"""
-    
-    # Database connection parameters
+# Tables this migration alters; other jobs rewriting them must not run alongside
+MIGRATED_TABLES = [
+    'financial_profile',
+    'financial_goal',
+    'financial_expense',
+    'financial_loan',
+    'assets',
+    'work_assets',
+    'user_source_preferences'
+]
+
+def get_db_config():
+    """Database connection parameters"""
     # Use DATABASE_URL if available, otherwise fall back to individual params
     database_url = os.getenv('DATABASE_URL')
     if database_url:
@@ -37,6 +48,12 @@ def migrate_database():
             'user': os.getenv('DB_USER', 'postgres'),
             'password': os.getenv('DB_PASSWORD', 'admin')
         }
+    return db_config
+
+def migrate_database():
+    """Add source tracking columns to the database"""
+    
+    db_config = get_db_config()
     
     print("🔄 Starting database migration for source tracking...")
     print(f"🔍 Connecting to database: {db_config['database']} on {db_config['host']}:{db_config['port']}")
@@ -164,7 +181,19 @@ def migrate_database():
     return True
 
 if __name__ == "__main__":
-    success = migrate_database()
+    parser = argparse.ArgumentParser(description="Add source tracking columns")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    parser.add_argument('--timeout', type=float, help="seconds to wait before giving up")
+    args = parser.parse_args()
+
+    try:
+        with job_lock(get_db_config(), 'migrate_source_tracking', tables=MIGRATED_TABLES,
+                      wait=args.wait, timeout=args.timeout):
+            success = migrate_database()
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping migration: {e}")
+        raise SystemExit(1)
+
     if success:
         print("\n🎉 Migration completed successfully!")
         print("You can now use the source tracking system in your application.")
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Suggest earmarks for the unallocated part of each asset
+
+calculateAssetEarmarking shows each asset's unallocated value, but splitting
+it across goals is left to the user. This spreads every asset's unallocated
+percent (100 minus what its goalEarmarks already use) over the user's
+underfunded goals so the total projected funding gap shrinks as much as
+possible:
+
+- goals are served in tiers: ST before LT, then high/medium/low priority;
+  a lower tier only gets what the higher ones could not use
+- earmarking 1% of an asset adds a fixed projected amount to a goal (the SIP
+  projection is linear in the earmarked share). The value of 1% of every
+  asset at every goal's horizon is one projection_engine.project() call
+- each tier is then a linear program over that matrix: maximise the gap
+  closed subject to each asset's unallocated percent and each goal's gap,
+  then, among the optimal splits, use as little of the assets as possible
+  so the lower tiers keep the rest. Both are solved with
+  scipy.optimize.linprog (HiGHS)
+- no asset ever goes past 100%; suggestions are rounded down to 0.01%
+
+Gaps come from goal_funding_projection() (funding_projection.py), so they
+already count the existing earmarks. Suggestions replace the processed
+users' rows in earmark_suggestions; nothing in custom_data is changed.
+
+Usage:
+    python optimize_earmarks.py --user 42
+    python optimize_earmarks.py --jobs 4 --chunk-size 500
+    python optimize_earmarks.py --dry-run
+"""
+
+import argparse
+import datetime
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from scipy.optimize import linprog
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+from earmark_engine import ASSET_KEY, parse_id, parse_percent
+from projection_engine import AssetArrays, project
+from validate_earmarks import user_ranges
+
+SCHEMA_FILE = Path("backend/scripts/2025-10-19_create_earmark_suggestions_table.sql")
+
+TERM_ORDER = {'ST': 0, 'LT': 1}
+PRIORITY_ORDER = {'high': 0, 'medium': 1, 'low': 2}
+MIN_PERCENT = 0.01
+
+def goal_tier(goal):
+    """Sort key of a goal's tier: term first, then priority"""
+    term = TERM_ORDER.get((goal['term'] or 'LT').upper(), 1)
+    priority = PRIORITY_ORDER.get((goal['priority'] or 'medium').lower(), 1)
+    return term, priority
+
+def solve_tier(values, available, gaps):
+    """Best fractional split of one tier on an assets x goals value-per-percent matrix
+
+    Returns [(asset_index, goal_index, percent)]; mutates available and gaps.
+    """
+    usable = (available >= MIN_PERCENT)[:, None] & (gaps > 0)[None, :] & (values > 0)
+    asset_index, goal_index = np.nonzero(usable)
+    if not len(asset_index):
+        return []
+    value = values[asset_index, goal_index]
+    pairs = np.arange(len(value))
+
+    # One row per asset (percent used <= unallocated), one per goal (value <= gap)
+    limits = np.zeros((len(available) + len(gaps), len(value)))
+    limits[asset_index, pairs] = 1
+    limits[len(available) + goal_index, pairs] = value
+    bounds = np.concatenate([available, gaps])
+
+    best = linprog(-value, A_ub=limits, b_ub=bounds, bounds=(0, None), method='highs')
+    if not best.success:
+        raise RuntimeError(f"tier LP failed: {best.message}")
+    # Same gap closed (within solver tolerance), fewest percent spent
+    lean = linprog(np.ones(len(value)), A_ub=np.vstack([limits, -value]),
+                   b_ub=np.append(bounds, best.fun * (1 - 1e-9)), bounds=(0, None), method='highs')
+    shares = lean.x if lean.success else best.x
+
+    assigned = []
+    for k in np.flatnonzero(shares >= MIN_PERCENT):
+        a, g = asset_index[k], goal_index[k]
+        # Round down to 0.01%, ignoring the solver's last digits, never past what is left
+        percent = min(math.floor(shares[k] * 100 + 1e-3), math.floor(available[a] * 100 + 1e-6)) / 100
+        if percent < MIN_PERCENT:
+            continue
+        available[a] = max(0.0, available[a] - percent)
+        gaps[g] -= percent * values[a, g]
+        assigned.append((a, g, percent))
+    return assigned
+
+def optimize_user(assets, goals, current_year):
+    """Suggestion rows for one user's assets and goal funding rows"""
+    # Unallocated share per asset, counting every entry like the frontend does
+    available = np.array([max(0.0, 100 - sum(parse_percent(e.get('percent'))
+                                              for e in ((a['custom_data'] or {}).get(ASSET_KEY) or [])
+                                              if isinstance(e, dict)))
+                          for a in assets], dtype=float)
+    current = {}
+    for asset in assets:
+        for entry in (asset['custom_data'] or {}).get(ASSET_KEY) or []:
+            if isinstance(entry, dict):
+                current.setdefault((asset['id'], parse_id(entry.get('goalId'))), parse_percent(entry.get('percent')))
+
+    suggestions = []
+    open_goals = [g for g in goals if g['target_amount'] > 0 and g['funding_gap'] > 0]
+    if not open_goals:
+        return suggestions
+    # Projected value of 1% of every asset at every goal's horizon
+    all_values = project(AssetArrays.from_rows(assets).scaled(0.01),
+                         np.array([g['years_to_target'] for g in open_goals], dtype=float), current_year)
+    for tier in sorted({goal_tier(g) for g in open_goals}):
+        columns = [i for i, g in enumerate(open_goals) if goal_tier(g) == tier]
+        tier_goals = [open_goals[i] for i in columns]
+        values = all_values[:, columns]
+        gaps = np.array([g['funding_gap'] for g in tier_goals], dtype=float)
+        for a, g, percent in solve_tier(values, available, gaps):
+            asset, goal = assets[a], tier_goals[g]
+            suggestions.append((asset['id'], goal['goal_id'], goal['user_id'],
+                                current.get((asset['id'], goal['goal_id']), 0), percent,
+                                round(float(percent * values[a, g]), 2), goal['term']))
+    return suggestions
+
+def optimize_range(db_config, start, end, current_year, dry_run):
+    """Suggestions for users start <= id < end; returns (users, suggestions, gap before, gap closed)"""
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT f.goal_id, f.user_id, f.target_amount, f.years_to_target, f.funding_gap, g.term, g.priority
+                FROM goal_funding_projection(%s, %s, %s) f
+                JOIN financial_goal g ON g.id = f.goal_id
+            """, (start, end, current_year))
+            goals = {}
+            for row in cur.fetchall():
+                goal = dict(zip(['goal_id', 'user_id', 'target_amount', 'years_to_target',
+                                 'funding_gap', 'term', 'priority'], row))
+                goals.setdefault(goal['user_id'], []).append(goal)
+            cur.execute("""
+                SELECT id, user_id, current_value, custom_data FROM assets
+                WHERE user_id >= %s AND user_id < %s ORDER BY id
+            """, (start, end))
+            assets = {}
+            for asset_id, user_id, current_value, custom_data in cur.fetchall():
+                assets.setdefault(user_id, []).append(
+                    {'id': asset_id, 'current_value': current_value, 'custom_data': custom_data})
+
+            rows = []
+            for user_id, user_goals in goals.items():
+                if assets.get(user_id):
+                    rows.extend(optimize_user(assets[user_id], user_goals, current_year))
+
+            if not dry_run:
+                cur.execute("DELETE FROM earmark_suggestions WHERE user_id >= %s AND user_id < %s", (start, end))
+                execute_values(cur, """
+                    INSERT INTO earmark_suggestions (asset_id, goal_id, user_id, current_percent,
+                                                     suggested_percent, projected_contribution, goal_term)
+                    VALUES %s
+                """, rows, page_size=1000)
+        conn.commit()
+    finally:
+        conn.close()
+
+    gap_before = sum(max(0, g['funding_gap']) for user_goals in goals.values() for g in user_goals)
+    closed = sum(row[5] for row in rows)
+    return len(goals), rows, gap_before, closed
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def create_schema(conn):
+    """Create earmark_suggestions if missing"""
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_FILE.read_text(encoding='utf-8'))
+    conn.commit()
+    print(f"✅ Applied {SCHEMA_FILE}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Suggest earmarks for unallocated asset value")
+    parser.add_argument('--user', type=int, help="optimize a single user and print the suggestions")
+    parser.add_argument('--jobs', type=int, default=4, help="user ranges optimized in parallel")
+    parser.add_argument('--chunk-size', type=int, default=500, help="user ids per range")
+    parser.add_argument('--dry-run', action='store_true', help="compute without writing suggestions")
+    parser.add_argument('--create-schema', action='store_true', help="create the suggestions table first")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    print("🧭 Optimizing earmarks")
+    print("=" * 60)
+
+    load_dotenv()
+    db_config = get_db_config()
+    current_year = datetime.date.today().year
+    if args.create_schema:
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            create_schema(conn)
+        finally:
+            conn.close()
+
+    try:
+        with job_lock(db_config, 'optimize_earmarks', tables=['earmark_suggestions'], wait=args.wait):
+            started = time.perf_counter()
+            ranges = [(args.user, args.user + 1)] if args.user else user_ranges(db_config, args.chunk_size)
+            print(f"📦 {len(ranges)} user ranges on {args.jobs} workers")
+            users, suggestions, gap_before, closed = 0, [], 0.0, 0.0
+            with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+                futures = [pool.submit(optimize_range, db_config, start, end, current_year, args.dry_run)
+                           for start, end in ranges]
+                for future in futures:
+                    range_users, rows, range_gap, range_closed = future.result()
+                    users += range_users
+                    suggestions.extend(rows)
+                    gap_before += range_gap
+                    closed += range_closed
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+
+    if args.user:
+        for asset_id, goal_id, _, current, percent, contribution, term in suggestions:
+            print(f"   💡 asset {asset_id} -> goal {goal_id} ({term}): "
+                  f"{current:g}% + {percent:g}% adds ₹{contribution:,.0f}")
+
+    print(f"\n📊 {users} users, {len(suggestions)} suggestions ({time.perf_counter() - started:.2f}s)")
+    print(f"   Projected gap:  ₹{gap_before:,.0f}")
+    print(f"   Closed:         ₹{closed:,.0f} ({closed / gap_before * 100 if gap_before else 0:.1f}%)")
+    if args.dry_run:
+        print("\n🔍 Dry run: no suggestions written")
+    print("\n🎉 Done!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Convert the user-scoped financial tables to PARTITION BY HASH (user_id)
+
+Every hot query filters by user_id, so hash partitioning keeps each user's rows
+in one small partition (smaller vacuums, smaller indexes, better locality).
+The conversion runs online, table by table:
+
+1. create <table>_partitioned with the same columns, defaults, checks and
+   foreign keys, and a primary key of (id, user_id)
+2. mirror every write on the old table into the new one with a trigger
+3. copy existing rows in id-range chunks, one short transaction per chunk
+4. build the secondary indexes partition by partition and attach them
+5. reconcile, then in one short transaction: lock, check row counts, swap
+   names, move the id sequence and triggers over; the old heap is kept as
+   <table>_unpartitioned
+6. check with EXPLAIN that the per-user queries prune to a single partition
+
+Usage:
+    python partition_user_tables.py --partitions 16
+    python partition_user_tables.py --tables assets,financial_goal --chunk-size 2000
+    python partition_user_tables.py --verify-only
+    python partition_user_tables.py --drop-old
+"""
+
+import argparse
+import json
+import os
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+USER_TABLES = [
+    'assets',
+    'financial_goal',
+    'financial_expense',
+    'financial_loan',
+    'financial_insurance',
+    'work_assets',
+]
+
+# Per-user lookups issued by the API and the maintenance scripts
+PRUNING_QUERIES = {
+    'assets': "SELECT id, name, tag, current_value, custom_data FROM assets WHERE user_id = %s",
+    'financial_goal': "SELECT * FROM financial_goal WHERE user_id = %s ORDER BY id",
+    'financial_expense': "SELECT * FROM financial_expense WHERE user_id = %s",
+    'financial_loan': "SELECT * FROM financial_loan WHERE user_id = %s",
+    'financial_insurance': "SELECT * FROM financial_insurance WHERE user_id = %s",
+    'work_assets': "SELECT * FROM work_assets WHERE user_id = %s",
+}
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def table_kind(cur, table):
+    """Return 'r' for a plain table, 'p' for a partitioned one, None if missing"""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (f'public.{table}',))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def copyable_columns(cur, table):
+    """Columns that can be written explicitly (generated columns are skipped)"""
+    cur.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+def dependent_objects(cur, table):
+    """Foreign keys and views that point at the table's OID and would follow a rename"""
+    dependents = []
+    # A foreign key into this table needs a unique index on id alone, which a
+    # hash-partitioned table cannot provide
+    cur.execute("""
+        SELECT conrelid::regclass::text, conname
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = to_regclass(%s)
+    """, (f'public.{table}',))
+    for referencing, name in cur.fetchall():
+        dependents.append(f"referenced by foreign key {name} on {referencing}")
+
+    cur.execute("""
+        SELECT DISTINCT v.relname
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+        WHERE d.refobjid = to_regclass(%s) AND v.oid <> d.refobjid
+    """, (f'public.{table}',))
+    for (view,) in cur.fetchall():
+        dependents.append(f"view {view} depends on it")
+    return dependents
+
+def check_blockers(cur, table):
+    """Return the reasons (if any) this table cannot be partitioned safely"""
+    blockers = []
+
+    cur.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id IS NULL")
+    nulls = cur.fetchone()[0]
+    if nulls:
+        blockers.append(f"{nulls} rows have NULL user_id")
+
+    blockers.extend(dependent_objects(cur, table))
+
+    cur.execute("""
+        SELECT indexrelid::regclass::text
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attname = 'user_id'
+        WHERE i.indrelid = to_regclass(%s) AND i.indisunique AND NOT i.indisprimary
+          AND NOT (a.attnum = ANY(i.indkey))
+    """, (f'public.{table}',))
+    for (index,) in cur.fetchall():
+        blockers.append(f"unique index {index} does not include user_id")
+
+    return blockers
+
+def secondary_indexes(cur, table):
+    """Index definitions on the old table, excluding the primary key"""
+    cur.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary
+        ORDER BY c.relname
+    """, (f'public.{table}',))
+    return cur.fetchall()
+
+def user_triggers(cur, table):
+    """CREATE TRIGGER statements for the table's own (non-internal) triggers"""
+    cur.execute("""
+        SELECT tgname, pg_get_triggerdef(oid)
+        FROM pg_trigger
+        WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal
+        ORDER BY tgname
+    """, (f'public.{table}',))
+    return [(name, definition) for name, definition in cur.fetchall()
+            if not name.startswith('mirror_to_partitioned')]
+
+def create_partitioned_table(conn, table, partitions):
+    """Create <table>_partitioned with its hash partitions and the (id, user_id) key"""
+    new_table = f"{table}_partitioned"
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE {new_table} (
+                LIKE {table}
+                INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED
+                INCLUDING COMMENTS INCLUDING STORAGE
+            ) PARTITION BY HASH (user_id)
+        """)
+        cur.execute(f"ALTER TABLE {new_table} ALTER COLUMN user_id SET NOT NULL")
+        for remainder in range(partitions):
+            cur.execute(f"""
+                CREATE TABLE {table}_p{remainder} PARTITION OF {new_table}
+                FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})
+            """)
+        # The partition key has to be part of every unique constraint
+        cur.execute(f"ALTER TABLE {new_table} ADD CONSTRAINT {table}_part_pkey PRIMARY KEY (id, user_id)")
+
+        cur.execute("""
+            SELECT conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE conrelid = to_regclass(%s) AND contype = 'f'
+        """, (f'public.{table}',))
+        for name, definition in cur.fetchall():
+            cur.execute(f"ALTER TABLE {new_table} ADD CONSTRAINT {name} {definition}")
+    conn.commit()
+    print(f"   ✅ Created {new_table} with {partitions} hash partitions")
+
+def install_mirror_trigger(conn, table, columns):
+    """Mirror inserts, updates and deletes on the old table into the new one"""
+    new_table = f"{table}_partitioned"
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"NEW.{column}" for column in columns)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column not in ('id', 'user_id'))
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION mirror_to_partitioned_{table}()
+            RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {new_table} WHERE id = OLD.id AND user_id = OLD.user_id
+                      AND (TG_OP = 'DELETE' OR OLD.user_id IS DISTINCT FROM NEW.user_id);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {new_table} ({column_list}) VALUES ({new_values})
+                    ON CONFLICT (id, user_id) DO UPDATE SET {updates};
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute(f"DROP TRIGGER IF EXISTS mirror_to_partitioned ON {table}")
+        cur.execute(f"""
+            CREATE TRIGGER mirror_to_partitioned
+                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                FOR EACH ROW
+                EXECUTE FUNCTION mirror_to_partitioned_{table}()
+        """)
+    conn.commit()
+    print(f"   ✅ Mirroring live writes from {table}")
+
+def copy_chunks(conn, table, columns, chunk_size):
+    """Copy existing rows by id range; rows already mirrored are left alone"""
+    new_table = f"{table}_partitioned"
+    column_list = ", ".join(columns)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM {table}")
+        min_id, max_id = cur.fetchone()
+    conn.commit()
+
+    copied = 0
+    for start in range(min_id, max_id + 1, chunk_size):
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO {new_table} ({column_list})
+                SELECT {column_list} FROM {table}
+                WHERE id >= %s AND id < %s
+                ON CONFLICT (id, user_id) DO NOTHING
+            """, (start, start + chunk_size))
+            copied += cur.rowcount
+        conn.commit()
+        print(f"   📦 ids {start}..{min(start + chunk_size, max_id + 1) - 1}: {copied} rows copied so far")
+    return copied
+
+def build_indexes(conn, table, partitions, indexes):
+    """Build each secondary index partition by partition, then attach to the parent"""
+    new_table = f"{table}_partitioned"
+    built = []
+    with conn.cursor() as cur:
+        for name, definition in indexes:
+            parent_index = f"{name}_part"
+            # "CREATE [UNIQUE] INDEX name ON public.table USING ..." -> method and key
+            body = definition.split(f" ON public.{table} ", 1)[1]
+            unique = "UNIQUE " if definition.startswith("CREATE UNIQUE") else ""
+            cur.execute(f"CREATE {unique}INDEX {parent_index} ON ONLY {new_table} {body}")
+            for remainder in range(partitions):
+                partition = f"{table}_p{remainder}"
+                partition_index = f"{partition}_{name}"[:63]
+                cur.execute(f"CREATE {unique}INDEX IF NOT EXISTS {partition_index} ON {partition} {body}")
+                cur.execute(f"ALTER INDEX {parent_index} ATTACH PARTITION {partition_index}")
+            conn.commit()
+            built.append((name, parent_index))
+            print(f"   ✅ Index {name}: built on {partitions} partitions")
+    return built
+
+def reconcile(cur, table, columns):
+    """Catch rows a concurrent delete raced past the chunk copy; returns (removed, added)"""
+    new_table = f"{table}_partitioned"
+    column_list = ", ".join(columns)
+    cur.execute(f"""
+        DELETE FROM {new_table} n
+        WHERE NOT EXISTS (SELECT 1 FROM {table} o WHERE o.id = n.id AND o.user_id = n.user_id)
+    """)
+    removed = cur.rowcount
+    cur.execute(f"""
+        INSERT INTO {new_table} ({column_list})
+        SELECT {column_list} FROM {table}
+        ON CONFLICT (id, user_id) DO NOTHING
+    """)
+    return removed, cur.rowcount
+
+def row_counts(cur, table):
+    cur.execute(f"SELECT (SELECT COUNT(*) FROM {table}), (SELECT COUNT(*) FROM {table}_partitioned)")
+    return cur.fetchone()
+
+def swap_tables(conn, table, columns, built_indexes, triggers):
+    """Reconcile, then swap names in one short transaction, returning the lock time in ms"""
+    new_table = f"{table}_partitioned"
+    old_table = f"{table}_unpartitioned"
+    # The full reconcile runs before the lock; the mirror trigger keeps both
+    # tables in step from here on, so the locked transaction only has to check
+    with conn.cursor() as cur:
+        removed, added = reconcile(cur, table, columns)
+    conn.commit()
+
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        locked = time.perf_counter()
+        cur.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+
+        old_count, new_count = row_counts(cur, table)
+        if old_count != new_count:
+            print(f"   ⚠️  Row counts drifted ({old_count} vs {new_count}) - reconciling under the lock")
+            late_removed, late_added = reconcile(cur, table, columns)
+            removed, added = removed + late_removed, added + late_added
+            old_count, new_count = row_counts(cur, table)
+            if old_count != new_count:
+                raise RuntimeError(f"row counts differ after reconcile ({old_count} vs {new_count})")
+
+        cur.execute(f"DROP TRIGGER mirror_to_partitioned ON {table}")
+        cur.execute(f"DROP FUNCTION mirror_to_partitioned_{table}()")
+
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (f'public.{table}',))
+        sequence = cur.fetchone()[0]
+
+        cur.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        cur.execute(f"ALTER TABLE {old_table} RENAME CONSTRAINT {table}_pkey TO {old_table}_pkey")
+        for name, parent_index in built_indexes:
+            cur.execute(f"ALTER INDEX {name} RENAME TO {name}_unpartitioned")
+            cur.execute(f"ALTER INDEX {parent_index} RENAME TO {name}")
+
+        cur.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+        cur.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {table}_part_pkey TO {table}_pkey")
+        if sequence:
+            cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+        for name, definition in triggers:
+            cur.execute(definition)
+    conn.commit()
+    lock_ms = (time.perf_counter() - locked) * 1000
+    print(f"   🔀 Swapped {table} (reconciled -{removed}/+{added} rows, exclusive lock held {lock_ms:.0f} ms)")
+    return lock_ms
+
+def scanned_relations(plan):
+    """All relation names a JSON EXPLAIN plan touches"""
+    relations = set()
+    if 'Relation Name' in plan:
+        relations.add(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        relations |= scanned_relations(child)
+    return relations
+
+def verify_pruning(conn, tables):
+    """EXPLAIN each per-user query and check that it touches a single partition"""
+    print("\n🔍 Checking partition pruning for per-user queries...")
+    all_pruned = True
+    with conn.cursor() as cur:
+        for table in tables:
+            if table_kind(cur, table) != 'p':
+                print(f"   ⏭️  {table} is not partitioned")
+                continue
+            cur.execute(f"SELECT user_id FROM {table} LIMIT 1")
+            row = cur.fetchone()
+            user_id = row[0] if row else 1
+            cur.execute("EXPLAIN (FORMAT JSON) " + PRUNING_QUERIES[table], (user_id,))
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            relations = scanned_relations(plan[0]['Plan'])
+            if len(relations) == 1:
+                print(f"   ✅ {table}: user {user_id} -> {relations.pop()}")
+            else:
+                all_pruned = False
+                print(f"   ❌ {table}: user {user_id} scans {len(relations)} relations: {', '.join(sorted(relations))}")
+    conn.rollback()
+    return all_pruned
+
+def partition_table(conn, table, partitions, chunk_size):
+    """Run the full online conversion for one table"""
+    print(f"\n📋 {table}")
+    with conn.cursor() as cur:
+        kind = table_kind(cur, table)
+        if kind is None:
+            print("   ⏭️  Table does not exist")
+            return None
+        if kind == 'p':
+            print("   ⏭️  Already partitioned")
+            return None
+        if table_kind(cur, f"{table}_partitioned") or table_kind(cur, f"{table}_unpartitioned"):
+            print(f"   ❌ Leftover {table}_partitioned/{table}_unpartitioned - clean it up first")
+            return None
+        blockers = check_blockers(cur, table)
+        columns = copyable_columns(cur, table)
+        indexes = secondary_indexes(cur, table)
+        triggers = user_triggers(cur, table)
+    conn.commit()
+
+    if blockers:
+        for blocker in blockers:
+            print(f"   ❌ Cannot partition: {blocker}")
+        return None
+
+    try:
+        create_partitioned_table(conn, table, partitions)
+        install_mirror_trigger(conn, table, columns)
+        copied = copy_chunks(conn, table, columns, chunk_size)
+        built = build_indexes(conn, table, partitions, indexes)
+        lock_ms = swap_tables(conn, table, columns, built, triggers)
+        print(f"   🎉 {table}: {copied} rows moved, old heap kept as {table}_unpartitioned")
+        return lock_ms
+    except Exception as e:
+        conn.rollback()
+        print(f"   ❌ Conversion failed: {e}")
+        print(f"   ↩️  Rolling back: dropping {table}_partitioned")
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TRIGGER IF EXISTS mirror_to_partitioned ON {table}")
+            cur.execute(f"DROP FUNCTION IF EXISTS mirror_to_partitioned_{table}()")
+            cur.execute(f"DROP TABLE IF EXISTS {table}_partitioned")
+        conn.commit()
+        return None
+
+def drop_old_tables(conn, tables):
+    """Drop the <table>_unpartitioned heaps kept for rollback"""
+    with conn.cursor() as cur:
+        for table in tables:
+            if table_kind(cur, f"{table}_unpartitioned"):
+                cur.execute(f"DROP TABLE {table}_unpartitioned")
+                print(f"   🗑️  Dropped {table}_unpartitioned")
+    conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash-partition the user-scoped tables by user_id")
+    parser.add_argument('--tables', default=','.join(USER_TABLES), help="comma-separated tables")
+    parser.add_argument('--partitions', type=int, default=16, help="number of hash partitions")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="rows per copy transaction")
+    parser.add_argument('--verify-only', action='store_true', help="only check partition pruning")
+    parser.add_argument('--drop-old', action='store_true', help="drop the *_unpartitioned tables")
+    args = parser.parse_args()
+
+    tables = [table.strip() for table in args.tables.split(',') if table.strip()]
+    unknown = [table for table in tables if table not in USER_TABLES]
+    if unknown:
+        print(f"❌ Unsupported tables: {', '.join(unknown)}")
+        return
+
+    print("🧩 Hash-partitioning user-scoped tables")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        if args.drop_old:
+            drop_old_tables(conn, tables)
+            return
+
+        if not args.verify_only:
+            lock_times = {}
+            for table in tables:
+                lock_ms = partition_table(conn, table, args.partitions, args.chunk_size)
+                if lock_ms is not None:
+                    lock_times[table] = lock_ms
+            if lock_times:
+                print("\n⏱️  Exclusive lock time per swap:")
+                for table, lock_ms in lock_times.items():
+                    print(f"   - {table}: {lock_ms:.0f} ms")
+
+        if verify_pruning(conn, tables):
+            print("\n✅ Every per-user query prunes to one partition")
+        else:
+            print("\n⚠️  Some per-user queries scan more than one partition")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
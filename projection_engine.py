@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Vectorized SIP projections: every asset to every horizon in one call
+
+calculateSIPProjection exists twice in the frontend and the copies differ:
+
+- 'goals' (src/lib/goalCalculations.js, also ported in refresh_goal_funding.py
+  and lifemaps_sip_projection()): lump sum compounds monthly, the SIP stops at
+  the start of its expiry year and the pot then compounds monthly
+- 'charts' (src/lib/chartCalculations.js, used by calculateGoalsProgress):
+  lump sum compounds yearly, the SIP stops at its expiry month and the pot
+  then compounds yearly
+
+project() evaluates either one over NumPy arrays: asset parameters broadcast
+against horizons, so an (assets,) x (horizons,) call returns an
+(assets, horizons) matrix. Frequencies map to monthly factors through a
+lookup array, expiry dates become integer arrays once, and the whole
+computation is a handful of array expressions.
+
+Usage:
+    python projection_engine.py --years 2030,2035,2040
+    python projection_engine.py --horizon 30 --variant charts
+    python projection_engine.py --benchmark
+"""
+
+import argparse
+import datetime
+import os
+import re
+import time
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+from earmark_engine import parse_percent
+from refresh_goal_funding import MONTHLY_FACTOR, sip_projection
+
+# Index 0 is the fallback for unknown frequencies (no SIP, like the switch default)
+FREQUENCIES = ['', *MONTHLY_FACTOR]
+FREQUENCY_FACTORS = np.array([0.0, *MONTHLY_FACTOR.values()])
+FREQUENCY_CODES = {name: code for code, name in enumerate(FREQUENCIES)}
+
+DATE_PATTERN = re.compile(r'^\s*(\d{4})(?:-(\d{1,2}))?')
+
+class AssetArrays:
+    """Projection inputs of many assets as parallel NumPy arrays
+
+    Built the way the frontend reads custom_data: parseFloat(x) || 0,
+    expectedReturn || 5, sipFrequency || 'Monthly'. Expiry is split into year
+    and month (1-12); has_expiry is False for an empty date and invalid for
+    one that does not parse (new Date() would give NaN).
+    """
+
+    def __init__(self, ids, initial, sip_amount, frequency, annual_rate, expiry_year, expiry_month,
+                 has_expiry, valid_expiry):
+        self.ids = ids
+        self.initial = initial
+        self.sip_amount = sip_amount
+        self.frequency = frequency
+        self.annual_rate = annual_rate
+        self.expiry_year = expiry_year
+        self.expiry_month = expiry_month
+        self.has_expiry = has_expiry
+        self.valid_expiry = valid_expiry
+
+    @classmethod
+    def from_rows(cls, rows):
+        """rows: dicts with id, current_value and custom_data"""
+        count = len(rows)
+        initial = np.zeros(count)
+        sip_amount = np.zeros(count)
+        frequency = np.zeros(count, dtype=np.int64)
+        annual_rate = np.zeros(count)
+        expiry_year = np.zeros(count, dtype=np.int64)
+        expiry_month = np.ones(count, dtype=np.int64)
+        has_expiry = np.zeros(count, dtype=bool)
+        valid_expiry = np.ones(count, dtype=bool)
+        for i, row in enumerate(rows):
+            custom = row.get('custom_data') or {}
+            initial[i] = float(row.get('current_value') or 0)
+            sip_amount[i] = parse_percent(custom.get('sipAmount'))
+            frequency[i] = FREQUENCY_CODES.get(custom.get('sipFrequency') or 'Monthly', 0)
+            annual_rate[i] = (parse_percent(custom.get('expectedReturn')) or 5) / 100
+            expiry = custom.get('sipExpiryDate') or ''
+            if expiry:
+                has_expiry[i] = True
+                match = DATE_PATTERN.match(str(expiry))
+                if match:
+                    expiry_year[i] = int(match.group(1))
+                    expiry_month[i] = int(match.group(2) or 1)
+                else:
+                    valid_expiry[i] = False
+        return cls([row.get('id') for row in rows], initial, sip_amount, frequency, annual_rate,
+                   expiry_year, expiry_month, has_expiry, valid_expiry)
+
+    def scaled(self, factor):
+        """Same assets with initial value and SIP multiplied by factor (e.g. percent / 100)"""
+        return AssetArrays(self.ids, self.initial * factor, self.sip_amount * factor, self.frequency,
+                           self.annual_rate, self.expiry_year, self.expiry_month, self.has_expiry,
+                           self.valid_expiry)
+
+def project(assets, years, current_year=None, current_month=None, variant='goals'):
+    """Projected value of every asset at every horizon
+
+    years: horizons in whole years, any shape broadcastable against
+    (assets, 1) - e.g. a 1-D array gives an (assets, horizons) matrix.
+    current_month (1-12) only matters for the 'charts' variant.
+    """
+    today = datetime.date.today()
+    current_year = current_year or today.year
+    current_month = current_month or today.month
+
+    column = (slice(None), np.newaxis)
+    years = np.asarray(years, dtype=float)
+    initial = assets.initial[column]
+    sip = assets.sip_amount[column]
+    rate = assets.annual_rate[column]
+    monthly_rate = rate / 12
+    monthly_sip = sip * FREQUENCY_FACTORS[assets.frequency][column]
+    total_months = years * 12
+
+    if variant == 'goals':
+        expiry_months = np.maximum(0, assets.expiry_year - current_year)[column] * 12.0
+    elif variant == 'charts':
+        expiry_months = ((assets.expiry_year - current_year) * 12 + assets.expiry_month - current_month)[column]
+    else:
+        raise ValueError(f"unknown variant {variant!r}")
+    sip_months = np.where(assets.has_expiry[column],
+                          np.where(assets.valid_expiry[column], np.clip(expiry_months, 0, total_months), 0),
+                          total_months)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = np.where(monthly_rate == 0, sip_months,
+                           ((1 + monthly_rate) ** sip_months - 1) / monthly_rate)
+    pot = np.where((monthly_sip > 0) & (sip_months > 0), monthly_sip * annuity, 0.0)
+    if variant == 'goals':
+        lump = initial * (1 + monthly_rate) ** total_months
+        pot = pot * (1 + monthly_rate) ** (total_months - sip_months)
+    else:
+        lump = initial * (1 + rate) ** years
+        pot = pot * (1 + rate) ** ((total_months - sip_months) / 12)
+
+    return np.where(sip <= 0, initial * (1 + rate) ** years, lump + pot)
+
+def load_assets(conn, user_ids=None):
+    """AssetArrays for every asset (or the given users'), ordered by id"""
+    with conn.cursor() as cur:
+        if user_ids is None:
+            cur.execute("SELECT id, current_value, custom_data FROM assets ORDER BY id")
+        else:
+            cur.execute("SELECT id, current_value, custom_data FROM assets WHERE user_id = ANY(%s) ORDER BY id",
+                        (list(user_ids),))
+        rows = [{'id': i, 'current_value': v, 'custom_data': c} for i, v, c in cur.fetchall()]
+    conn.commit()
+    return AssetArrays.from_rows(rows)
+
+def per_asset_loop(assets, years, current_year):
+    """The 'goals' formula one asset and horizon at a time, for comparison"""
+    result = np.zeros((len(assets.ids), len(years)))
+    for i in range(len(assets.ids)):
+        expiry = ''
+        if assets.has_expiry[i]:
+            expiry = f"{assets.expiry_year[i]:04d}" if assets.valid_expiry[i] else 'invalid'
+        for j, horizon in enumerate(years):
+            result[i, j] = sip_projection(
+                initial=assets.initial[i],
+                sip_amount=assets.sip_amount[i],
+                sip_frequency=FREQUENCIES[assets.frequency[i]] or 'Unknown',
+                annual_rate=assets.annual_rate[i],
+                years=int(horizon),
+                sip_expiry_date=expiry,
+                current_year=current_year,
+            )
+    return result
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Project every asset to every target year")
+    parser.add_argument('--years', help="comma-separated target years (default: the next --horizon years)")
+    parser.add_argument('--horizon', type=int, default=30, help="years ahead when --years is not given")
+    parser.add_argument('--variant', choices=['goals', 'charts'], default='goals',
+                        help="which frontend copy of calculateSIPProjection to follow")
+    parser.add_argument('--benchmark', action='store_true', help="compare with a per-asset loop")
+    args = parser.parse_args()
+
+    print("📈 Projecting assets")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        started = time.perf_counter()
+        assets = load_assets(conn)
+        loaded = time.perf_counter() - started
+    finally:
+        conn.close()
+
+    current_year = datetime.date.today().year
+    if args.years:
+        target_years = [int(year) for year in args.years.split(',')]
+    else:
+        target_years = list(range(current_year + 1, current_year + args.horizon + 1))
+    horizons = np.array([max(1, year - current_year) for year in target_years])
+
+    started = time.perf_counter()
+    matrix = project(assets, horizons, current_year, variant=args.variant)
+    elapsed = time.perf_counter() - started
+    print(f"📦 {len(assets.ids)} assets loaded in {loaded:.2f}s")
+    print(f"⚡ {matrix.size} projections ({len(assets.ids)} x {len(horizons)}) in {elapsed * 1000:.1f} ms")
+
+    shown = target_years if len(target_years) <= 10 else target_years[::max(1, len(target_years) // 10)]
+    for year in shown:
+        column = target_years.index(year)
+        print(f"   {year}: ₹{matrix[:, column].sum():,.0f}")
+
+    if args.benchmark:
+        if args.variant != 'goals':
+            print("⚠️  The loop implements the 'goals' variant; benchmarking that one")
+            matrix = project(assets, horizons, current_year, variant='goals')
+        started = time.perf_counter()
+        looped = per_asset_loop(assets, horizons, current_year)
+        loop_elapsed = time.perf_counter() - started
+        worst = np.max(np.abs(looped - matrix) / np.maximum(1, np.abs(looped)))
+        print(f"\n🏁 per-asset loop: {loop_elapsed * 1000:.1f} ms "
+              f"({loop_elapsed / max(elapsed, 1e-9):.0f}x slower), max relative difference {worst:.2e}")
+
+if __name__ == "__main__":
+    main()
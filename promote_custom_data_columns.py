@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Promote hot assets.custom_data keys to typed columns
+
+The funding calculations read sipAmount, sipFrequency, expectedReturn and
+sipExpiryDate out of the custom_data JSONB on every asset. This script copies
+them into real columns that can be indexed and read without detoasting JSON:
+
+- keys whose conversion expression is immutable become GENERATED ALWAYS ... STORED
+  columns (Postgres computes them while adding the column)
+- the rest (e.g. dates, whose text parsing depends on DateStyle) become plain
+  columns kept in sync by a BEFORE INSERT/UPDATE trigger and backfilled in chunks
+
+Finally the funding read (every goal's linkedAssets joined to its assets'
+projection inputs) is timed against JSON extraction and against the
+promoted columns.
+
+Usage:
+    python promote_custom_data_columns.py
+    python promote_custom_data_columns.py --keys sipAmount,sipExpiryDate --chunk-size 2000 --index
+    python promote_custom_data_columns.py --benchmark-only
+"""
+
+import argparse
+import os
+import time
+import psycopg2
+from dotenv import load_dotenv
+
+# JSON key -> promoted column. assets.expected_return already exists as a core
+# column, so every promoted column carries the sip_ prefix.
+PROMOTED_KEYS = {
+    'sipAmount': {'column': 'sip_amount', 'type': 'NUMERIC', 'convert': 'lifemaps_try_numeric'},
+    'sipFrequency': {'column': 'sip_frequency', 'type': 'VARCHAR(50)', 'convert': 'lifemaps_try_text'},
+    'expectedReturn': {'column': 'sip_expected_return', 'type': 'NUMERIC', 'convert': 'lifemaps_try_numeric'},
+    'sipExpiryDate': {'column': 'sip_expiry_date', 'type': 'DATE', 'convert': 'lifemaps_try_date'},
+}
+
+SYNC_FUNCTION = 'sync_assets_promoted_custom_data'
+SYNC_TRIGGER = 'sync_assets_promoted_custom_data'
+
+# Lenient converters: autosave stores '' and free text in these keys, and a
+# failed cast inside a generated column or trigger would reject the whole write
+CONVERTER_SQL = """
+CREATE OR REPLACE FUNCTION lifemaps_try_numeric(value TEXT)
+RETURNS NUMERIC AS $$
+BEGIN
+    RETURN NULLIF(btrim(value), '')::NUMERIC;
+EXCEPTION WHEN OTHERS THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION lifemaps_try_text(value TEXT)
+RETURNS VARCHAR(50) AS $$
+    SELECT NULLIF(left(btrim(value), 50), '')
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Date input parsing depends on DateStyle, so this one is only STABLE
+CREATE OR REPLACE FUNCTION lifemaps_try_date(value TEXT)
+RETURNS DATE AS $$
+BEGIN
+    RETURN NULLIF(btrim(value), '')::DATE;
+EXCEPTION WHEN OTHERS THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;
+"""
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def key_expression(key, alias=None):
+    """SQL expression that converts one custom_data key to its column type"""
+    spec = PROMOTED_KEYS[key]
+    column = f"{alias}.custom_data" if alias else "custom_data"
+    return f"{spec['convert']}({column}->>'{key}')"
+
+def existing_columns(cur):
+    """Return {column_name: is_generated} for the assets table"""
+    cur.execute("""
+        SELECT column_name, is_generated
+        FROM information_schema.columns
+        WHERE table_name = 'assets'
+    """)
+    return {name: generated == 'ALWAYS' for name, generated in cur.fetchall()}
+
+def can_generate(cur, key):
+    """Ask Postgres whether the key's expression is allowed in a generated column"""
+    spec = PROMOTED_KEYS[key]
+    cur.execute("SHOW server_version_num")
+    if int(cur.fetchone()[0]) < 120000:
+        return False
+
+    cur.execute("SAVEPOINT probe_generated")
+    try:
+        cur.execute(f"""
+            CREATE TEMP TABLE promote_probe (
+                custom_data JSONB,
+                probe {spec['type']} GENERATED ALWAYS AS ({key_expression(key)}) STORED
+            )
+        """)
+        return True
+    except psycopg2.Error:
+        return False
+    finally:
+        cur.execute("ROLLBACK TO SAVEPOINT probe_generated")
+
+def add_columns(conn, keys):
+    """Add generated or trigger-synced columns, returning the trigger-synced keys"""
+    trigger_keys = []
+    with conn.cursor() as cur:
+        cur.execute(CONVERTER_SQL)
+        columns = existing_columns(cur)
+
+        for key in keys:
+            spec = PROMOTED_KEYS[key]
+            column = spec['column']
+
+            if column in columns:
+                mode = 'generated' if columns[column] else 'trigger'
+                print(f"   ⏭️  {column} already exists ({mode})")
+                if not columns[column]:
+                    trigger_keys.append(key)
+                continue
+
+            if can_generate(cur, key):
+                print(f"   🔧 Adding generated column {column} (rewrites assets once)...")
+                cur.execute(f"""
+                    ALTER TABLE assets
+                    ADD COLUMN {column} {spec['type']}
+                    GENERATED ALWAYS AS ({key_expression(key)}) STORED
+                """)
+                print(f"   ✅ Added: {column} = {key_expression(key)} (generated)")
+            else:
+                cur.execute(f"ALTER TABLE assets ADD COLUMN {column} {spec['type']}")
+                trigger_keys.append(key)
+                print(f"   ✅ Added: {column} (trigger-synced, expression is not immutable)")
+
+            cur.execute(f"COMMENT ON COLUMN assets.{column} IS %s",
+                        (f"Promoted from custom_data->>'{key}'",))
+
+        if trigger_keys:
+            install_sync_trigger(cur, trigger_keys)
+
+    conn.commit()
+    return trigger_keys
+
+def install_sync_trigger(cur, keys):
+    """(Re)create the trigger that keeps non-generated promoted columns in sync"""
+    assignments = "\n    ".join(
+        f"NEW.{PROMOTED_KEYS[key]['column']} := {PROMOTED_KEYS[key]['convert']}(NEW.custom_data->>'{key}');"
+        for key in keys
+    )
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION {SYNC_FUNCTION}()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            {assignments}
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cur.execute(f"DROP TRIGGER IF EXISTS {SYNC_TRIGGER} ON assets")
+    cur.execute(f"""
+        CREATE TRIGGER {SYNC_TRIGGER}
+            BEFORE INSERT OR UPDATE OF custom_data ON assets
+            FOR EACH ROW
+            EXECUTE FUNCTION {SYNC_FUNCTION}()
+    """)
+    print(f"   ✅ Trigger {SYNC_TRIGGER} keeps {', '.join(PROMOTED_KEYS[k]['column'] for k in keys)} in sync")
+
+def backfill(conn, keys, chunk_size):
+    """Fill trigger-synced columns in id-range chunks, one short transaction each"""
+    if not keys:
+        return
+
+    assignments = ", ".join(f"{PROMOTED_KEYS[key]['column']} = {key_expression(key)}" for key in keys)
+    changed = " OR ".join(
+        f"{PROMOTED_KEYS[key]['column']} IS DISTINCT FROM {key_expression(key)}" for key in keys
+    )
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM assets")
+        min_id, max_id = cur.fetchone()
+    conn.commit()
+
+    print(f"\n🔄 Backfilling ids {min_id}..{max_id} in chunks of {chunk_size}...")
+    total = 0
+    quiet = True
+    for start in range(min_id, max_id + 1, chunk_size):
+        with conn.cursor() as cur:
+            if quiet:
+                # Keep updated_at untouched: a backfill is not a user edit
+                try:
+                    cur.execute("SAVEPOINT replica_role")
+                    cur.execute("SET LOCAL session_replication_role = replica")
+                except psycopg2.Error:
+                    cur.execute("ROLLBACK TO SAVEPOINT replica_role")
+                    print("   ⚠️  Not allowed to skip triggers - updated_at will be bumped")
+                    quiet = False
+            cur.execute(f"""
+                UPDATE assets
+                SET {assignments}
+                WHERE id >= %s AND id < %s AND ({changed})
+            """, (start, start + chunk_size))
+            total += cur.rowcount
+        conn.commit()
+        print(f"   📦 ids {start}..{min(start + chunk_size, max_id + 1) - 1}: {total} rows updated so far")
+
+    print(f"✅ Backfill complete: {total} rows updated")
+
+def create_indexes(conn, keys):
+    """Create btree indexes on the promoted columns without blocking writes"""
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for key in keys:
+            column = PROMOTED_KEYS[key]['column']
+            cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_assets_{column} ON assets({column})")
+            print(f"   ✅ Index idx_assets_{column}")
+    conn.autocommit = False
+
+def time_query(cur, sql, repeats):
+    """Best-of-N wall-clock time for a query, in milliseconds"""
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        cur.execute(sql)
+        cur.fetchall()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def benchmark(conn, keys, repeats):
+    """Compare the funding read over JSON extraction vs the promoted columns"""
+    print(f"\n⏱️  Funding read benchmark (best of {repeats})")
+    json_columns = ", ".join(f"MAX({key_expression(k, 'a')})" for k in keys)
+    typed_columns = ", ".join(f"MAX(a.{PROMOTED_KEYS[k]['column']})" for k in keys)
+    # The linkedAssets join of test_real_data_flow.py's funding calculation,
+    # for every goal: each linked asset's value and projection inputs
+    funding_sql = """
+        SELECT fg.id, COUNT(a.id),
+               SUM(a.current_value * (linked_asset->>'percent')::numeric / 100), {columns}
+        FROM financial_goal fg
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(fg.custom_data->'linkedAssets') = 'array'
+                 THEN fg.custom_data->'linkedAssets' ELSE '[]' END) AS linked_asset
+        JOIN assets a ON a.id = (linked_asset->>'assetId')::integer
+        WHERE linked_asset->>'assetId' ~ '^[0-9]{{1,9}}$'
+          AND linked_asset->>'percent' ~ '^[0-9]+(\\.[0-9]+)?$'
+        GROUP BY fg.id
+        ORDER BY fg.id
+    """
+    json_sql = funding_sql.format(columns=json_columns)
+    typed_sql = funding_sql.format(columns=typed_columns)
+
+    with conn.cursor() as cur:
+        cur.execute(json_sql)
+        json_result = cur.fetchall()
+        cur.execute(typed_sql)
+        typed_result = cur.fetchall()
+        if json_result != typed_result:
+            print(f"   ⚠️  Promoted columns are out of sync for "
+                  f"{len(set(json_result).symmetric_difference(typed_result))} goal rows")
+
+        json_ms = time_query(cur, json_sql, repeats)
+        typed_ms = time_query(cur, typed_sql, repeats)
+    conn.rollback()
+
+    speedup = json_ms / typed_ms if typed_ms else float('inf')
+    print(f"   📄 custom_data extraction: {json_ms:8.2f} ms")
+    print(f"   📊 promoted columns:       {typed_ms:8.2f} ms")
+    print(f"   🚀 Speedup: {speedup:.1f}x over {len(json_result)} goals, "
+          f"{sum(row[1] for row in json_result)} linked assets")
+
+def main():
+    parser = argparse.ArgumentParser(description="Promote assets.custom_data keys to typed columns")
+    parser.add_argument('--keys', default=','.join(PROMOTED_KEYS),
+                        help="comma-separated custom_data keys to promote")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="rows per backfill transaction")
+    parser.add_argument('--index', action='store_true', help="create btree indexes on the new columns")
+    parser.add_argument('--benchmark-only', action='store_true', help="skip the migration, only time reads")
+    parser.add_argument('--repeats', type=int, default=5, help="benchmark repetitions")
+    args = parser.parse_args()
+
+    keys = [key.strip() for key in args.keys.split(',') if key.strip()]
+    unknown = [key for key in keys if key not in PROMOTED_KEYS]
+    if unknown:
+        print(f"❌ Unknown keys: {', '.join(unknown)} (supported: {', '.join(PROMOTED_KEYS)})")
+        return
+
+    print("🔧 Promoting custom_data keys on assets")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        if not args.benchmark_only:
+            trigger_keys = add_columns(conn, keys)
+            backfill(conn, trigger_keys, args.chunk_size)
+            if args.index:
+                create_indexes(conn, keys)
+        benchmark(conn, keys, args.repeats)
+        print("\n🎉 Done!")
+    except Exception as e:
+        print(f"❌ Promotion failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Purge orphaned earmark references from custom_data
+
+Deleting a goal or an asset leaves its entries behind in the other side's
+JSON: assets.custom_data.goalEarmarks keeps pointing at the deleted goal and
+financial_goal.custom_data.linkedAssets at the deleted asset. The frontend's
+validateEarmarkingData only reports these one user at a time.
+
+This job strips them for every user with two set-based UPDATEs per user_id
+chunk. An entry is orphaned when no row of the same user has its id (ids that
+are not integers at all count as orphaned too). Rows edited while the chunk
+runs are left alone and picked up by the next run.
+
+Usage:
+    python purge_orphan_earmarks.py --dry-run
+    python purge_orphan_earmarks.py --chunk-size 200
+"""
+
+import argparse
+import os
+from collections import defaultdict
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+from migrate_asset_goal_links import ID_PATTERN
+
+# (owner table, JSON key, id field, referenced table)
+EARMARK_SIDES = [
+    ('assets', 'goalEarmarks', 'goalId', 'financial_goal'),
+    ('financial_goal', 'linkedAssets', 'assetId', 'assets'),
+]
+
+PURGE_SQL = """
+WITH stripped AS (
+    SELECT o.id,
+           o.custom_data->'{key}' AS original,
+           COALESCE(jsonb_agg(e.item ORDER BY e.position) FILTER (WHERE r.id IS NOT NULL), '[]'::jsonb) AS kept,
+           COUNT(*) FILTER (WHERE r.id IS NULL) AS removed
+    FROM {table} o
+    CROSS JOIN LATERAL jsonb_array_elements(o.custom_data->'{key}') WITH ORDINALITY AS e(item, position)
+    LEFT JOIN {referenced} r
+      ON r.user_id = o.user_id
+     AND r.id = CASE WHEN e.item->>'{id_field}' ~ %(id_pattern)s
+                     THEN (e.item->>'{id_field}')::int END
+    WHERE o.user_id >= %(start)s AND o.user_id < %(end)s
+      AND jsonb_typeof(o.custom_data->'{key}') = 'array'
+    GROUP BY o.id
+    HAVING COUNT(*) FILTER (WHERE r.id IS NULL) > 0
+)
+UPDATE {table} o
+SET custom_data = jsonb_set(o.custom_data, '{{{key}}}', s.kept)
+FROM stripped s
+WHERE o.id = s.id
+  -- skip rows a user changed after the chunk's snapshot
+  AND o.custom_data->'{key}' = s.original
+RETURNING o.user_id, s.removed
+"""
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def purge_chunk(cur, start, end):
+    """Strip orphans for one user_id range; {user_id: {key: removed}}"""
+    removed = defaultdict(lambda: defaultdict(int))
+    for table, key, id_field, referenced in EARMARK_SIDES:
+        cur.execute(
+            PURGE_SQL.format(table=table, key=key, id_field=id_field, referenced=referenced),
+            {'start': start, 'end': end, 'id_pattern': ID_PATTERN}
+        )
+        for user_id, count in cur.fetchall():
+            removed[user_id][key] += count
+    return removed
+
+def purge_orphans(conn, chunk_size, dry_run):
+    """Walk user_id ranges, one transaction per chunk"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM "user"')
+        min_user, max_user = cur.fetchone()
+    conn.commit()
+
+    mode = "Dry run over" if dry_run else "Purging"
+    print(f"\n🔄 {mode} user_ids {min_user}..{max_user} in chunks of {chunk_size}...")
+    per_user = {}
+    for start in range(min_user, max_user + 1, chunk_size):
+        end = start + chunk_size
+        with conn.cursor() as cur:
+            removed = purge_chunk(cur, start, end)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        per_user.update(removed)
+        count = sum(sum(keys.values()) for keys in removed.values())
+        print(f"   📦 users {start}..{min(end, max_user + 1) - 1}: {count} references from {len(removed)} users")
+    return per_user
+
+def print_report(per_user, dry_run):
+    """Removed references per user and totals"""
+    verb = "Would remove" if dry_run else "Removed"
+    print(f"\n📊 {verb} orphaned references")
+    print("=" * 60)
+    if not per_user:
+        print("✅ No orphaned references found")
+        return
+
+    totals = defaultdict(int)
+    for user_id in sorted(per_user):
+        keys = per_user[user_id]
+        for key, count in keys.items():
+            totals[key] += count
+        details = ", ".join(f"{keys[key]} {key}" for key in sorted(keys))
+        print(f"   👤 User {user_id}: {details}")
+    print("=" * 60)
+    summary = ", ".join(f"{totals[key]} {key}" for _, key, _, _ in EARMARK_SIDES)
+    print(f"   {verb} {summary} across {len(per_user)} users")
+
+def main():
+    parser = argparse.ArgumentParser(description="Strip orphaned goalEarmarks/linkedAssets entries")
+    parser.add_argument('--chunk-size', type=int, default=500, help="user ids per transaction")
+    parser.add_argument('--dry-run', action='store_true', help="report without changing anything")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds to wait with --wait")
+    args = parser.parse_args()
+
+    print("🧹 Purging orphaned earmark references")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with job_lock(get_db_config(), 'purge_orphan_earmarks', tables=['assets', 'financial_goal'],
+                      wait=args.wait, timeout=args.timeout):
+            per_user = purge_orphans(conn, args.chunk_size, args.dry_run)
+            print_report(per_user, args.dry_run)
+        print("\n🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ Purge failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Purge rows left behind by the database test scripts
+
+test_complete_flow.py, test_custom_data.py, test_earmarking.py and friends
+commit real rows and rarely clean up: the test@example.com user with its
+profile, assets and goals, plus 'Test Goal' / 'Test SIP Asset' rows attached
+to real users.
+
+Fixture users are removed bottom-up: their rows are deleted table by table in
+bounded batches (children before financial_profile before "user"), so the
+final user delete has nothing left to cascade into and no transaction fans
+out into thousands of rows. Fixture-named rows of real users are deleted the
+same way, and the earmark references pointing at them are stripped (see
+purge_orphan_earmarks.py). Tables that lost rows get a targeted
+VACUUM (ANALYZE) at the end.
+
+Data that test_earmarking_complete.py rewrote in place (user 4's names and
+values) cannot be told apart from real edits and is not touched.
+
+Usage:
+    python purge_test_fixtures.py --dry-run
+    python purge_test_fixtures.py --batch-size 200
+    python purge_test_fixtures.py --email test@example.com --email qa@example.com
+"""
+
+import argparse
+import os
+import time
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+from purge_orphan_earmarks import purge_chunk
+
+FIXTURE_EMAILS = ['test@example.com']
+
+# Names the test scripts give the rows they insert for existing users
+FIXTURE_ROWS = {
+    'financial_goal': ['Test Goal', 'Test Goal 1', 'Test Goal 2', 'Test Goal 3'],
+    'assets': ['Test SIP Asset', 'Test Asset', 'Test Asset 1', 'Test Asset 2'],
+}
+
+# Deleted in this order: leaves first, so nothing cascades far (asset_goal_link
+# rows go with their asset, at most a handful each)
+USER_OWNED_TABLES = ['assets', 'financial_goal', 'financial_expense', 'financial_loan',
+                     'financial_insurance', 'work_assets', 'user_tags', 'user_asset_columns',
+                     'financial_profile']
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def existing_tables(cur, tables):
+    """The subset of tables present in this database"""
+    cur.execute("SELECT relname FROM pg_class WHERE relkind IN ('r', 'p') AND relname = ANY(%s) "
+                "AND relnamespace = 'public'::regnamespace", (tables,))
+    present = {row[0] for row in cur.fetchall()}
+    return [table for table in tables if table in present]
+
+def find_fixtures(conn, emails):
+    """Fixture user ids and, per table, fixture-named rows of other users"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT id, email FROM "user" WHERE lower(email) = ANY(%s) ORDER BY id',
+                    ([email.lower() for email in emails],))
+        users = cur.fetchall()
+        user_ids = [row[0] for row in users]
+
+        rows = {}
+        for table in existing_tables(cur, list(FIXTURE_ROWS)):
+            cur.execute(f"""
+                SELECT id, user_id, name FROM {table}
+                WHERE name = ANY(%s) AND NOT (user_id = ANY(%s))
+                ORDER BY id
+            """, (FIXTURE_ROWS[table], user_ids))
+            rows[table] = cur.fetchall()
+
+        counts = {}
+        for table in existing_tables(cur, USER_OWNED_TABLES):
+            cur.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = ANY(%s)", (user_ids,))
+            counts[table] = cur.fetchone()[0]
+    conn.commit()
+    return users, rows, counts
+
+def delete_batches(conn, table, where, params, batch_size, pause):
+    """DELETE ... WHERE id IN (first batch_size matches) until none are left"""
+    deleted = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                DELETE FROM "{table}"
+                WHERE id IN (SELECT id FROM "{table}" WHERE {where} ORDER BY id LIMIT %s)
+            """, params + (batch_size,))
+            count = cur.rowcount
+        conn.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+def purge(conn, user_ids, rows, batch_size, pause):
+    """Delete fixture rows then fixture users; returns {table: deleted}"""
+    deleted = {}
+
+    # Fixture rows of real users, then the references to them
+    affected_users = set()
+    for table, matches in rows.items():
+        ids = [row[0] for row in matches]
+        if not ids:
+            continue
+        affected_users.update(row[1] for row in matches)
+        deleted[table] = delete_batches(conn, table, "id = ANY(%s)", (ids,), batch_size, pause)
+        print(f"   🗑️  {table}: {deleted[table]} fixture rows of real users")
+    for user_id in sorted(affected_users):
+        with conn.cursor() as cur:
+            purge_chunk(cur, user_id, user_id + 1)
+        conn.commit()
+
+    if not user_ids:
+        return deleted
+
+    with conn.cursor() as cur:
+        tables = existing_tables(cur, USER_OWNED_TABLES)
+    conn.commit()
+    for table in tables:
+        count = delete_batches(conn, table, "user_id = ANY(%s)", (user_ids,), batch_size, pause)
+        if count:
+            deleted[table] = deleted.get(table, 0) + count
+            print(f"   🗑️  {table}: {count} rows of fixture users")
+
+    deleted['user'] = delete_batches(conn, 'user', "id = ANY(%s)", (user_ids,), batch_size, pause)
+    print(f"   🗑️  user: {deleted['user']} fixture users")
+    return deleted
+
+def vacuum_tables(conn, tables):
+    """VACUUM (ANALYZE) only the tables that lost rows"""
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for table in tables:
+            started = time.perf_counter()
+            cur.execute(f'VACUUM (ANALYZE) "{table}"')
+            print(f"   🧽 VACUUM (ANALYZE) {table}: {time.perf_counter() - started:.2f}s")
+    conn.autocommit = False
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge rows created by the database test scripts")
+    parser.add_argument('--email', action='append', help="fixture user email (repeatable)")
+    parser.add_argument('--batch-size', type=int, default=500, help="rows per delete transaction")
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument('--dry-run', action='store_true', help="list what would be deleted")
+    parser.add_argument('--no-vacuum', action='store_true', help="skip the VACUUM (ANALYZE) pass")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    print("🧪 Purging test fixtures")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        users, rows, counts = find_fixtures(conn, args.email or FIXTURE_EMAILS)
+        print(f"👤 Fixture users: {', '.join(f'{email} (id {user_id})' for user_id, email in users) or 'none'}")
+        for table, count in counts.items():
+            if count:
+                print(f"   {table}: {count} rows")
+        for table, matches in rows.items():
+            print(f"📋 {table}: {len(matches)} fixture-named rows of other users")
+            for row_id, user_id, name in matches[:10]:
+                print(f"   - id {row_id} (user {user_id}): {name}")
+            if len(matches) > 10:
+                print(f"   ... {len(matches) - 10} more")
+
+        if args.dry_run:
+            print("\n🔍 Dry run: nothing deleted")
+            return
+        if not users and not any(rows.values()):
+            print("\n✅ No fixtures found")
+            return
+
+        tables = ['user'] + USER_OWNED_TABLES
+        with job_lock(get_db_config(), 'purge_test_fixtures', tables=tables, wait=args.wait):
+            print(f"\n🔄 Deleting in batches of {args.batch_size}...")
+            deleted = purge(conn, [user_id for user_id, _ in users], rows, args.batch_size, args.pause)
+            if not args.no_vacuum:
+                print("\n🧽 Vacuuming affected tables...")
+                vacuum_tables(conn, [table for table, count in deleted.items() if count])
+        print(f"\n✅ Deleted {sum(deleted.values())} rows")
+        print("🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ Purge failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Move earmark percentages between goals for many assets at once
+
+Applies declarative rules such as "move 10% of every Emergency-tagged asset
+from goal 'Emergency Fund' to goal 'House'" instead of editing assets one by
+one through PUT /api/financial/asset/:assetId. A rule is a JSON object:
+
+    {"tag": "Emergency", "from_goal": "Emergency Fund", "to_goal": "House", "percent": 10}
+
+- tag: asset tag to match (uses idx_assets_tag); optional "users": [ids]
+- from_goal / to_goal: goal id (number) or goal label (description, else
+  name), resolved per user; users where it matches no goal or several are
+  reported and skipped
+- percent: points to move per asset, or "all"; an asset with less than that
+  on from_goal moves what it has
+
+For every matched asset the new goalEarmarks and the mirrored linkedAssets
+of both goals are computed in Python, the 100% cap is checked for every
+touched asset, and all rows are written with one batched jsonb_set UPDATE
+per table - all in one transaction, rolled back if any check fails. Where
+the goal_funding table exists, the goals whose funding the edits invalidate
+(per dependency_index.py) are refreshed in the same transaction.
+
+Usage:
+    python rebalance_earmarks.py --rule '{"tag": "Emergency", "from_goal": 12, "to_goal": 15, "percent": 10}'
+    python rebalance_earmarks.py --rule @rules.json --dry-run
+"""
+
+import argparse
+import datetime
+import json
+import os
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+from earmark_engine import ASSET_KEY, GOAL_KEY, entries, goal_label, parse_id, parse_percent, write_back
+from dependency_index import DependencyIndex
+from refresh_goal_funding import refresh_changed
+
+CAP = 100
+
+class RuleError(Exception):
+    """A rule is malformed or would break the 100% cap"""
+
+def load_rules(text):
+    """Rules from a JSON string or @file, as a list"""
+    if text.startswith('@'):
+        with open(text[1:], 'r', encoding='utf-8') as f:
+            text = f.read()
+    rules = json.loads(text)
+    rules = rules if isinstance(rules, list) else [rules]
+    for rule in rules:
+        missing = [key for key in ('tag', 'from_goal', 'to_goal', 'percent') if key not in rule]
+        if missing:
+            raise RuleError(f"rule {rule} is missing {', '.join(missing)}")
+        if rule['percent'] != 'all' and not parse_percent(rule['percent']) > 0:
+            raise RuleError(f"rule {rule}: percent must be positive or 'all'")
+    return rules
+
+def set_percent(array, id_field, ref_id, percent, new_entry):
+    """Copy of an earmark array with ref_id's percent set (removed when 0)"""
+    result = []
+    found = False
+    for entry in array:
+        if isinstance(entry, dict) and parse_id(entry.get(id_field)) == ref_id:
+            if found or percent <= 0:
+                continue
+            found = True
+            entry = {**entry, 'percent': percent}
+        result.append(entry)
+    if not found and percent > 0:
+        result.append({**new_entry, 'percent': percent})
+    return result
+
+def resolve_goals(goals_by_user, user_ids, spec):
+    """{user_id: goal} for a goal id or label, plus {user_id: matches} for the users
+    where spec matched no goal or several"""
+    resolved, unresolved = {}, {}
+    for user_id in user_ids:
+        matches = [g for g in goals_by_user.get(user_id, [])
+                   if (g['id'] == spec if isinstance(spec, int) else goal_label(g) == spec)]
+        if len(matches) == 1:
+            resolved[user_id] = matches[0]
+        else:
+            unresolved[user_id] = len(matches)
+    return resolved, unresolved
+
+def plan_rule(cur, rule, assets, goals):
+    """Apply one rule to the in-memory rows; returns per-asset moves and unresolved goals"""
+    users = rule.get('users')
+    cur.execute(f"""
+        SELECT id, user_id, name, custom_data FROM assets
+        WHERE tag = %s {'AND user_id = ANY(%s)' if users else ''}
+        ORDER BY id
+        FOR UPDATE
+    """, (rule['tag'], users) if users else (rule['tag'],))
+    matched = cur.fetchall()
+    user_ids = sorted({row[1] for row in matched})
+    for asset_id, user_id, name, custom_data in matched:
+        assets.setdefault(asset_id, {'id': asset_id, 'user_id': user_id, 'name': name,
+                                     'custom_data': custom_data, 'original': (custom_data or {}).get(ASSET_KEY)})
+
+    cur.execute("""
+        SELECT id, user_id, name, description, custom_data FROM financial_goal
+        WHERE user_id = ANY(%s)
+        ORDER BY id
+        FOR UPDATE
+    """, (user_ids,))
+    for goal_id, user_id, name, description, custom_data in cur.fetchall():
+        goals.setdefault(goal_id, {'id': goal_id, 'user_id': user_id, 'name': name, 'description': description,
+                                   'custom_data': custom_data, 'original': (custom_data or {}).get(GOAL_KEY)})
+    goals_by_user = {}
+    for goal in goals.values():
+        goals_by_user.setdefault(goal['user_id'], []).append(goal)
+    sources, unresolved_sources = resolve_goals(goals_by_user, user_ids, rule['from_goal'])
+    targets, unresolved_targets = resolve_goals(goals_by_user, user_ids, rule['to_goal'])
+    unresolved = [(user_id, 'from_goal', rule['from_goal'], count) for user_id, count in unresolved_sources.items()]
+    unresolved += [(user_id, 'to_goal', rule['to_goal'], count) for user_id, count in unresolved_targets.items()]
+
+    moves = []
+    for asset_id, user_id, _, _ in matched:
+        asset = assets[asset_id]
+        source, target = sources.get(user_id), targets.get(user_id)
+        if source is None or target is None or source['id'] == target['id']:
+            continue
+        earmarks = entries(asset, ASSET_KEY)
+        current = {parse_id(e.get('goalId')): parse_percent(e.get('percent'))
+                   for e in reversed(earmarks) if isinstance(e, dict)}
+        available = current.get(source['id'], 0)
+        if available <= 0:
+            continue
+        moved = available if rule['percent'] == 'all' else min(available, parse_percent(rule['percent']))
+        new_source = round(available - moved, 3)
+        new_target = round(current.get(target['id'], 0) + moved, 3)
+
+        earmarks = set_percent(earmarks, 'goalId', source['id'], new_source, {})
+        earmarks = set_percent(earmarks, 'goalId', target['id'], new_target,
+                               {'goalId': target['id'], 'goalName': goal_label(target)})
+        asset['custom_data'] = {**(asset['custom_data'] or {}), ASSET_KEY: earmarks}
+        for goal, percent in ((source, new_source), (target, new_target)):
+            linked = set_percent(entries(goal, GOAL_KEY), 'assetId', asset_id, percent,
+                                 {'assetId': asset_id, 'assetName': asset['name']})
+            goal['custom_data'] = {**(goal['custom_data'] or {}), GOAL_KEY: linked}
+        moves.append((asset_id, user_id, source['id'], target['id'], moved))
+    return moves, sorted(unresolved)
+
+def over_cap(assets):
+    """Assets whose new goalEarmarks would exceed 100%"""
+    violations = []
+    for asset in assets:
+        total = sum(parse_percent(e.get('percent')) for e in entries(asset, ASSET_KEY) if isinstance(e, dict))
+        if total > CAP + 1e-9:
+            violations.append((asset['id'], asset['user_id'], total))
+    return violations
+
+def rebalance(conn, rules, dry_run):
+    """Plan every rule, validate and write in one transaction"""
+    assets, goals = {}, {}
+    try:
+        with conn.cursor() as cur:
+            for number, rule in enumerate(rules, 1):
+                moves, unresolved = plan_rule(cur, rule, assets, goals)
+                print(f"📋 Rule {number}: {rule['tag']} assets, {rule['from_goal']} -> {rule['to_goal']}, "
+                      f"{rule['percent']}{'' if rule['percent'] == 'all' else '%'}")
+                print(f"   {len(moves)} assets, {sum(m[4] for m in moves):g} points moved")
+                for asset_id, user_id, source, target, moved in moves[:10]:
+                    print(f"   - user {user_id} asset {asset_id}: {moved:g}% goal {source} -> goal {target}")
+                if len(moves) > 10:
+                    print(f"   ... {len(moves) - 10} more")
+                for user_id, field, spec, count in unresolved[:10]:
+                    reason = "matches no goal" if count == 0 else f"matches {count} goals"
+                    print(f"   ⚠️  user {user_id} skipped: {field} {spec!r} {reason}")
+                if len(unresolved) > 10:
+                    print(f"   ... {len(unresolved) - 10} more unresolved")
+
+            asset_changes = {a['id']: a['custom_data'][ASSET_KEY] for a in assets.values()
+                             if (a['custom_data'] or {}).get(ASSET_KEY) != a['original']}
+            violations = over_cap([assets[asset_id] for asset_id in asset_changes])
+            if violations:
+                for asset_id, user_id, total in violations[:10]:
+                    print(f"   ❌ user {user_id} asset {asset_id} would be {total:g}% earmarked")
+                raise RuleError(f"{len(violations)} assets would exceed {CAP}%")
+
+            goal_changes = {g['id']: g['custom_data'][GOAL_KEY] for g in goals.values()
+                            if (g['custom_data'] or {}).get(GOAL_KEY) != g['original']}
+
+            # Snapshot before writing, so the index sees what each edit changed
+            cur.execute("SELECT to_regclass('public.goal_funding') IS NOT NULL")
+            index = None
+            if cur.fetchone()[0] and (asset_changes or goal_changes):
+                user_ids = {a['user_id'] for a in assets.values()} | {g['user_id'] for g in goals.values()}
+                index = DependencyIndex().read(cur, user_ids)
+
+            write_back(cur, 'assets', ASSET_KEY, asset_changes, {a['id']: a['original'] for a in assets.values()})
+            write_back(cur, 'financial_goal', GOAL_KEY, goal_changes,
+                       {g['id']: g['original'] for g in goals.values()})
+            if index is not None:
+                changes = [('assets', asset_id, {'custom_data': {ASSET_KEY: array}})
+                           for asset_id, array in asset_changes.items()]
+                changes += [('financial_goal', goal_id, {'custom_data': {GOAL_KEY: array}})
+                            for goal_id, array in goal_changes.items()]
+                refreshed = refresh_changed(cur, index, changes, datetime.date.today().year)
+                print(f"🎯 {refreshed} goal_funding rows refreshed")
+        if dry_run:
+            conn.rollback()
+            print(f"\n🔍 Dry run: would update {len(asset_changes)} assets and {len(goal_changes)} goals")
+        else:
+            conn.commit()
+            print(f"\n✅ Updated {len(asset_changes)} assets and {len(goal_changes)} goals")
+    except Exception:
+        conn.rollback()
+        raise
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Move earmarks between goals for all matching assets")
+    parser.add_argument('--rule', required=True, help="JSON rule (or list of rules), or @file")
+    parser.add_argument('--dry-run', action='store_true', help="show the moves without committing")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    print("⚖️  Rebalancing earmarks")
+    print("=" * 60)
+
+    try:
+        rules = load_rules(args.rule)
+    except (RuleError, ValueError, OSError) as e:
+        print(f"❌ Invalid rule: {e}")
+        raise SystemExit(2)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with job_lock(get_db_config(), 'rebalance_earmarks', tables=['assets', 'financial_goal'], wait=args.wait):
+            rebalance(conn, rules, args.dry_run)
+        print("🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except RuleError as e:
+        print(f"❌ Rolled back: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ Rebalance failed: {e}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Reconcile the denormalized totals on financial_profile
+
+financial_profile.total_asset_gross_market_value should equal the user's
+SUM(assets.current_value) and total_loan_outstanding_value the user's
+SUM(financial_loan.principal_outstanding). Only the asset register page ever
+writes the first one, and nothing writes the second.
+
+reconcile (default)
+    Computes every user's true totals in one grouped query, reports the
+    profiles that drifted and corrects them with one UPDATE ... FROM per
+    chunk of users. The chunk recomputes its sums, so edits made since the
+    report are not overwritten with stale values.
+
+install-triggers / drop-triggers
+    Statement-level triggers with transition tables on assets and
+    financial_loan add each statement's per-user delta to the stored totals,
+    so dashboards can read them without aggregating. Deltas stay correct under
+    concurrent writes; run reconcile periodically to repair anything done
+    with triggers disabled (e.g. session_replication_role = replica).
+
+Usage:
+    python reconcile_profile_totals.py --dry-run
+    python reconcile_profile_totals.py --chunk-size 1000
+    python reconcile_profile_totals.py install-triggers
+"""
+
+import argparse
+import os
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+
+# profile column -> source table and summed column
+TOTALS = {
+    'total_asset_gross_market_value': {'table': 'assets', 'column': 'current_value'},
+    'total_loan_outstanding_value': {'table': 'financial_loan', 'column': 'principal_outstanding'},
+}
+
+# Totals are compared as double precision; differences below a cent are noise
+TOLERANCE = 0.005
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def true_totals_sql(user_filter):
+    """Per-profile stored and true totals for the users matching user_filter"""
+    joins = []
+    columns = []
+    for i, (profile_column, source) in enumerate(TOTALS.items()):
+        joins.append(f"""
+            LEFT JOIN (
+                SELECT user_id, SUM(COALESCE({source['column']}, 0))::double precision AS total
+                FROM {source['table']}
+                WHERE {user_filter}
+                GROUP BY user_id
+            ) t{i} ON t{i}.user_id = p.user_id""")
+        # init-db.sql declares the totals DECIMAL(15,2), the deployed schema double
+        # precision; cast so Python always compares floats
+        columns.append(f"p.{profile_column}::double precision AS stored_{i}, "
+                       f"COALESCE(t{i}.total, 0) AS true_{i}")
+    drift = " OR ".join(
+        f"p.{profile_column} IS NULL OR abs(p.{profile_column} - COALESCE(t{i}.total, 0)) > {TOLERANCE}"
+        for i, profile_column in enumerate(TOTALS)
+    )
+    return f"""
+        SELECT p.id, p.user_id, {', '.join(columns)}
+        FROM financial_profile p
+        {''.join(joins)}
+        WHERE ({drift}) AND p.{user_filter}
+    """
+
+def find_drift(conn):
+    """Every profile whose stored totals differ from the real sums"""
+    with conn.cursor() as cur:
+        cur.execute(true_totals_sql("user_id IS NOT NULL"))
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+def print_drift(rows, limit):
+    """Largest drifts first"""
+    print(f"\n📊 {len(rows)} profiles out of sync")
+    print("=" * 60)
+    if not rows:
+        print("✅ All profile totals match")
+        return
+
+    def size(row):
+        values = row[2:]
+        return max(abs((values[i] or 0) - values[i + 1]) for i in range(0, len(values), 2))
+
+    for row in sorted(rows, key=size, reverse=True)[:limit]:
+        profile_id, user_id, values = row[0], row[1], row[2:]
+        changes = []
+        for i, profile_column in enumerate(TOTALS):
+            stored, actual = values[2 * i], values[2 * i + 1]
+            if stored is None or abs(stored - actual) > TOLERANCE:
+                stored_text = 'NULL' if stored is None else f"{stored:,.2f}"
+                changes.append(f"{profile_column} {stored_text} -> {actual:,.2f}")
+        print(f"   👤 User {user_id} (profile {profile_id}): {'; '.join(changes)}")
+    if len(rows) > limit:
+        print(f"   ... {len(rows) - limit} more")
+
+def correct_users(cur, user_ids):
+    """Set the given users' stored totals to the real sums; returns the profiles changed"""
+    assignments = ", ".join(f"{profile_column} = t.true_{i}" for i, profile_column in enumerate(TOTALS))
+    cur.execute(f"""
+        UPDATE financial_profile p
+        SET {assignments}, updated_at = NOW()
+        FROM ({true_totals_sql("user_id = ANY(%(users)s)")}) t
+        WHERE p.id = t.id
+    """, {'users': list(user_ids)})
+    return cur.rowcount
+
+def apply_corrections(conn, rows, chunk_size):
+    """One UPDATE ... FROM per chunk of drifted users"""
+    user_ids = sorted({row[1] for row in rows})
+    updated = 0
+    for offset in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[offset:offset + chunk_size]
+        with conn.cursor() as cur:
+            updated += correct_users(cur, chunk)
+        conn.commit()
+        print(f"   📦 users {chunk[0]}..{chunk[-1]}: {updated} profiles corrected so far")
+    print(f"✅ Corrected {updated} profiles")
+
+def triggers_installed(cur):
+    """Whether install-triggers has been run on this database"""
+    cur.execute("""
+        SELECT COUNT(*) FROM pg_trigger
+        WHERE NOT tgisinternal AND tgname = ANY(%s)
+    """, ([f"maintain_{profile_column}_insert" for profile_column in TOTALS],))
+    return cur.fetchone()[0] > 0
+
+def trigger_function_sql(profile_column, source):
+    """plpgsql function applying a statement's per-user deltas to one total"""
+    value = f"COALESCE({source['column']}, 0)"
+    return f"""
+        CREATE OR REPLACE FUNCTION maintain_{profile_column}()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE financial_profile p
+                SET {profile_column} = COALESCE(p.{profile_column}, 0) + d.delta
+                FROM (SELECT user_id, SUM({value}) AS delta FROM new_rows GROUP BY user_id) d
+                WHERE p.user_id = d.user_id AND d.delta <> 0;
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE financial_profile p
+                SET {profile_column} = COALESCE(p.{profile_column}, 0) - d.delta
+                FROM (SELECT user_id, SUM({value}) AS delta FROM old_rows GROUP BY user_id) d
+                WHERE p.user_id = d.user_id AND d.delta <> 0;
+            ELSE
+                UPDATE financial_profile p
+                SET {profile_column} = COALESCE(p.{profile_column}, 0) + d.delta
+                FROM (
+                    SELECT user_id, SUM(change) AS delta
+                    FROM (
+                        SELECT user_id, {value} AS change FROM new_rows
+                        UNION ALL
+                        SELECT user_id, -{value} FROM old_rows
+                    ) changes
+                    GROUP BY user_id
+                ) d
+                WHERE p.user_id = d.user_id AND d.delta <> 0;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+
+def install_triggers(conn):
+    """Transition-table triggers can only name one event each, hence three per table"""
+    with conn.cursor() as cur:
+        for profile_column, source in TOTALS.items():
+            table = source['table']
+            cur.execute(trigger_function_sql(profile_column, source))
+            for event, referencing in [
+                ('INSERT', 'NEW TABLE AS new_rows'),
+                ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                ('DELETE', 'OLD TABLE AS old_rows'),
+            ]:
+                trigger = f"maintain_{profile_column}_{event.lower()}"
+                cur.execute(f"DROP TRIGGER IF EXISTS {trigger} ON {table}")
+                cur.execute(f"""
+                    CREATE TRIGGER {trigger}
+                    AFTER {event} ON {table}
+                    REFERENCING {referencing}
+                    FOR EACH STATEMENT EXECUTE FUNCTION maintain_{profile_column}()
+                """)
+            print(f"✅ {table} now maintains financial_profile.{profile_column}")
+    conn.commit()
+
+def drop_triggers(conn):
+    """Remove the maintenance triggers and their functions"""
+    with conn.cursor() as cur:
+        for profile_column, source in TOTALS.items():
+            for event in ['insert', 'update', 'delete']:
+                cur.execute(f"DROP TRIGGER IF EXISTS maintain_{profile_column}_{event} ON {source['table']}")
+            cur.execute(f"DROP FUNCTION IF EXISTS maintain_{profile_column}()")
+            print(f"✅ Dropped maintenance of financial_profile.{profile_column}")
+    conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile financial_profile totals")
+    parser.add_argument('command', nargs='?', default='reconcile',
+                        choices=['reconcile', 'install-triggers', 'drop-triggers'])
+    parser.add_argument('--chunk-size', type=int, default=1000, help="users per UPDATE")
+    parser.add_argument('--dry-run', action='store_true', help="report drift without correcting it")
+    parser.add_argument('--show', type=int, default=20, help="drifted profiles to print")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    print(f"🧮 Profile totals: {args.command}")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        with job_lock(get_db_config(), 'reconcile_profile_totals', tables=['financial_profile'],
+                      wait=args.wait):
+            if args.command == 'install-triggers':
+                install_triggers(conn)
+            elif args.command == 'drop-triggers':
+                drop_triggers(conn)
+            else:
+                rows = find_drift(conn)
+                print_drift(rows, args.show)
+                if rows and not args.dry_run:
+                    apply_corrections(conn, rows, args.chunk_size)
+        print("\n🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ Reconciliation failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Keep the goal_funding table up to date
+
+goal_funding holds, per goal, what calculateGoalFunding (goalCalculations.js)
+and calculateGoalsProgress (chartCalculations.js) work out on every render:
+the projected value of each linked asset's earmarked share at the goal's
+target year, the percent funded and the remaining gap. The arithmetic below
+is a line-for-line port of calculateSIPProjection.
+
+Incremental refresh (default) recomputes only goals that may have changed:
+
+- goals with updated_at past the financial_goal watermark
+- goals whose previous result used an asset with updated_at past the assets
+  watermark, or an asset that no longer exists
+- goals without a goal_funding row, or computed in an earlier year
+
+Watermarks are read back with a safety overlap, so rows committed late by a
+long transaction are still picked up on the next run.
+
+Full refresh recomputes every goal, in parallel by user id range.
+
+refresh_changed() is the per-edit path for jobs that know exactly which rows
+they changed: the edits go through a DependencyIndex and only the goals it
+reports as invalidated are recomputed, in the caller's transaction.
+
+Usage:
+    python refresh_goal_funding.py
+    python refresh_goal_funding.py --full --jobs 4
+    python refresh_goal_funding.py --create-schema
+"""
+
+import argparse
+import datetime
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+from earmark_engine import GOAL_KEY, parse_id, parse_percent
+from validate_earmarks import user_ranges
+
+SCHEMA_FILE = Path("backend/scripts/2025-10-19_create_goal_funding_table.sql")
+
+WATERMARK_TABLES = ['financial_goal', 'assets']
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+
+# Monthly contributions per SIP payment, as in calculateSIPProjection
+MONTHLY_FACTOR = {
+    'Weekly': 4.33,
+    'Bi-weekly': 2.17,
+    'Monthly': 1,
+    'Bi-monthly': 2,
+    'Quarterly': 1 / 3,
+    'Semi-annual': 1 / 6,
+    'Annual': 1 / 12,
+    'Lumpsum': 0,
+}
+
+def sip_projection(initial, sip_amount, sip_frequency, annual_rate, years, sip_expiry_date, current_year):
+    """Projected value of a lump sum plus SIP after `years` years"""
+    if sip_amount <= 0 or not sip_frequency:
+        return initial * (1 + annual_rate) ** years
+
+    monthly_sip = sip_amount * MONTHLY_FACTOR.get(sip_frequency, 0)
+
+    sip_months = years * 12
+    if sip_expiry_date:
+        # new Date(invalid).getFullYear() is NaN, which switches the SIP off
+        match = re.match(r'^\s*(\d{4})', str(sip_expiry_date))
+        sip_months = min(years * 12, max(0, int(match.group(1)) - current_year) * 12) if match else 0
+
+    monthly_rate = annual_rate / 12
+    total_months = years * 12
+    lump_value = initial * (1 + monthly_rate) ** total_months
+
+    sip_value = 0.0
+    if monthly_sip > 0 and sip_months > 0:
+        if monthly_rate:
+            accumulated = monthly_sip * (((1 + monthly_rate) ** sip_months - 1) / monthly_rate)
+        else:
+            accumulated = monthly_sip * sip_months
+        sip_value = accumulated * (1 + monthly_rate) ** (total_months - sip_months)
+    return lump_value + sip_value
+
+def goal_funding(goal, assets_by_id, current_year):
+    """One goal_funding row for a goal dict and its user's assets by id"""
+    # parseFloat(goal.target_amount || goal.amount) || 0: a zero target_amount
+    # falls through to amount, like a missing one
+    target_amount = float(goal['target_amount'] or goal['amount'] or 0)
+    target_year = parse_id(goal['target_year']) or current_year + 10
+    years = max(1, target_year - current_year)
+
+    funded = 0.0
+    linked_ids = []
+    linked = (goal['custom_data'] or {}).get(GOAL_KEY)
+    for entry in linked if isinstance(linked, list) else []:
+        asset = assets_by_id.get(parse_id(entry.get('assetId'))) if isinstance(entry, dict) else None
+        if asset is None:
+            continue
+        linked_ids.append(asset['id'])
+        custom = asset['custom_data'] or {}
+        percent = parse_percent(entry.get('percent'))
+        funded += sip_projection(
+            initial=float(asset['current_value'] or 0) * percent / 100,
+            sip_amount=parse_percent(custom.get('sipAmount')) * percent / 100,
+            sip_frequency=custom.get('sipFrequency') or 'Monthly',
+            annual_rate=(parse_percent(custom.get('expectedReturn')) or 5) / 100,
+            years=years,
+            sip_expiry_date=custom.get('sipExpiryDate') or '',
+            current_year=current_year,
+        )
+
+    if target_amount == 0:
+        funded, percent_funded, gap = 0.0, 0.0, 0.0
+    else:
+        percent_funded = round(funded / target_amount * 100, 2)
+        gap = target_amount - funded
+    return (goal['id'], goal['user_id'], target_amount, target_year, years,
+            round(funded, 2), percent_funded, round(gap, 2), sorted(set(linked_ids)), current_year)
+
+def refresh_goals(cur, where, params, current_year):
+    """Recompute and upsert the goals matching `where`; returns the count"""
+    # amount and target_year only exist on some deployments, so read them through to_jsonb
+    cur.execute(f"""
+        SELECT id, user_id, target_amount,
+               (to_jsonb(g)->>'amount')::double precision, (to_jsonb(g)->>'target_year')::integer, custom_data
+        FROM financial_goal g
+        WHERE {where}
+    """, params)
+    goals = [dict(zip(['id', 'user_id', 'target_amount', 'amount', 'target_year', 'custom_data'], row))
+             for row in cur.fetchall()]
+    if not goals:
+        return 0
+
+    # Only the referenced assets, and only those of the goal's own user
+    cur.execute("""
+        SELECT a.id, a.user_id, a.current_value, a.custom_data
+        FROM assets a
+        WHERE a.user_id = ANY(%s)
+          AND a.id = ANY(%s)
+    """, (sorted({g['user_id'] for g in goals}),
+          sorted({parse_id(e.get('assetId')) or 0 for g in goals
+                  for e in ((g['custom_data'] or {}).get(GOAL_KEY) or []) if isinstance(e, dict)})))
+    assets = {}
+    for asset_id, user_id, current_value, custom_data in cur.fetchall():
+        assets.setdefault(user_id, {})[asset_id] = {
+            'id': asset_id, 'current_value': current_value, 'custom_data': custom_data}
+
+    rows = [goal_funding(goal, assets.get(goal['user_id'], {}), current_year) for goal in goals]
+    execute_values(cur, """
+        INSERT INTO goal_funding (goal_id, user_id, target_amount, target_year, years_to_target,
+                                  funded_amount, percent_funded, funding_gap, linked_asset_ids, computed_year)
+        VALUES %s
+        ON CONFLICT (goal_id) DO UPDATE SET
+            user_id = EXCLUDED.user_id,
+            target_amount = EXCLUDED.target_amount,
+            target_year = EXCLUDED.target_year,
+            years_to_target = EXCLUDED.years_to_target,
+            funded_amount = EXCLUDED.funded_amount,
+            percent_funded = EXCLUDED.percent_funded,
+            funding_gap = EXCLUDED.funding_gap,
+            linked_asset_ids = EXCLUDED.linked_asset_ids,
+            computed_year = EXCLUDED.computed_year,
+            refreshed_at = NOW()
+    """, rows, template="(%s, %s, %s, %s, %s, %s, %s, %s, %s::int[], %s)", page_size=1000)
+    return len(rows)
+
+def refresh_changed(cur, index, changes, current_year):
+    """Recompute the goals a batch of (table, row_id, new_row) edits invalidates
+
+    `index` must hold the users' rows as they were before the edits; the rows
+    themselves must already be written. Returns the number of goals refreshed.
+    """
+    stale = set()
+    for table, row_id, new_row in changes:
+        stale |= index.change(table, row_id, new_row)
+    goal_ids = sorted(key[1] for key in stale if key[0] == 'goal_funding')
+    if not goal_ids:
+        return 0
+    return refresh_goals(cur, "g.id = ANY(%s)", (goal_ids,), current_year)
+
+def current_watermarks(cur):
+    """{table: MAX(updated_at)} right now"""
+    marks = {}
+    for table in WATERMARK_TABLES:
+        cur.execute(f"SELECT MAX(updated_at) FROM {table}")
+        marks[table] = cur.fetchone()[0]
+    return marks
+
+def save_watermarks(cur, marks):
+    """Store new watermarks, never moving one backwards"""
+    for table, mark in marks.items():
+        if mark is None:
+            continue
+        cur.execute("""
+            INSERT INTO goal_funding_watermark (source_table, watermark) VALUES (%s, %s)
+            ON CONFLICT (source_table) DO UPDATE
+            SET watermark = GREATEST(goal_funding_watermark.watermark, EXCLUDED.watermark),
+                updated_at = NOW()
+        """, (table, mark))
+
+def refresh_incremental(conn, chunk_size, current_year):
+    """Recompute goals touched since the stored watermarks"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT source_table, watermark FROM goal_funding_watermark")
+        stored = dict(cur.fetchall())
+        new_marks = current_watermarks(cur)
+        since = {table: stored[table] - WATERMARK_OVERLAP if table in stored else datetime.datetime.min
+                 for table in WATERMARK_TABLES}
+        print(f"⏱️  Changes since: goals {stored.get('financial_goal', 'never')}, "
+              f"assets {stored.get('assets', 'never')}")
+
+        cur.execute("""
+            SELECT g.id FROM financial_goal g
+            LEFT JOIN goal_funding f ON f.goal_id = g.id
+            WHERE f.goal_id IS NULL OR f.computed_year <> %(year)s OR g.updated_at > %(goals_since)s
+            UNION
+            SELECT f.goal_id FROM goal_funding f
+            WHERE f.linked_asset_ids && ARRAY(SELECT id FROM assets WHERE updated_at > %(assets_since)s)
+            UNION
+            SELECT f.goal_id FROM goal_funding f, unnest(f.linked_asset_ids) AS linked(asset_id)
+            WHERE NOT EXISTS (SELECT 1 FROM assets a WHERE a.id = linked.asset_id)
+        """, {'year': current_year, 'goals_since': since['financial_goal'], 'assets_since': since['assets']})
+        dirty = sorted(row[0] for row in cur.fetchall())
+        print(f"🔍 {len(dirty)} goals to recompute")
+
+        refreshed = 0
+        for i in range(0, len(dirty), chunk_size):
+            refreshed += refresh_goals(cur, "g.id = ANY(%s)", (dirty[i:i + chunk_size],), current_year)
+        save_watermarks(cur, new_marks)
+    conn.commit()
+    return refreshed
+
+def refresh_range(db_config, start, end, current_year):
+    """Full refresh of one user id range, in its own process and transaction"""
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn.cursor() as cur:
+            count = refresh_goals(cur, "g.user_id >= %s AND g.user_id < %s", (start, end), current_year)
+        conn.commit()
+        return count
+    finally:
+        conn.close()
+
+def refresh_full(conn, db_config, chunk_size, jobs, current_year):
+    """Recompute every goal, user ranges in parallel"""
+    with conn.cursor() as cur:
+        # Taken before any range starts, so nothing changed meanwhile is skipped later
+        new_marks = current_watermarks(cur)
+    conn.commit()
+
+    ranges = user_ranges(db_config, chunk_size)
+    print(f"📦 {len(ranges)} user ranges on {jobs} workers")
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(refresh_range, db_config, start, end, current_year) for start, end in ranges]
+        refreshed = sum(future.result() for future in futures)
+
+    with conn.cursor() as cur:
+        save_watermarks(cur, new_marks)
+    conn.commit()
+    return refreshed
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def create_schema(conn):
+    """Create goal_funding and its watermark table if missing"""
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_FILE.read_text(encoding='utf-8'))
+    conn.commit()
+    print(f"✅ Applied {SCHEMA_FILE}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the goal_funding table")
+    parser.add_argument('--full', action='store_true', help="recompute every goal instead of changed ones")
+    parser.add_argument('--jobs', type=int, default=4, help="parallel workers for --full")
+    parser.add_argument('--chunk-size', type=int, default=500,
+                        help="goals per batch (incremental) or user ids per range (--full)")
+    parser.add_argument('--create-schema', action='store_true', help="create the tables first")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    print("🎯 Refreshing goal funding")
+    print("=" * 60)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    current_year = datetime.date.today().year
+    try:
+        if args.create_schema:
+            create_schema(conn)
+        with job_lock(get_db_config(), 'refresh_goal_funding', tables=['goal_funding'], wait=args.wait):
+            started = time.perf_counter()
+            if args.full:
+                refreshed = refresh_full(conn, get_db_config(), args.chunk_size, args.jobs, current_year)
+            else:
+                refreshed = refresh_incremental(conn, args.chunk_size, current_year)
+        print(f"\n✅ Refreshed {refreshed} goals in {time.perf_counter() - started:.2f}s")
+        print("🎉 Done!")
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"❌ Refresh failed: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,33 @@
 """
 Database Migration Script for LifeMaps
 This script runs all the necessary database migrations to set up the complete schema.
+
+Applied migrations are recorded in a schema_migrations ledger (file name and
+checksum), so only pending files run. Several databases can be migrated at
+once; each target runs in its own worker process and the whole fleet stops
+early on the first schema conflict.
+
+Usage:
+    python run_migrations.py                                  # local lifemaps database
+    python run_migrations.py --target postgresql://... --target postgresql://...
+    python run_migrations.py --config migration_targets.json --jobs 4
+    python run_migrations.py --target postgresql://... --baseline
+
+A config file is a JSON list of targets, each either a DATABASE_URL string or
+an object like {"name": "render", "url": "postgresql://..."}.
 """
 
+import argparse
+import hashlib
+import json
 import psycopg2
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Manager
 from pathlib import Path
+from urllib.parse import urlparse
+
+from setup_database import MIGRATION_FILES
 
 # Database connection parameters
 DB_CONFIG = {
@@ -17,10 +39,14 @@ DB_CONFIG = {
     'port': 5432
 }
 
-def connect_to_db():
+# SQLSTATE class 42 covers duplicate/undefined tables, columns and objects:
+# the database's schema does not match what the migration expects
+SCHEMA_CONFLICT_CLASS = '42'
+
+def connect_to_db(db_config=None):
     """Connect to the PostgreSQL database"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = psycopg2.connect(**(db_config or DB_CONFIG))
         conn.autocommit = True
         print("✅ Connected to PostgreSQL database")
         return conn
@@ -28,64 +54,130 @@ def connect_to_db():
         print(f"❌ Error connecting to database: {e}")
         return None
 
-def run_sql_file(cursor, file_path):
-    """Run a SQL file"""
+def parse_database_url(database_url):
+    """Turn a DATABASE_URL into psycopg2 connection parameters"""
+    parsed = urlparse(database_url)
+    return {
+        'host': parsed.hostname,
+        'port': parsed.port or 5432,
+        'database': parsed.path[1:],  # Remove leading slash
+        'user': parsed.username,
+        'password': parsed.password
+    }
+
+def load_targets(urls, config_path):
+    """Build the list of (name, db_config) targets from URLs and/or a config file"""
+    entries = list(urls or [])
+    if config_path:
+        with open(config_path, 'r', encoding='utf-8') as file:
+            entries.extend(json.load(file))
+
+    if not entries:
+        return [(DB_CONFIG['database'], DB_CONFIG)]
+
+    targets = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'url': entry}
+        config = parse_database_url(entry['url'])
+        name = entry.get('name') or f"{config['host']}/{config['database']}"
+        targets.append((name, config))
+    return targets
+
+def file_checksum(file_path):
+    """SHA-256 of a migration file"""
+    return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+def ensure_ledger(cursor):
+    """Create the schema_migrations ledger if it does not exist"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            filename VARCHAR(255) PRIMARY KEY,
+            checksum VARCHAR(64) NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+def get_applied_migrations(cursor):
+    """Return {filename: checksum} for every migration already applied"""
+    cursor.execute("SELECT filename, checksum FROM schema_migrations")
+    return dict(cursor.fetchall())
+
+def migrate_target(name, db_config, abort_event, baseline=False):
+    """Apply pending migrations to one database (runs in a worker process)"""
+    result = {'target': name, 'applied': [], 'skipped': 0, 'status': 'ok', 'error': None}
+
+    def log(message):
+        print(f"[{name}] {message}", flush=True)
+
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            sql_content = file.read()
-        
-        print(f"📄 Running {file_path.name}...")
-        cursor.execute(sql_content)
-        print(f"✅ Successfully executed {file_path.name}")
-        return True
-    except Exception as e:
-        print(f"❌ Error running {file_path.name}: {e}")
-        return False
+        conn = psycopg2.connect(**db_config)
+    except psycopg2.Error as e:
+        log(f"❌ Error connecting to database: {e}")
+        result.update(status='failed', error=str(e).strip())
+        return result
 
-def main():
-    """Main migration function"""
-    print("🚀 Starting LifeMaps Database Migrations...")
-    print("=" * 50)
-    
-    # Connect to database
-    conn = connect_to_db()
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        ensure_ledger(cursor)
+        applied = get_applied_migrations(cursor)
+        conn.autocommit = False
+
+        for migration_file in MIGRATION_FILES:
+            if abort_event.is_set():
+                log("⏹️  Fleet aborted - stopping before the next migration")
+                result['status'] = 'aborted'
+                break
+
+            file_path = Path(migration_file)
+            if not file_path.exists():
+                log(f"⚠️  File not found: {migration_file}")
+                continue
+
+            checksum = file_checksum(file_path)
+            if file_path.name in applied:
+                if applied[file_path.name] != checksum:
+                    log(f"💥 {file_path.name} changed after it was applied")
+                    result.update(status='conflict', error=f"{file_path.name} checksum drift")
+                    abort_event.set()
+                    break
+                result['skipped'] += 1
+                continue
+
+            try:
+                if not baseline:
+                    log(f"📄 Running {file_path.name}...")
+                    cursor.execute(file_path.read_text(encoding='utf-8'))
+                cursor.execute(
+                    "INSERT INTO schema_migrations (filename, checksum) VALUES (%s, %s)",
+                    (file_path.name, checksum)
+                )
+                conn.commit()
+                result['applied'].append(file_path.name)
+                log(f"✅ {'Recorded' if baseline else 'Applied'} {file_path.name}")
+            except psycopg2.Error as e:
+                conn.rollback()
+                error = str(e).strip().splitlines()[0]
+                log(f"❌ Error running {file_path.name}: {error}")
+                if e.pgcode and e.pgcode.startswith(SCHEMA_CONFLICT_CLASS):
+                    result.update(status='conflict', error=f"{file_path.name}: {error}")
+                    abort_event.set()
+                else:
+                    result.update(status='failed', error=f"{file_path.name}: {error}")
+                break
+    finally:
+        conn.close()
+
+    return result
+
+def list_tables(db_config):
+    """Show the tables in a single migrated database"""
+    conn = connect_to_db(db_config)
     if not conn:
         return
     
     cursor = conn.cursor()
-    
-    # List of migration files in order
-    migration_files = [
-        "backend/scripts/init-db.sql",
-        "backend/scripts/2025-09-14_autosave_compat.sql",
-        "backend/scripts/2025-09-14_add_missing_columns.sql",
-        "backend/scripts/2025-09-14_create_assets_table.sql",
-        "backend/scripts/2025-09-14_create_user_tags_table.sql",
-        "backend/scripts/2025-09-14_create_work_assets_table.sql",
-        "backend/scripts/2025-09-14_add_target_age_to_goals.sql"
-    ]
-    
-    success_count = 0
-    total_count = len(migration_files)
-    
-    for migration_file in migration_files:
-        file_path = Path(migration_file)
-        if file_path.exists():
-            if run_sql_file(cursor, file_path):
-                success_count += 1
-        else:
-            print(f"⚠️  File not found: {migration_file}")
-    
-    # Summary
-    print("=" * 50)
-    print(f"📊 Migration Summary: {success_count}/{total_count} files executed successfully")
-    
-    if success_count == total_count:
-        print("🎉 All migrations completed successfully!")
-    else:
-        print("⚠️  Some migrations failed. Please check the errors above.")
-    
-    # Test database connection and show tables
     try:
         cursor.execute("""
             SELECT table_name 
@@ -104,5 +196,68 @@ def main():
     conn.close()
     print("\n✅ Database connection closed")
 
+def main(urls=None, config_path=None, jobs=None, baseline=False):
+    """Main migration function"""
+    print("🚀 Starting LifeMaps Database Migrations...")
+    print("=" * 50)
+
+    targets = load_targets(urls, config_path)
+    jobs = jobs or len(targets)
+    print(f"🎯 {len(targets)} target(s), {min(jobs, len(targets))} worker(s)")
+
+    results = []
+    with Manager() as manager:
+        abort_event = manager.Event()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(migrate_target, name, config, abort_event, baseline): name
+                for name, config in targets
+            }
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                result = future.result()
+                results.append(result)
+                if result['status'] == 'conflict':
+                    print(f"💥 Schema conflict on {result['target']} - aborting remaining targets")
+                    for pending in futures:
+                        pending.cancel()
+
+    finished = {result['target'] for result in results}
+    for name, _ in targets:
+        if name not in finished:
+            results.append({'target': name, 'applied': [], 'skipped': 0,
+                            'status': 'aborted', 'error': 'not started'})
+
+    # Summary
+    print("=" * 50)
+    print("📊 Migration Summary:")
+    icons = {'ok': '✅', 'failed': '❌', 'conflict': '💥', 'aborted': '⏹️ '}
+    for result in sorted(results, key=lambda r: r['target']):
+        line = (f"  {icons[result['status']]} {result['target']}: "
+                f"{len(result['applied'])} applied, {result['skipped']} already up to date")
+        if result['error']:
+            line += f" ({result['error']})"
+        print(line)
+
+    if all(result['status'] == 'ok' for result in results):
+        print("🎉 All migrations completed successfully!")
+    else:
+        print("⚠️  Some migrations failed. Please check the errors above.")
+
+    if len(targets) == 1:
+        list_tables(targets[0][1])
+
+    return results
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Apply pending LifeMaps migrations")
+    parser.add_argument('--target', action='append', metavar='DATABASE_URL',
+                        help="database to migrate (repeatable)")
+    parser.add_argument('--config', help="JSON file listing targets")
+    parser.add_argument('--jobs', type=int, help="worker processes (default: one per target)")
+    parser.add_argument('--baseline', action='store_true',
+                        help="record pending migrations as applied without running them")
+    args = parser.parse_args()
+
+    main(args.target, args.config, args.jobs, args.baseline)
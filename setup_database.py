@@ -2,8 +2,21 @@
 """
 Complete Database Setup Script for LifeMaps
 This script creates the database and runs all migrations.
+
+With --template, the migrations are replayed once into a template database
+(keyed by a checksum of the migration files) and fresh databases are cloned
+from it with CREATE DATABASE ... TEMPLATE, which is a file-level copy.
+
+Usage:
+    python setup_database.py                     # create lifemaps and replay migrations
+    python setup_database.py --template          # clone lifemaps from lifemaps_template
+    python setup_database.py --template --reset  # drop lifemaps first, then clone
+    python setup_database.py --template --db lifemaps_test
 """
 
+import argparse
+import hashlib
+import time
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 import os
@@ -17,6 +30,26 @@ DB_CONFIG = {
     'port': 5432
 }
 
+TEMPLATE_DB = 'lifemaps_template'
+
+# Migration files in the order they must be applied
+MIGRATION_FILES = [
+    "backend/scripts/init-db.sql",
+    "backend/scripts/2025-01-27_add_goals_custom_data.sql",
+    "backend/scripts/2025-09-14_autosave_compat.sql",
+    "backend/scripts/2025-09-14_add_missing_columns.sql",
+    "backend/scripts/2025-09-14_create_assets_table.sql",
+    "backend/scripts/2025-09-14_create_user_tags_table.sql",
+    "backend/scripts/2025-09-14_create_work_assets_table.sql",
+    "backend/scripts/2025-09-14_add_target_age_to_goals.sql",
+    "backend/scripts/2025-10-19_create_asset_goal_link_table.sql",
+    "backend/scripts/2025-10-19_create_goal_funding_table.sql",
+    "backend/scripts/2025-10-19_create_earmark_reverse_index.sql",
+    "backend/scripts/2025-10-19_create_goal_funding_function.sql",
+    "backend/scripts/2025-10-19_create_earmark_suggestions_table.sql",
+    "backend/scripts/2025-10-19_create_earmark_history.sql"
+]
+
 def connect_to_postgres():
     """Connect to PostgreSQL server (not to a specific database)"""
     try:
@@ -72,6 +105,131 @@ def run_sql_file(cursor, file_path):
         print(f"❌ Error running {file_path.name}: {e}")
         return False
 
+def run_migrations(cursor):
+    """Run every migration file in order, returning (success_count, total_count)"""
+    success_count = 0
+    total_count = len(MIGRATION_FILES)
+
+    for migration_file in MIGRATION_FILES:
+        file_path = Path(migration_file)
+        if file_path.exists():
+            if run_sql_file(cursor, file_path):
+                success_count += 1
+        else:
+            print(f"⚠️  File not found: {migration_file}")
+
+    return success_count, total_count
+
+def migration_ledger_checksum():
+    """Checksum over the ordered migration file names and contents"""
+    digest = hashlib.sha256()
+    for migration_file in MIGRATION_FILES:
+        file_path = Path(migration_file)
+        digest.update(migration_file.encode('utf-8'))
+        digest.update(b'\0')
+        if file_path.exists():
+            digest.update(file_path.read_bytes())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def get_template_checksum(cursor):
+    """Return the checksum stamped on the template database, or None"""
+    cursor.execute("""
+        SELECT shobj_description(oid, 'pg_database')
+        FROM pg_database
+        WHERE datname = %s
+    """, (TEMPLATE_DB,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    comment = row[0] or ''
+    if not comment.startswith('migrations:'):
+        return ''
+    return comment[len('migrations:'):]
+
+def drop_template(cursor):
+    """Drop the template database (it must be unmarked as a template first)"""
+    cursor.execute(f"ALTER DATABASE {TEMPLATE_DB} IS_TEMPLATE false")
+    cursor.execute(f"DROP DATABASE {TEMPLATE_DB}")
+    print(f"🗑️  Dropped template '{TEMPLATE_DB}'")
+
+def ensure_template(cursor):
+    """Build the fully migrated template database unless an up-to-date one exists"""
+    checksum = migration_ledger_checksum()
+    existing = get_template_checksum(cursor)
+
+    if existing == checksum:
+        print(f"✅ Template '{TEMPLATE_DB}' is up to date ({checksum[:12]})")
+        return True
+
+    if existing is not None:
+        print(f"🔄 Template '{TEMPLATE_DB}' is stale ({(existing or 'unstamped')[:12]} != {checksum[:12]})")
+        drop_template(cursor)
+
+    print(f"🏗️  Building template '{TEMPLATE_DB}'...")
+    started = time.perf_counter()
+    cursor.execute(f"CREATE DATABASE {TEMPLATE_DB}")
+
+    template_conn = connect_to_database(TEMPLATE_DB)
+    if not template_conn:
+        return False
+    template_cursor = template_conn.cursor()
+    success_count, total_count = run_migrations(template_cursor)
+    template_cursor.close()
+    template_conn.close()
+
+    if success_count != total_count:
+        # Never stamp a partially migrated template, otherwise every clone inherits the gap
+        print(f"❌ Only {success_count}/{total_count} migrations succeeded - template not saved")
+        drop_template(cursor)
+        return False
+
+    cursor.execute(f"COMMENT ON DATABASE {TEMPLATE_DB} IS %s", (f"migrations:{checksum}",))
+    # Block connections so CREATE DATABASE ... TEMPLATE never fails on a busy source
+    cursor.execute(f"ALTER DATABASE {TEMPLATE_DB} IS_TEMPLATE true ALLOW_CONNECTIONS false")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"✅ Built template '{TEMPLATE_DB}' in {elapsed_ms:.0f} ms ({checksum[:12]})")
+    return True
+
+def clone_from_template(cursor, db_name, reset=False):
+    """Create db_name as a file-level copy of the template database"""
+    cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_name,))
+    if cursor.fetchone():
+        if not reset:
+            print(f"✅ Database '{db_name}' already exists (use --reset to recreate it)")
+            return True
+        cursor.execute(f"DROP DATABASE {db_name} WITH (FORCE)")
+        print(f"🗑️  Dropped database '{db_name}'")
+
+    started = time.perf_counter()
+    cursor.execute(f"CREATE DATABASE {db_name} TEMPLATE {TEMPLATE_DB}")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"✅ Cloned '{db_name}' from '{TEMPLATE_DB}' in {elapsed_ms:.0f} ms")
+    return True
+
+def main_template(db_name, reset=False):
+    """Template setup: build the template once, then clone db_name from it"""
+    print("🚀 Starting LifeMaps Database Setup from template...")
+    print("=" * 60)
+
+    conn = connect_to_postgres()
+    if not conn:
+        return
+
+    cursor = conn.cursor()
+
+    try:
+        if db_name == TEMPLATE_DB:
+            print("❌ Refusing to clone the template onto itself")
+        elif ensure_template(cursor):
+            clone_from_template(cursor, db_name, reset)
+            print("\n✅ Database setup complete!")
+    except psycopg2.Error as e:
+        print(f"❌ Template setup failed: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
 def main():
     """Main setup function"""
     print("🚀 Starting Complete LifeMaps Database Setup...")
@@ -101,26 +259,7 @@ def main():
     cursor = conn.cursor()
     
     # Step 4: Run all migrations
-    migration_files = [
-        "backend/scripts/init-db.sql",
-        "backend/scripts/2025-09-14_autosave_compat.sql",
-        "backend/scripts/2025-09-14_add_missing_columns.sql",
-        "backend/scripts/2025-09-14_create_assets_table.sql",
-        "backend/scripts/2025-09-14_create_user_tags_table.sql",
-        "backend/scripts/2025-09-14_create_work_assets_table.sql",
-        "backend/scripts/2025-09-14_add_target_age_to_goals.sql"
-    ]
-    
-    success_count = 0
-    total_count = len(migration_files)
-    
-    for migration_file in migration_files:
-        file_path = Path(migration_file)
-        if file_path.exists():
-            if run_sql_file(cursor, file_path):
-                success_count += 1
-        else:
-            print(f"⚠️  File not found: {migration_file}")
+    success_count, total_count = run_migrations(cursor)
     
     # Summary
     print("=" * 60)
@@ -151,4 +290,14 @@ def main():
     print("\n✅ Database setup complete!")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Create the LifeMaps database")
+    parser.add_argument('--template', action='store_true',
+                        help=f"clone from {TEMPLATE_DB} instead of replaying migrations")
+    parser.add_argument('--db', default='lifemaps', help="database to create (template mode)")
+    parser.add_argument('--reset', action='store_true', help="drop the database first (template mode)")
+    args = parser.parse_args()
+
+    if args.template:
+        main_template(args.db, args.reset)
+    else:
+        main()
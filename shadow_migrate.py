@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Shadow-table swap migrations with instant rollback
+
+Column type changes and constraint overhauls are normally in-place ALTERs that
+rewrite or revalidate the live table under an exclusive lock and cannot be
+undone without a restore. This script runs them as shadow swaps instead:
+
+1. build <table>_shadow with the new shape (LIKE the live table, then ALTER)
+2. keep it in sync with an AFTER trigger that applies the forward transform
+3. backfill existing rows in id-range chunks
+4. reconcile, then swap names in one short transaction (lock, check row
+   counts, rename, move triggers) and record how long the exclusive lock
+   was held
+5. keep the old table as <table>_preswap, fed by a reverse-transform trigger,
+   so `rollback` swaps straight back without losing writes; values a write
+   did not change keep their original form there
+
+Tables referenced by foreign keys or views are refused: both follow the
+table's OID, so they would keep pointing at the retired table.
+
+Usage:
+    python shadow_migrate.py list
+    python shadow_migrate.py run loan_rate_percent --chunk-size 2000
+    python shadow_migrate.py rollback loan_rate_percent
+    python shadow_migrate.py finalize loan_rate_percent
+    python shadow_migrate.py status
+"""
+
+import argparse
+import time
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import job_lock, get_db_config, JobLockBusy
+from partition_user_tables import copyable_columns, dependent_objects
+
+# Each migration: the ALTER clauses that give the shadow its new shape, and
+# per-column SQL expressions (over the source row) for both directions.
+# Columns without an expression are copied as-is. The reverse sync keeps the
+# pre-swap value of a column whenever its forward transform still gives the
+# new value, so a lossy reverse only applies to values changed after the swap.
+MIGRATIONS = {
+    'loan_rate_percent': {
+        'table': 'financial_loan',
+        'description': 'Store financial_loan.rate as a percentage, DECIMAL(5,2) (2025-01-27_fix_rate_column.sql)',
+        'alter': [
+            "ALTER COLUMN rate TYPE DECIMAL(5,2)",
+        ],
+        'forward': {'rate': "CASE WHEN rate < 1 THEN rate * 100 ELSE rate END"},
+        'reverse': {'rate': "rate / 100"},
+    },
+    'holding_type_check': {
+        'table': 'assets',
+        'description': 'Enforce check_holding_type with NOT NULL, normalising legacy holding_type values',
+        'alter': [
+            "DROP CONSTRAINT IF EXISTS check_holding_type",
+            "ALTER COLUMN holding_type SET NOT NULL",
+            "ADD CONSTRAINT check_holding_type CHECK (holding_type IN ('one_time', 'sip', 'recurring_inflow'))",
+        ],
+        'forward': {
+            'holding_type': (
+                "CASE WHEN lower(btrim(holding_type)) IN ('one_time', 'sip', 'recurring_inflow') "
+                "THEN lower(btrim(holding_type)) ELSE 'one_time' END"
+            ),
+        },
+        'reverse': {},
+    },
+}
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        return psycopg2.connect(**get_db_config())
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def ensure_ledger(cur):
+    """Create the shadow_migrations ledger if it does not exist"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS shadow_migrations (
+            id SERIAL PRIMARY KEY,
+            migration VARCHAR(100) NOT NULL,
+            table_name VARCHAR(100) NOT NULL,
+            state VARCHAR(20) NOT NULL,
+            rows_copied INTEGER,
+            swap_lock_ms NUMERIC(12,2),
+            rollback_lock_ms NUMERIC(12,2),
+            created_at TIMESTAMP DEFAULT NOW(),
+            swapped_at TIMESTAMP,
+            rolled_back_at TIMESTAMP,
+            finalized_at TIMESTAMP
+        )
+    """)
+
+def latest_run(cur, name):
+    """Most recent ledger row for a migration, as a dict"""
+    cur.execute("""
+        SELECT id, state FROM shadow_migrations
+        WHERE migration = %s ORDER BY id DESC LIMIT 1
+    """, (name,))
+    row = cur.fetchone()
+    return {'id': row[0], 'state': row[1]} if row else None
+
+def relation_exists(cur, name):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f'public.{name}',))
+    return cur.fetchone()[0]
+
+def index_definitions(cur, table):
+    """{normalised definition: index name}, with the table and index names blanked out"""
+    cur.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(%s)
+    """, (f'public.{table}',))
+    definitions = {}
+    for name, definition in cur.fetchall():
+        normalised = definition.replace(f" {name} ", " <index> ").replace(f" public.{table} ", " <table> ")
+        definitions[normalised] = name
+    return definitions
+
+def table_triggers(cur, table):
+    """CREATE TRIGGER statements for the table's own triggers, minus our sync triggers"""
+    cur.execute("""
+        SELECT tgname, pg_get_triggerdef(oid)
+        FROM pg_trigger
+        WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal
+    """, (f'public.{table}',))
+    return [(name, definition) for name, definition in cur.fetchall()
+            if not name.startswith('shadow_sync')]
+
+def select_list(columns, transform):
+    """Column expressions for INSERT ... SELECT from a source row"""
+    return ", ".join(f"({transform[column]})" if column in transform else column for column in columns)
+
+def install_sync_trigger(cur, source, target, columns, transform, trigger_name, preserve=None):
+    """AFTER trigger on source that upserts/deletes the transformed row in target
+
+    preserve: forward transform of target's columns; a column whose existing
+    value still maps to NEW's value is left as it is in target.
+    """
+    column_list = ", ".join(columns)
+    preserve = preserve or {}
+    updates = ", ".join(
+        f"{column} = CASE WHEN (SELECT {preserve[column]} FROM (SELECT {target}.*) AS prior) "
+        f"IS NOT DISTINCT FROM NEW.{column} THEN {target}.{column} ELSE EXCLUDED.{column} END"
+        if column in preserve
+        else f"{column} = EXCLUDED.{column}"
+        for column in columns if column != 'id'
+    )
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION {trigger_name}_{source}()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                DELETE FROM {target} WHERE id = OLD.id;
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'UPDATE' AND OLD.id <> NEW.id THEN
+                DELETE FROM {target} WHERE id = OLD.id;
+            END IF;
+            INSERT INTO {target} ({column_list})
+            SELECT {select_list(columns, transform)} FROM (SELECT NEW.*) AS src
+            ON CONFLICT (id) DO UPDATE SET {updates};
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    cur.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON {source}")
+    cur.execute(f"""
+        CREATE TRIGGER {trigger_name}
+            AFTER INSERT OR UPDATE OR DELETE ON {source}
+            FOR EACH ROW
+            EXECUTE FUNCTION {trigger_name}_{source}()
+    """)
+
+def drop_sync_trigger(cur, source, trigger_name, created_on=None):
+    """Drop a sync trigger; created_on is the table's name when the trigger was
+    installed, which names its function"""
+    cur.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON {source}")
+    cur.execute(f"DROP FUNCTION IF EXISTS {trigger_name}_{created_on or source}()")
+
+def build_shadow(conn, spec):
+    """Create <table>_shadow in the new shape and start syncing it"""
+    table = spec['table']
+    shadow = f"{table}_shadow"
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TABLE {shadow} (LIKE {table} INCLUDING ALL)")
+        cur.execute("""
+            SELECT conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE conrelid = to_regclass(%s) AND contype = 'f'
+        """, (f'public.{table}',))
+        for name, definition in cur.fetchall():
+            cur.execute(f"ALTER TABLE {shadow} ADD CONSTRAINT {name} {definition}")
+        for clause in spec['alter']:
+            # Instant: the shadow is still empty
+            cur.execute(f"ALTER TABLE {shadow} {clause}")
+        columns = copyable_columns(cur, table)
+        install_sync_trigger(cur, table, shadow, columns, spec['forward'], 'shadow_sync_forward')
+    conn.commit()
+    print(f"   ✅ Built {shadow} and started forward sync")
+    return columns
+
+def backfill(conn, spec, columns, chunk_size):
+    """Copy existing rows into the shadow in id-range chunks"""
+    table = spec['table']
+    shadow = f"{table}_shadow"
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM {table}")
+        min_id, max_id = cur.fetchone()
+    conn.commit()
+
+    copied = 0
+    for start in range(min_id, max_id + 1, chunk_size):
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO {shadow} ({", ".join(columns)})
+                SELECT {select_list(columns, spec['forward'])} FROM {table}
+                WHERE id >= %s AND id < %s
+                ON CONFLICT (id) DO NOTHING
+            """, (start, start + chunk_size))
+            copied += cur.rowcount
+        conn.commit()
+        print(f"   📦 ids {start}..{min(start + chunk_size, max_id + 1) - 1}: {copied} rows copied so far")
+    return copied
+
+def reconcile_rows(cur, live, incoming, columns, transform):
+    """Catch rows a concurrent delete raced past the chunked backfill"""
+    cur.execute(f"DELETE FROM {incoming} s WHERE NOT EXISTS (SELECT 1 FROM {live} t WHERE t.id = s.id)")
+    cur.execute(f"""
+        INSERT INTO {incoming} ({", ".join(columns)})
+        SELECT {select_list(columns, transform)} FROM {live}
+        ON CONFLICT (id) DO NOTHING
+    """)
+
+def row_counts(cur, live, incoming):
+    cur.execute(f"SELECT (SELECT COUNT(*) FROM {live}), (SELECT COUNT(*) FROM {incoming})")
+    return cur.fetchone()
+
+def swap(cur, live, live_suffix, incoming, columns, transform, reconcile=True):
+    """Swap `incoming` into the live name; the live table is renamed with live_suffix.
+
+    With reconcile, the caller has already run reconcile_rows() outside the
+    lock; here the row counts are only checked, and reconciled again if they
+    drifted. Returns the perf_counter() time the exclusive lock was requested;
+    the lock is held until the caller commits.
+    """
+    retired = f"{live}{live_suffix}"
+    cur.execute("SET LOCAL lock_timeout = '5s'")
+    locked = time.perf_counter()
+    cur.execute(f"LOCK TABLE {live}, {incoming} IN ACCESS EXCLUSIVE MODE")
+
+    if reconcile:
+        live_count, incoming_count = row_counts(cur, live, incoming)
+        if live_count != incoming_count:
+            print(f"   ⚠️  Row counts drifted ({live_count} vs {incoming_count}) - reconciling under the lock")
+            reconcile_rows(cur, live, incoming, columns, transform)
+            live_count, incoming_count = row_counts(cur, live, incoming)
+            if live_count != incoming_count:
+                raise RuntimeError(f"row counts differ after reconcile ({live_count} vs {incoming_count})")
+
+    live_indexes = index_definitions(cur, live)
+    incoming_indexes = index_definitions(cur, incoming)
+    incoming_triggers = table_triggers(cur, incoming)
+    live_triggers = table_triggers(cur, live)
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (f'public.{live}',))
+    sequence = cur.fetchone()[0]
+
+    cur.execute(f"ALTER TABLE {live} RENAME TO {retired}")
+    for definition, name in live_indexes.items():
+        cur.execute(f"ALTER INDEX {name} RENAME TO {(name + live_suffix)[:63]}")
+    cur.execute(f"ALTER TABLE {incoming} RENAME TO {live}")
+    for definition, name in incoming_indexes.items():
+        if definition in live_indexes:
+            cur.execute(f"ALTER INDEX {name} RENAME TO {live_indexes[definition]}")
+
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {live}.id")
+
+    # The incoming table gets the live table's triggers unless it already has its own;
+    # the captured definitions say "ON public.<live>", which now names the incoming table
+    existing = {name for name, _ in incoming_triggers}
+    for name, definition in live_triggers:
+        if name not in existing:
+            cur.execute(definition)
+    # The retired table must not fire them again for rows the reverse sync
+    # copies into it (the profile totals would count every write twice)
+    for name, _ in live_triggers:
+        cur.execute(f"DROP TRIGGER {name} ON {retired}")
+
+    return locked
+
+def run_migration(conn, name, spec, chunk_size):
+    """Build, backfill and swap in one migration"""
+    table = spec['table']
+    with conn.cursor() as cur:
+        ensure_ledger(cur)
+        run = latest_run(cur, name)
+        if run and run['state'] in ('synced', 'swapped'):
+            print(f"❌ {name} is already {run['state']} - finalize or roll it back first")
+            return
+        for leftover in (f"{table}_shadow", f"{table}_preswap"):
+            if relation_exists(cur, leftover):
+                print(f"❌ {leftover} already exists - finalize the previous shadow migration first")
+                return
+        blockers = dependent_objects(cur, table)
+        if blockers:
+            for blocker in blockers:
+                print(f"❌ Cannot swap {table}: {blocker}")
+            return
+        cur.execute("""
+            INSERT INTO shadow_migrations (migration, table_name, state)
+            VALUES (%s, %s, 'synced') RETURNING id
+        """, (name, table))
+        run_id = cur.fetchone()[0]
+    conn.commit()
+
+    try:
+        columns = build_shadow(conn, spec)
+        copied = backfill(conn, spec, columns, chunk_size)
+        with conn.cursor() as cur:
+            reconcile_rows(cur, table, f"{table}_shadow", columns, spec['forward'])
+        conn.commit()
+
+        with conn.cursor() as cur:
+            # Rows are already in the new shape: reconcile with the forward transform
+            locked = swap(cur, table, '_preswap', f"{table}_shadow", columns, spec['forward'])
+            drop_sync_trigger(cur, f"{table}_preswap", 'shadow_sync_forward', created_on=table)
+
+            reverse = spec.get('reverse')
+            if reverse is not None:
+                install_sync_trigger(cur, table, f"{table}_preswap", columns, reverse, 'shadow_sync_reverse',
+                                     preserve=spec['forward'])
+            cur.execute("""
+                UPDATE shadow_migrations
+                SET state = 'swapped', rows_copied = %s, swapped_at = NOW()
+                WHERE id = %s
+            """, (copied, run_id))
+        conn.commit()
+        lock_ms = (time.perf_counter() - locked) * 1000
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Shadow migration failed: {e}")
+        with conn.cursor() as cur:
+            drop_sync_trigger(cur, table, 'shadow_sync_forward')
+            cur.execute(f"DROP TABLE IF EXISTS {table}_shadow")
+            cur.execute("UPDATE shadow_migrations SET state = 'failed' WHERE id = %s", (run_id,))
+        conn.commit()
+        return
+
+    # Recorded separately: the lock is only released by the commit above
+    with conn.cursor() as cur:
+        cur.execute("UPDATE shadow_migrations SET swap_lock_ms = %s WHERE id = %s", (lock_ms, run_id))
+    conn.commit()
+
+    print(f"🔀 Swapped {table}: {copied} rows, exclusive lock held {lock_ms:.1f} ms")
+    if spec.get('reverse') is None:
+        print(f"⚠️  No reverse transform: {table}_preswap stops receiving writes")
+    else:
+        print(f"↩️  {table}_preswap kept in sync for instant rollback")
+
+def rollback_migration(conn, name, spec):
+    """Swap the pre-swap table back in"""
+    table = spec['table']
+    with conn.cursor() as cur:
+        ensure_ledger(cur)
+        run = latest_run(cur, name)
+        if not run or run['state'] != 'swapped':
+            print(f"❌ {name} is not in the swapped state")
+            return
+        blockers = dependent_objects(cur, table)
+        if blockers:
+            for blocker in blockers:
+                print(f"❌ Cannot swap {table} back: {blocker}")
+            return
+        if spec.get('reverse') is None:
+            print(f"⚠️  {table}_preswap was not kept in sync - writes since the swap will be lost")
+
+        drop_sync_trigger(cur, table, 'shadow_sync_reverse')
+        # The new-shape table goes back to being the shadow; no reconcile, the
+        # reverse trigger kept the old table current
+        locked = swap(cur, table, '_shadow', f"{table}_preswap", [], {}, reconcile=False)
+        cur.execute("""
+            UPDATE shadow_migrations
+            SET state = 'rolled_back', rolled_back_at = NOW()
+            WHERE id = %s
+        """, (run['id'],))
+    conn.commit()
+    lock_ms = (time.perf_counter() - locked) * 1000
+
+    with conn.cursor() as cur:
+        cur.execute("UPDATE shadow_migrations SET rollback_lock_ms = %s WHERE id = %s", (lock_ms, run['id']))
+    conn.commit()
+
+    print(f"↩️  Rolled back {name}: exclusive lock held {lock_ms:.1f} ms")
+    print(f"   The migrated table is kept as {table}_shadow; finalize to drop it")
+
+def finalize_migration(conn, name, spec):
+    """Drop the table kept for rollback and stop the reverse sync"""
+    table = spec['table']
+    with conn.cursor() as cur:
+        ensure_ledger(cur)
+        run = latest_run(cur, name)
+        if not run or run['state'] not in ('swapped', 'rolled_back'):
+            print(f"❌ Nothing to finalize for {name}")
+            return
+        drop_sync_trigger(cur, table, 'shadow_sync_reverse')
+        leftover = f"{table}_preswap" if run['state'] == 'swapped' else f"{table}_shadow"
+        cur.execute(f"DROP TABLE IF EXISTS {leftover}")
+        cur.execute("UPDATE shadow_migrations SET finalized_at = NOW(), state = %s WHERE id = %s",
+                    ('finalized' if run['state'] == 'swapped' else 'abandoned', run['id']))
+    conn.commit()
+    print(f"🗑️  Finalized {name}: dropped {leftover}")
+
+def show_status(conn):
+    with conn.cursor() as cur:
+        ensure_ledger(cur)
+        cur.execute("""
+            SELECT migration, table_name, state, rows_copied, swap_lock_ms, rollback_lock_ms, created_at
+            FROM shadow_migrations ORDER BY id
+        """)
+        rows = cur.fetchall()
+    conn.commit()
+
+    print("📋 Shadow migrations")
+    print("=" * 60)
+    if not rows:
+        print("   (none)")
+    for migration, table, state, rows_copied, swap_ms, rollback_ms, created in rows:
+        line = f"   {created:%Y-%m-%d %H:%M} {migration} on {table}: {state}"
+        if rows_copied is not None:
+            line += f", {rows_copied} rows"
+        if swap_ms is not None:
+            line += f", swap lock {swap_ms} ms"
+        if rollback_ms is not None:
+            line += f", rollback lock {rollback_ms} ms"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Shadow-table swap migrations")
+    parser.add_argument('command', choices=['list', 'run', 'rollback', 'finalize', 'status'])
+    parser.add_argument('migration', nargs='?', help="migration name (see 'list')")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="rows per backfill transaction")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name, spec in MIGRATIONS.items():
+            print(f"  - {name} ({spec['table']}): {spec['description']}")
+        return
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        if args.command == 'status':
+            show_status(conn)
+            return
+
+        spec = MIGRATIONS.get(args.migration)
+        if not spec:
+            print(f"❌ Unknown migration '{args.migration}' (see 'list')")
+            return
+
+        print(f"🔧 {args.command}: {args.migration} on {spec['table']}")
+        print("=" * 60)
+        with job_lock(get_db_config(), f"shadow_migrate:{args.migration}",
+                      tables=[spec['table']], wait=args.wait):
+            if args.command == 'run':
+                run_migration(conn, args.migration, spec, args.chunk_size)
+            elif args.command == 'rollback':
+                rollback_migration(conn, args.migration, spec)
+            else:
+                finalize_migration(conn, args.migration, spec)
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
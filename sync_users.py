@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Copy selected users' rows from one database to another with COPY streams
+
+Moves every row of the given users across the tables compare_databases.py
+digests (user, financial_profile, assets, financial_goal, financial_expense,
+financial_loan, financial_insurance, work_assets, user_tags,
+user_asset_columns), making the target match the source for those users.
+
+Per batch of users, in one target transaction:
+
+1. each table is streamed with COPY (SELECT ... WHERE user_id = ANY(...)) TO
+   STDOUT on the source, through an OS pipe, into COPY ... FROM STDIN on a
+   temp staging table on the target - nothing is buffered beyond the pipe, so
+   memory stays flat however large a user is
+2. target rows of those users that the source no longer has are deleted
+   (children first; ON DELETE CASCADE still applies)
+3. staged rows are upserted by id (parents first) with triggers on, so the
+   trigger-maintained state on the target (earmark_reverse_index,
+   earmark_history, promoted custom_data columns, trigger-maintained profile
+   totals) follows the change
+4. updated_at is then copied back from the stage with triggers off, so it
+   arrives exactly as in the source; profile totals the target maintains
+   with triggers are reconciled for the batch's users first, since the
+   copied totals and the trigger deltas would otherwise both apply
+
+An id that belongs to a different user on the target is never overwritten;
+such rows are reported as collisions. Users missing from the source are left
+alone unless --delete-missing is given. Batches run in parallel, each on its
+own pair of connections.
+
+Usage:
+    python sync_users.py --target postgresql://...render --users 12,57,301
+    python sync_users.py --target postgresql://...render --from-compare --jobs 4
+    python sync_users.py --source postgresql://...render --target postgresql://...local --users 12
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import JobLockBusy, get_db_config, job_lock
+from run_migrations import parse_database_url
+from compare_databases import DIGEST_TABLES, compare, table_columns
+from reconcile_profile_totals import correct_users, triggers_installed
+
+SYNC_TABLES = list(DIGEST_TABLES)
+
+def generated_columns(conn, table):
+    """Columns the target computes itself and COPY/INSERT must not write"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT attname FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated <> ''
+        """, (f'"{table}"',))
+        columns = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return columns
+
+def plan_columns(source, target):
+    """{table: [columns to copy]} for tables present on both sides"""
+    plan = {}
+    for table in SYNC_TABLES:
+        source_columns = table_columns(source, table)
+        target_columns = table_columns(target, table)
+        if source_columns is None or target_columns is None:
+            print(f"⚠️  {table}: missing on {'source' if source_columns is None else 'target'}, skipped")
+            continue
+        skipped = target_columns - source_columns
+        if skipped:
+            print(f"⚠️  {table}: target-only columns keep their defaults: {', '.join(sorted(skipped))}")
+        plan[table] = sorted((source_columns & target_columns) - generated_columns(target, table))
+    return plan
+
+def stream_table(source, target_cur, table, columns, user_ids):
+    """COPY one table's rows for user_ids from source into stage_<table>"""
+    user_column = DIGEST_TABLES[table]
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    ids = ",".join(str(int(user_id)) for user_id in user_ids)
+    copy_out = (f'COPY (SELECT {column_list} FROM "{table}" '
+                f'WHERE "{user_column}" = ANY(ARRAY[{ids}]::int[])) TO STDOUT')
+    copy_in = f'COPY stage_{table} ({column_list}) FROM STDIN'
+
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, 'wb') as writer, source.cursor() as cur:
+                cur.copy_expert(copy_out, writer)
+        except Exception as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        with os.fdopen(read_fd, 'rb') as reader:
+            target_cur.copy_expert(copy_in, reader)
+    finally:
+        producer.join()
+    if errors:
+        # A failed producer closes the pipe early; never merge a truncated stage
+        raise errors[0]
+
+def sync_batch(source_config, target_config, plan, user_ids, delete_missing):
+    """Stage and merge one batch of users; returns a stats dict"""
+    stats = {'users': user_ids, 'upserted': 0, 'deleted': 0, 'collisions': 0, 'missing': []}
+    source = psycopg2.connect(**source_config)
+    target = psycopg2.connect(**target_config)
+    try:
+        # One snapshot for every table of the batch
+        source.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with source.cursor() as cur:
+            cur.execute('SELECT id FROM "user" WHERE id = ANY(%s)', (user_ids,))
+            present = {row[0] for row in cur.fetchall()}
+        stats['missing'] = sorted(set(user_ids) - present)
+        synced = user_ids if delete_missing else sorted(present)
+
+        with target.cursor() as cur:
+            for table, columns in plan.items():
+                column_list = ", ".join(f'"{column}"' for column in columns)
+                cur.execute(f'CREATE TEMP TABLE stage_{table} ON COMMIT DROP AS '
+                            f'SELECT {column_list} FROM "{table}" WITH NO DATA')
+                stream_table(source, cur, table, columns, synced)
+            source.commit()
+
+            # Rows the source no longer has, children before parents
+            for table in reversed(list(plan)):
+                user_column = DIGEST_TABLES[table]
+                cur.execute(f"""
+                    DELETE FROM "{table}" t
+                    WHERE t."{user_column}" = ANY(%s)
+                      AND NOT EXISTS (SELECT 1 FROM stage_{table} s WHERE s.id = t.id)
+                """, (synced,))
+                stats['deleted'] += cur.rowcount
+
+            for table, columns in plan.items():
+                user_column = DIGEST_TABLES[table]
+                column_list = ", ".join(f'"{column}"' for column in columns)
+                updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in columns if column != 'id')
+                cur.execute(f"""
+                    SELECT COUNT(*) FROM stage_{table} s
+                    JOIN "{table}" t ON t.id = s.id AND t."{user_column}" IS DISTINCT FROM s."{user_column}"
+                """)
+                stats['collisions'] += cur.fetchone()[0]
+                cur.execute(f"""
+                    INSERT INTO "{table}" AS t ({column_list})
+                    SELECT {column_list} FROM stage_{table}
+                    ON CONFLICT (id) DO UPDATE SET {updates}
+                    WHERE t."{user_column}" = EXCLUDED."{user_column}"
+                      AND ROW({', '.join(f't."{c}"' for c in columns)})::text
+                          IS DISTINCT FROM ROW({', '.join(f'EXCLUDED."{c}"' for c in columns)})::text
+                """)
+                stats['upserted'] += cur.rowcount
+
+            if 'financial_profile' in plan and triggers_installed(cur):
+                correct_users(cur, synced)
+
+            cur.execute("SAVEPOINT replica_role")
+            try:
+                cur.execute("SET LOCAL session_replication_role = replica")
+            except psycopg2.Error:
+                cur.execute("ROLLBACK TO SAVEPOINT replica_role")
+                print("   ⚠️  Not allowed to skip triggers - updated_at will be bumped on the target")
+            else:
+                for table, columns in plan.items():
+                    if 'updated_at' not in columns:
+                        continue
+                    user_column = DIGEST_TABLES[table]
+                    cur.execute(f"""
+                        UPDATE "{table}" t SET updated_at = s.updated_at
+                        FROM stage_{table} s
+                        WHERE t.id = s.id AND t."{user_column}" = s."{user_column}"
+                          AND t.updated_at IS DISTINCT FROM s.updated_at
+                    """)
+                cur.execute("SET LOCAL session_replication_role = origin")
+        target.commit()
+    except Exception:
+        target.rollback()
+        raise
+    finally:
+        source.close()
+        target.close()
+    return stats
+
+def advance_sequences(target_config, plan):
+    """Move id sequences past explicitly copied ids"""
+    conn = psycopg2.connect(**target_config)
+    try:
+        with conn.cursor() as cur:
+            for table in plan:
+                cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (f'"{table}"',))
+                sequence = cur.fetchone()[0]
+                if not sequence:
+                    continue
+                cur.execute(f"""
+                    SELECT setval(%s, GREATEST((SELECT COALESCE(MAX(id), 1) FROM "{table}"),
+                                               (SELECT last_value FROM {sequence})))
+                """, (sequence,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def sync_users(source_config, target_config, user_ids, batch_size, jobs, delete_missing):
+    """Run the batches in parallel and print a summary"""
+    source = psycopg2.connect(**source_config)
+    target = psycopg2.connect(**target_config)
+    try:
+        plan = plan_columns(source, target)
+    finally:
+        source.close()
+        target.close()
+
+    batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+    print(f"\n🔄 Syncing {len(user_ids)} users in {len(batches)} batches on {jobs} workers...")
+    started = time.perf_counter()
+    totals = {'upserted': 0, 'deleted': 0, 'collisions': 0}
+    missing = []
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {pool.submit(sync_batch, source_config, target_config, plan, batch, delete_missing): batch
+                   for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                failed.append(batch)
+                print(f"   ❌ users {batch[0]}..{batch[-1]}: {e}")
+                continue
+            for key in totals:
+                totals[key] += stats[key]
+            missing.extend(stats['missing'])
+            print(f"   📦 users {batch[0]}..{batch[-1]}: {stats['upserted']} upserted, "
+                  f"{stats['deleted']} deleted, {stats['collisions']} id collisions")
+
+    advance_sequences(target_config, plan)
+
+    print(f"\n📊 Sync summary ({time.perf_counter() - started:.1f}s)")
+    print("=" * 60)
+    print(f"   Rows upserted:        {totals['upserted']}")
+    print(f"   Rows deleted:         {totals['deleted']}")
+    print(f"   Id collisions:        {totals['collisions']} (left untouched)")
+    if missing:
+        action = "deleted from target" if delete_missing else "not in source, left alone"
+        print(f"   Users {action}: {', '.join(map(str, sorted(missing)))}")
+    if failed:
+        print(f"   ❌ Failed batches:     {len(failed)} ({sum(len(b) for b in failed)} users)")
+    return not failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync selected users' rows between databases")
+    parser.add_argument('--source', help="source DATABASE_URL (default: DB_* environment variables)")
+    parser.add_argument('--target', required=True, help="target DATABASE_URL")
+    parser.add_argument('--users', help="comma-separated user ids")
+    parser.add_argument('--from-compare', action='store_true',
+                        help="sync the users compare_databases.py reports as divergent")
+    parser.add_argument('--batch-size', type=int, default=50, help="users per transaction")
+    parser.add_argument('--jobs', type=int, default=4, help="batches synced in parallel")
+    parser.add_argument('--delete-missing', action='store_true',
+                        help="delete target users that no longer exist in the source")
+    parser.add_argument('--wait', action='store_true', help="wait for conflicting jobs instead of skipping")
+    args = parser.parse_args()
+
+    print("🔁 User sync")
+    print("=" * 60)
+
+    load_dotenv()
+    source_config = parse_database_url(args.source) if args.source else get_db_config()
+    target_config = parse_database_url(args.target)
+    print(f"   source: {source_config['host']}/{source_config['database']}")
+    print(f"   target: {target_config['host']}/{target_config['database']}")
+
+    user_ids = set()
+    if args.users:
+        user_ids.update(int(user_id) for user_id in args.users.split(',') if user_id.strip())
+    if args.from_compare:
+        source = psycopg2.connect(**source_config)
+        target = psycopg2.connect(**target_config)
+        try:
+            user_ids.update(compare(source, target, 256, 16))
+        finally:
+            source.close()
+            target.close()
+    if not user_ids:
+        print("✅ Nothing to sync")
+        return
+
+    try:
+        # The lock lives on the target: that is the database being rewritten
+        with job_lock(target_config, 'sync_users', tables=SYNC_TABLES, wait=args.wait):
+            ok = sync_users(source_config, target_config, sorted(user_ids),
+                            args.batch_size, args.jobs, args.delete_missing)
+    except JobLockBusy as e:
+        print(f"⏭️  Skipping: {e}")
+        raise SystemExit(1)
+
+    if not ok:
+        raise SystemExit(1)
+    print("\n🎉 Done!")
+
+if __name__ == "__main__":
+    main()
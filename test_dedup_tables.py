@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Dry-run check of the dedup_tables.py natural keys against API-shaped rows
+
+Inserts loans and expenses the way backend/routes/financial.js does (lender,
+type, principal_outstanding, category, subcategory, ... - no legacy
+name/amount/expense_type), ranks duplicates with the real keys and rolls
+everything back. Distinct rows must not be grouped; a double-submitted row
+must be.
+"""
+
+import psycopg2
+import os
+from dotenv import load_dotenv
+from dedup_engine import rank_duplicates
+from dedup_tables import DEDUP_TABLES
+
+def get_db_connection():
+    """Get database connection from environment variables"""
+    try:
+        conn = psycopg2.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', '5432'),
+            database=os.getenv('DB_NAME', 'life_sheet'),
+            user=os.getenv('DB_USER', 'postgres'),
+            password=os.getenv('DB_PASSWORD', 'admin')
+        )
+        return conn
+    except Exception as e:
+        print(f"❌ Database connection failed: {e}")
+        return None
+
+def insert_rows(cursor, table, rows):
+    """Insert API-shaped rows and return their ids"""
+    ids = []
+    for row in rows:
+        columns = list(row)
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) RETURNING id",
+            [row[column] for column in columns]
+        )
+        ids.append(cursor.fetchone()[0])
+    return ids
+
+def check_table(cursor, table, distinct_rows):
+    """Distinct rows stay ungrouped; a copy of the first one is ranked as its duplicate"""
+    distinct_ids = insert_rows(cursor, table, distinct_rows)
+    copy_id = insert_rows(cursor, table, distinct_rows[:1])[0]
+
+    spec = DEDUP_TABLES[table]
+    losers = dict(rank_duplicates(cursor, table, spec['key'], spec['keep']))
+    ours = [(row_id, losers[row_id]) for row_id in distinct_ids + [copy_id] if row_id in losers]
+    if len(ours) != 1 or set(ours[0]) != {distinct_ids[0], copy_id}:
+        print(f"❌ {table}: expected only {distinct_ids[0]}/{copy_id} to be grouped, got {ours}")
+        return False
+    print(f"✅ {table}: {len(distinct_ids)} distinct rows kept apart, the copy is grouped")
+    return True
+
+def test_dedup_keys():
+    """Run the key checks in one transaction that is always rolled back"""
+    print("🧪 Testing dedup keys with API-shaped rows (dry run)")
+    print("=" * 50)
+
+    load_dotenv()
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT user_id, id FROM financial_profile ORDER BY id LIMIT 1')
+        profile = cursor.fetchone()
+        if not profile:
+            print("❌ No financial profile found - cannot test")
+            return False
+        user_id, profile_id = profile
+        owner = {'user_id': user_id, 'profile_id': profile_id}
+
+        # Same EMI and start date, different lender / type / principal / rate
+        loans = [
+            {**owner, 'lender': 'HDFC', 'type': 'Home', 'principal_outstanding': 2500000, 'rate': 8.5,
+             'emi': 25000, 'start_date': '2024-01-01', 'end_date': '2044-01-01'},
+            {**owner, 'lender': 'SBI', 'type': 'Home', 'principal_outstanding': 2500000, 'rate': 8.5,
+             'emi': 25000, 'start_date': '2024-01-01', 'end_date': '2044-01-01'},
+            {**owner, 'lender': 'HDFC', 'type': 'Car', 'principal_outstanding': 900000, 'rate': 9.1,
+             'emi': 25000, 'start_date': '2024-01-01', 'end_date': '2028-01-01'},
+        ]
+        # Same category and amount, different subcategory / notes
+        expenses = [
+            {**owner, 'description': 'Housing', 'category': 'Housing', 'subcategory': 'Rent',
+             'frequency': 'Monthly', 'amount': 5000},
+            {**owner, 'description': 'Housing', 'category': 'Housing', 'subcategory': 'Maintenance',
+             'frequency': 'Monthly', 'amount': 5000},
+            {**owner, 'description': 'Housing', 'category': 'Housing', 'subcategory': 'Rent',
+             'frequency': 'Monthly', 'amount': 5000, 'notes': 'Second flat'},
+        ]
+
+        passed = check_table(cursor, 'financial_loan', loans)
+        passed = check_table(cursor, 'financial_expense', expenses) and passed
+        print("\n🎉 ALL TESTS PASSED!" if passed else "\n❌ Dedup key test failed")
+        return passed
+
+    except Exception as e:
+        print(f"❌ Test failed: {e}")
+        return False
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    test_dedup_keys()
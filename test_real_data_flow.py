@@ -212,7 +212,7 @@ def test_with_existing_data():
                 a.id as asset_id,
                 a.name as asset_name,
                 a.current_value,
-                (fg.custom_data->'linkedAssets'->0->>'percent')::numeric as percent
+                (linked_asset->>'percent')::numeric as percent
             FROM financial_goal fg
             CROSS JOIN LATERAL jsonb_array_elements(fg.custom_data->'linkedAssets') AS linked_asset
             JOIN assets a ON a.id = (linked_asset->>'assetId')::integer
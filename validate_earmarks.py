@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Nightly earmark consistency audit across all users
+
+Server-side port of validateEarmarkingData (src/lib/goalCalculations.js),
+plus the cross-side check the frontend never makes:
+
+- over_allocated:  an asset's goalEarmarks percents add up to more than 100
+- dangling_goal:   a goalEarmarks entry whose goalId is not one of the user's goals
+- dangling_asset:  a linkedAssets entry whose assetId is not one of the user's assets
+- mismatch:        a link present on only one side, or with different percents
+- unparseable_id:  an entry whose goalId/assetId is not an integer; the link
+                   checks cannot see it, and purge_orphan_earmarks.py removes it
+
+Each user_id range is checked in a separate worker process with two set-based
+queries (the link extraction is shared with migrate_asset_goal_links.py).
+Nothing is written. The exit status is 1 when violations are found, so a cron
+job can alert on it.
+
+Usage:
+    python validate_earmarks.py
+    python validate_earmarks.py --jobs 8 --chunk-size 5000 --samples 10
+    python validate_earmarks.py --json earmark_violations.json
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+import psycopg2
+from dotenv import load_dotenv
+from job_locks import get_db_config
+from migrate_asset_goal_links import CANDIDATES_SQL, ID_PATTERN, PERCENT_PATTERN
+
+CHECKS = ['over_allocated', 'dangling_goal', 'dangling_asset', 'mismatch', 'unparseable_id']
+
+# Same arithmetic as the frontend: every entry counts, parseFloat(x) || 0
+OVER_ALLOCATED_SQL = """
+SELECT a.user_id, a.id, a.name,
+       SUM(CASE WHEN e.item->>'percent' ~ %(percent_pattern)s
+                THEN (e.item->>'percent')::numeric ELSE 0 END) AS total
+FROM assets a
+CROSS JOIN LATERAL jsonb_array_elements(a.custom_data->'goalEarmarks') AS e(item)
+WHERE a.user_id >= %(start)s AND a.user_id < %(end)s
+  AND jsonb_typeof(a.custom_data->'goalEarmarks') = 'array'
+GROUP BY a.user_id, a.id, a.name
+HAVING SUM(CASE WHEN e.item->>'percent' ~ %(percent_pattern)s
+                THEN (e.item->>'percent')::numeric ELSE 0 END) > 100
+"""
+
+# Entries CANDIDATES_SQL skips: the id field is missing or not an integer
+UNPARSEABLE_ID_SQL = """
+SELECT 'assets', a.user_id, a.id, 'goalEarmarks', e.item->'goalId'
+FROM assets a
+CROSS JOIN LATERAL jsonb_array_elements(a.custom_data->'goalEarmarks') AS e(item)
+WHERE a.user_id >= %(start)s AND a.user_id < %(end)s
+  AND jsonb_typeof(a.custom_data->'goalEarmarks') = 'array'
+  AND (e.item->>'goalId' IS NULL OR e.item->>'goalId' !~ %(id_pattern)s)
+UNION ALL
+SELECT 'financial_goal', g.user_id, g.id, 'linkedAssets', e.item->'assetId'
+FROM financial_goal g
+CROSS JOIN LATERAL jsonb_array_elements(g.custom_data->'linkedAssets') AS e(item)
+WHERE g.user_id >= %(start)s AND g.user_id < %(end)s
+  AND jsonb_typeof(g.custom_data->'linkedAssets') = 'array'
+  AND (e.item->>'assetId' IS NULL OR e.item->>'assetId' !~ %(id_pattern)s)
+"""
+
+# Runs against the link_candidates temp table built by CANDIDATES_SQL
+LINK_VIOLATIONS_SQL = """
+SELECT CASE
+           WHEN asset_percent IS NOT NULL AND goal_user_id IS DISTINCT FROM asset_user_id THEN 'dangling_goal'
+           WHEN goal_percent IS NOT NULL AND asset_user_id IS DISTINCT FROM goal_user_id THEN 'dangling_asset'
+           ELSE 'mismatch'
+       END AS check_name,
+       COALESCE(asset_user_id, goal_user_id) AS user_id,
+       asset_id, goal_id, asset_percent, goal_percent
+FROM link_candidates
+WHERE asset_user_id IS DISTINCT FROM goal_user_id
+   OR asset_percent IS NULL
+   OR goal_percent IS NULL
+   OR asset_percent <> goal_percent
+"""
+
+def validate_range(db_config, start, end):
+    """Check one user_id range; returns a list of violation dicts"""
+    violations = []
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn.cursor() as cur:
+            params = {'start': start, 'end': end,
+                      'id_pattern': ID_PATTERN, 'percent_pattern': PERCENT_PATTERN}
+            cur.execute(OVER_ALLOCATED_SQL, params)
+            for user_id, asset_id, name, total in cur.fetchall():
+                violations.append({
+                    'check': 'over_allocated', 'user_id': user_id, 'asset_id': asset_id,
+                    'detail': f"asset \"{name}\" has {float(total):.1f}% earmarked",
+                })
+
+            cur.execute(UNPARSEABLE_ID_SQL, params)
+            for table, user_id, row_id, key, raw in cur.fetchall():
+                owner = 'asset' if table == 'assets' else 'goal'
+                violations.append({
+                    'check': 'unparseable_id', 'user_id': user_id, f'{owner}_id': row_id,
+                    'detail': f"{owner} {row_id} has a {key} entry with id {json.dumps(raw)}",
+                })
+
+            cur.execute(CANDIDATES_SQL, params)
+            cur.execute(LINK_VIOLATIONS_SQL)
+            for check, user_id, asset_id, goal_id, asset_percent, goal_percent in cur.fetchall():
+                if check == 'dangling_goal':
+                    detail = f"asset {asset_id} references missing goal {goal_id}"
+                elif check == 'dangling_asset':
+                    detail = f"goal {goal_id} references missing asset {asset_id}"
+                elif goal_percent is None:
+                    detail = f"asset {asset_id} -> goal {goal_id} missing from linkedAssets"
+                elif asset_percent is None:
+                    detail = f"goal {goal_id} -> asset {asset_id} missing from goalEarmarks"
+                else:
+                    detail = (f"asset {asset_id} -> goal {goal_id}: "
+                              f"{float(asset_percent):g}% vs {float(goal_percent):g}%")
+                violations.append({
+                    'check': check, 'user_id': user_id, 'asset_id': asset_id,
+                    'goal_id': goal_id, 'detail': detail,
+                })
+        conn.rollback()
+    finally:
+        conn.close()
+    return violations
+
+def user_ranges(db_config, chunk_size):
+    """Half-open user_id ranges covering every user"""
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM "user"')
+            min_user, max_user = cur.fetchone()
+    finally:
+        conn.close()
+    return [(start, min(start + chunk_size, max_user + 1))
+            for start in range(min_user, max_user + 1, chunk_size)]
+
+def print_report(violations, samples, elapsed, users_checked):
+    """Compact per-check summary with a few examples each"""
+    print(f"\n📊 Earmark audit ({elapsed:.1f}s, user ids {users_checked})")
+    print("=" * 60)
+    for check in CHECKS:
+        found = [v for v in violations if v['check'] == check]
+        users = len({v['user_id'] for v in found})
+        icon = '✅' if not found else '❌'
+        print(f"{icon} {check:<15} {len(found):>7} violations, {users:>6} users")
+        for violation in found[:samples]:
+            print(f"      user {violation['user_id']}: {violation['detail']}")
+        if len(found) > samples:
+            print(f"      ... {len(found) - samples} more")
+    print("=" * 60)
+    affected = len({v['user_id'] for v in violations})
+    print(f"   {len(violations)} violations across {affected} users")
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit earmark consistency for every user")
+    parser.add_argument('--jobs', type=int, default=4, help="parallel worker processes")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="user ids per worker task")
+    parser.add_argument('--samples', type=int, default=5, help="examples printed per check")
+    parser.add_argument('--json', help="write every violation to this JSON file")
+    args = parser.parse_args()
+
+    print("🔍 Validating earmarks")
+    print("=" * 60)
+
+    load_dotenv()
+    db_config = get_db_config()
+    started = time.perf_counter()
+    ranges = user_ranges(db_config, args.chunk_size)
+    print(f"📦 {len(ranges)} user ranges on {args.jobs} workers")
+
+    violations = []
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(validate_range, db_config, start, end) for start, end in ranges]
+        for future in futures:
+            violations.extend(future.result())
+
+    violations.sort(key=lambda v: (CHECKS.index(v['check']), v['user_id'], v.get('asset_id') or 0))
+    users_checked = f"{ranges[0][0]}..{ranges[-1][1] - 1}" if ranges else "none"
+    print_report(violations, args.samples, time.perf_counter() - started, users_checked)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(violations, f, indent=2)
+        print(f"💾 Wrote {len(violations)} violations to {args.json}")
+
+    if violations:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()